@@ -0,0 +1,320 @@
+"""
+Control de admisión para las llamadas al LLM
+Limita las llamadas concurrentes a OpenAI por proceso con una cola de espera
+acotada y un plazo máximo de espera. Cuando la cola está llena o el plazo
+vence, la petición se rechaza de inmediato con una estimación de Retry-After
+en lugar de acumularse dentro de gunicorn.
+
+Los turnos libres se reparten de forma justa y ponderada entre cursos
+(start-time fair queuing) y, dentro de cada curso, en ronda entre usuarios,
+de modo que un curso con mucho tráfico no deja sin servicio a los demás.
+
+El course_id lo envía el cliente, así que los cursos sin configuración propia
+(peso o límite) no se conservan para siempre: se guardan como máximo
+max_tenants y se descartan primero los inactivos usados hace más tiempo. En
+las estadísticas por curso esos cursos se suman bajo OTHER_TENANT, de modo que
+las etiquetas de las métricas son solo los cursos configurados.
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+DEFAULT_TENANT = 'default'
+OTHER_TENANT = '_other'  # suma de los cursos sin configuración propia
+
+
+class AdmissionRejected(Exception):
+    """La petición no fue admitida (cola llena o plazo de espera vencido)"""
+
+    def __init__(self, reason: str, retry_after: float, tenant: str = DEFAULT_TENANT):
+        super().__init__(f'Servicio saturado ({reason})')
+        self.reason = reason
+        self.retry_after = retry_after
+        self.tenant = tenant
+
+
+class _Waiter:
+    __slots__ = ('event', 'user', 'granted')
+
+    def __init__(self, user: str):
+        self.event = threading.Event()
+        self.user = user
+        self.granted = False
+
+
+class _Tenant:
+    def __init__(self, name: str, weight: float, max_concurrent: int):
+        self.name = name
+        self.weight = weight
+        self.max_concurrent = max_concurrent
+        self.active = 0
+        self.queued = 0
+        self.users = OrderedDict()  # usuario -> deque de _Waiter (orden de ronda)
+        self.tag = 0.0              # etiqueta virtual de la cola justa
+        self.stats = {'admitted': 0, 'queued': 0, 'shed_queue_full': 0, 'shed_timeout': 0, 'wait_seconds': 0.0}
+
+    def can_run(self) -> bool:
+        return self.max_concurrent <= 0 or self.active < self.max_concurrent
+
+    def idle(self) -> bool:
+        return not self.active and not self.queued
+
+
+class AdmissionTicket:
+    """Turno concedido; se devuelve con AdmissionController.release()"""
+    __slots__ = ('tenant', 'waited')
+
+    def __init__(self, tenant: Optional[_Tenant], waited: float):
+        self.tenant = tenant
+        self.waited = waited
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent: int = 8, max_queue: int = 16, queue_timeout: float = 5.0,
+                 tenant_weights: Optional[Dict[str, float]] = None,
+                 tenant_max_concurrent: Optional[Dict[str, int]] = None,
+                 default_tenant_max_concurrent: int = 0, tenant_max_queue: int = 0,
+                 max_tenants: int = 256):
+        """
+        Inicializar control de admisión
+
+        Args:
+            max_concurrent: Llamadas simultáneas permitidas (0 = sin límite)
+            max_queue: Peticiones que pueden esperar un turno en total
+            queue_timeout: Segundos máximos de espera en la cola
+            tenant_weights: Peso por curso en el reparto de turnos (por defecto 1)
+            tenant_max_concurrent: Límite de llamadas simultáneas por curso
+            default_tenant_max_concurrent: Límite para cursos sin valor propio (0 = sin límite)
+            tenant_max_queue: Puestos de cola máximos por curso (0 = sin límite propio)
+            max_tenants: Cursos sin configuración propia que se conservan a la vez
+        """
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.tenant_weights = dict(tenant_weights or {})
+        self.tenant_max_concurrent = dict(tenant_max_concurrent or {})
+        self.default_tenant_max_concurrent = default_tenant_max_concurrent
+        self.tenant_max_queue = tenant_max_queue
+        self.max_tenants = max_tenants
+        self.configured_tenants = set(self.tenant_weights) | set(self.tenant_max_concurrent) | {DEFAULT_TENANT}
+        self.active = 0
+        self.queued = 0
+        self._tenants: "OrderedDict[str, _Tenant]" = OrderedDict()  # orden de último uso
+        self._unconfigured = 0
+        # Contadores de los cursos sin configuración ya descartados
+        self._evicted_stats = _Tenant(OTHER_TENANT, 1.0, 0).stats
+        self._virtual_time = 0.0
+        self._lock = threading.Lock()
+        # Duración media de una llamada admitida (EWMA) para estimar Retry-After
+        self._service_time = 1.0
+        self.stats = {
+            'admitted': 0,
+            'queued': 0,
+            'shed_queue_full': 0,
+            'shed_timeout': 0
+        }
+
+    @property
+    def queue_depth(self) -> int:
+        return self.queued
+
+    def _tenant(self, name: str) -> _Tenant:
+        tenant = self._tenants.get(name)
+        if tenant is not None:
+            self._tenants.move_to_end(name)
+            return tenant
+        tenant = self._tenants[name] = _Tenant(
+            name,
+            max(0.01, float(self.tenant_weights.get(name, 1.0))),
+            int(self.tenant_max_concurrent.get(name, self.default_tenant_max_concurrent))
+        )
+        if name not in self.configured_tenants:
+            self._unconfigured += 1
+            if self._unconfigured > self.max_tenants:
+                self._evict_idle(keep=name)
+        return tenant
+
+    def metric_label(self, name: Optional[str]) -> str:
+        """Etiqueta `course` para las métricas: el curso si está configurado, si no OTHER_TENANT"""
+        name = str(name or DEFAULT_TENANT)
+        return name if name in self.configured_tenants else OTHER_TENANT
+
+    def _evict_idle(self, keep: str):
+        """Descartar los cursos sin configuración inactivos usados hace más tiempo (con el lock)"""
+        # Los cursos con turnos o cola están acotados por max_concurrent + max_queue
+        for name in [name for name, tenant in self._tenants.items()
+                     if name not in self.configured_tenants and name != keep and tenant.idle()]:
+            if self._unconfigured <= self.max_tenants:
+                return
+            for key, value in self._tenants.pop(name).stats.items():
+                self._evicted_stats[key] += value
+            self._unconfigured -= 1
+
+    def _retry_after(self, tenant: _Tenant) -> float:
+        """Tiempo estimado hasta que se libere la cola del curso"""
+        slots = max(1, self.max_concurrent)
+        if tenant.max_concurrent > 0:
+            slots = min(slots, tenant.max_concurrent)
+        return max(1.0, self._service_time * (tenant.queued + 1) / slots)
+
+    def _dispatch(self):
+        """Ceder turnos libres al curso con menor etiqueta virtual (debe llamarse con el lock)"""
+        while self.max_concurrent <= 0 or self.active < self.max_concurrent:
+            candidates = [t for t in self._tenants.values() if t.queued and t.can_run()]
+            if not candidates:
+                return
+            tenant = min(candidates, key=lambda t: t.tag)
+            self._virtual_time = tenant.tag
+            tenant.tag += 1.0 / tenant.weight
+
+            # Ronda entre usuarios del curso
+            user, waiters = next(iter(tenant.users.items()))
+            waiter = waiters.popleft()
+            if waiters:
+                tenant.users.move_to_end(user)
+            else:
+                del tenant.users[user]
+
+            tenant.queued -= 1
+            self.queued -= 1
+            tenant.active += 1
+            self.active += 1
+            waiter.granted = True
+            waiter.event.set()
+
+    def acquire(self, course_id: Optional[str] = None, user_id: Optional[str] = None) -> AdmissionTicket:
+        """
+        Obtener un turno, esperando en la cola si es necesario
+
+        Args:
+            course_id: Curso que origina la llamada (inquilino de la cola justa)
+            user_id: Usuario dentro del curso
+
+        Returns:
+            AdmissionTicket con los segundos de espera en la cola
+
+        Raises:
+            AdmissionRejected: Si la cola está llena o se venció queue_timeout
+        """
+        if self.max_concurrent <= 0:
+            return AdmissionTicket(None, 0.0)
+
+        with self._lock:
+            tenant = self._tenant(str(course_id or DEFAULT_TENANT))
+            if self.active < self.max_concurrent and tenant.can_run() and not tenant.queued:
+                tenant.active += 1
+                self.active += 1
+                tenant.stats['admitted'] += 1
+                self.stats['admitted'] += 1
+                return AdmissionTicket(tenant, 0.0)
+
+            if self.queued >= self.max_queue or (self.tenant_max_queue and tenant.queued >= self.tenant_max_queue):
+                tenant.stats['shed_queue_full'] += 1
+                self.stats['shed_queue_full'] += 1
+                raise AdmissionRejected('queue_full', self._retry_after(tenant), tenant.name)
+
+            if not tenant.queued:
+                # Un curso que vuelve a tener cola no acumula crédito del tiempo inactivo
+                tenant.tag = max(tenant.tag, self._virtual_time)
+            waiter = _Waiter(str(user_id or ''))
+            tenant.users.setdefault(waiter.user, deque()).append(waiter)
+            tenant.queued += 1
+            self.queued += 1
+            tenant.stats['queued'] += 1
+            self.stats['queued'] += 1
+            self._dispatch()
+
+        start = time.monotonic()
+        waiter.event.wait(self.queue_timeout)
+        waited = time.monotonic() - start
+        with self._lock:
+            # _dispatch() pudo ceder el turno justo al vencer el plazo
+            if not waiter.granted:
+                waiters = tenant.users[waiter.user]
+                waiters.remove(waiter)
+                if not waiters:
+                    del tenant.users[waiter.user]
+                tenant.queued -= 1
+                self.queued -= 1
+                tenant.stats['shed_timeout'] += 1
+                self.stats['shed_timeout'] += 1
+                raise AdmissionRejected('queue_timeout', self._retry_after(tenant), tenant.name)
+            tenant.stats['admitted'] += 1
+            tenant.stats['wait_seconds'] += waited
+            self.stats['admitted'] += 1
+        return AdmissionTicket(tenant, waited)
+
+    def release(self, ticket: AdmissionTicket, held: float = None):
+        """
+        Liberar un turno y cederlo según la cola justa
+
+        Args:
+            ticket: Turno devuelto por acquire()
+            held: Segundos que se ocupó el turno (para estimar Retry-After)
+        """
+        if ticket.tenant is None:
+            return
+        with self._lock:
+            if held is not None:
+                self._service_time = 0.8 * self._service_time + 0.2 * held
+            ticket.tenant.active -= 1
+            self.active -= 1
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, course_id: Optional[str] = None, user_id: Optional[str] = None):
+        """Ocupar un turno mientras dura el bloque; entrega el AdmissionTicket"""
+        ticket = self.acquire(course_id, user_id)
+        start = time.monotonic()
+        try:
+            yield ticket
+        finally:
+            self.release(ticket, time.monotonic() - start)
+
+    def get_tenants(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Estado de cada curso configurado: peso, límite, turnos activos, cola y contadores
+
+        Los cursos sin configuración propia se suman bajo OTHER_TENANT.
+        """
+        with self._lock:
+            tenants = {}
+            other = {'weight': 1.0, 'max_concurrent': self.default_tenant_max_concurrent, 'active': 0,
+                     'queue_depth': 0, 'waiting_users': 0, 'tenants': self._unconfigured,
+                     'stats': dict(self._evicted_stats)}
+            for name, tenant in self._tenants.items():
+                if name not in self.configured_tenants:
+                    other['active'] += tenant.active
+                    other['queue_depth'] += tenant.queued
+                    other['waiting_users'] += len(tenant.users)
+                    for key, value in tenant.stats.items():
+                        other['stats'][key] += value
+                    continue
+                tenants[name] = {
+                    'weight': tenant.weight,
+                    'max_concurrent': tenant.max_concurrent,
+                    'active': tenant.active,
+                    'queue_depth': tenant.queued,
+                    'waiting_users': len(tenant.users),
+                    'stats': dict(tenant.stats)
+                }
+            if self._unconfigured or any(self._evicted_stats.values()):
+                tenants[OTHER_TENANT] = other
+            return tenants
+
+    def get_status(self) -> Dict[str, Any]:
+        tenants = self.get_tenants()
+        with self._lock:
+            return {
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'queue_timeout': self.queue_timeout,
+                'active': self.active,
+                'queue_depth': self.queued,
+                'avg_service_time': round(self._service_time, 3),
+                'stats': dict(self.stats),
+                'tenants': tenants
+            }
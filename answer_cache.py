@@ -0,0 +1,76 @@
+"""
+Caché de respuestas del chatbot PAC
+LRU con expiración (TTL) para preguntas sin historial de conversación
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+def normalize_question(question: str) -> str:
+    """Normalizar una pregunta para usarla como clave de caché"""
+    question = question.lower().strip()
+    question = re.sub(r'[¿?¡!.,;:]+', ' ', question)
+    return re.sub(r'\s+', ' ', question).strip()
+
+
+class AnswerCache:
+    def __init__(self, max_size: int = 256, ttl: int = 3600):
+        """
+        Inicializar caché de respuestas
+
+        Args:
+            max_size: Número máximo de respuestas almacenadas
+            ttl: Segundos de validez de cada respuesta
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, question: str, namespace: str = '') -> Optional[str]:
+        """
+        Obtener respuesta almacenada para una pregunta, si sigue vigente
+
+        Args:
+            question: Pregunta del usuario
+            namespace: Separador de claves (p. ej. la versión del prompt)
+        """
+        key = (namespace, normalize_question(question))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[1] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, question: str, answer: str, namespace: str = ''):
+        """Almacenar respuesta para una pregunta"""
+        if self.max_size <= 0:
+            return
+        key = (namespace, normalize_question(question))
+        with self._lock:
+            self._entries[key] = (answer, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_statistics(self):
+        return {
+            'entries': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses
+        }
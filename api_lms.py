@@ -6,27 +6,100 @@ SISTEMA DE CHUNKS: Integrado búsqueda semántica para respuestas precisas
 FORZANDO REDESPLIEGUE: Sistema de chunks implementado
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, g
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 import openai
 import os
 from datetime import datetime
+import functools
+import hashlib
 import json
+import logging
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from semantic_search import SemanticSearch
+from semantic_search import SemanticSearch, is_follow_up
+from config_api import get_api_config
+from llm_client import ResilientLLMClient, LLMUnavailableError
+from answer_cache import AnswerCache
+from admission import AdmissionController, AdmissionRejected
+import request_timing
+from metrics import registry as metrics
+from logging_config import setup_logging, set_request_id, get_request_id
+from profiling import RequestProfiler
+from prompt_registry import registry as prompt_registry
+from tokenizer import count_tokens, count_tokens_many, get_encoding
+from rate_limiter import TokenBucketLimiter
+from chat_jobs import ChatJobManager, JobStore, JobQueueFull, check_callback_url
 
 # Cargar variables de entorno
 load_dotenv()
+config = get_api_config()
+
+# Logging estructurado con escritura en segundo plano
+setup_logging(
+    level=config.LOG_LEVEL,
+    log_file=config.LOG_FILE,
+    max_bytes=config.LOG_MAX_BYTES,
+    backup_count=config.LOG_BACKUP_COUNT,
+    debug_sample_rate=config.LOG_DEBUG_SAMPLE_RATE,
+    queue_size=config.LOG_QUEUE_SIZE,
+    stream=config.LOG_TO_STDOUT
+)
+logger = logging.getLogger(__name__)
+
+# Plantillas de prompt cacheadas (se recargan al cambiar el archivo)
+prompt_registry.configure(config.PROMPT_FILE, config.PROMPTS_DIR, config.PROMPT_CHECK_INTERVAL)
+
+# Permitir apuntar a un servidor compatible (p. ej. fake_openai_server.py)
+if config.OPENAI_API_BASE:
+    openai.api_base = config.OPENAI_API_BASE
 
 app = Flask(__name__)
 CORS(app)
+if config.TRUSTED_PROXY_HOPS:
+    # X-Forwarded-For lo escribe el cliente: solo se confía en los saltos añadidos por nuestros proxies
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=config.TRUSTED_PROXY_HOPS)
 
 class PACChatbotAPI:
     def __init__(self):
         self.conversation_history = {}
-        self.semantic_search = SemanticSearch()
+        self.session_digests = {}  # resumen compacto de los turnos descartados por sesión
+        self.session_chunks = {}   # IDs de chunks recuperados en turnos recientes por sesión
+        self.total_messages = 0  # contador incremental para analytics y métricas
+        # Cargar la codificación al arrancar: si falta (y no se permite el conteo aproximado)
+        # el worker no arranca, en vez de fallar en la primera pregunta
+        print(f"✅ Tokenizador: {get_encoding().name}")
+        self.semantic_search = SemanticSearch(config.CHUNKS_FILE)
         print("✅ Sistema de búsqueda semántica inicializado")
         
+        # Cliente OpenAI con timeouts, reintentos y circuit breaker
+        self.llm_client = ResilientLLMClient(
+            timeout=config.OPENAI_TIMEOUT,
+            deadline=config.OPENAI_DEADLINE,
+            max_retries=config.OPENAI_MAX_RETRIES,
+            backoff_base=config.OPENAI_BACKOFF_BASE,
+            backoff_max=config.OPENAI_BACKOFF_MAX,
+            failure_threshold=config.CIRCUIT_BREAKER_THRESHOLD,
+            reset_timeout=config.CIRCUIT_BREAKER_RESET_TIMEOUT,
+            hedge_delay=config.OPENAI_HEDGE_DELAY
+        )
+        self.answer_cache = AnswerCache(config.ANSWER_CACHE_SIZE, config.ANSWER_CACHE_TTL)
+        
+        # Límite de llamadas concurrentes a OpenAI con cola acotada
+        self.admission = AdmissionController(
+            max_concurrent=config.ADMISSION_MAX_CONCURRENT,
+            max_queue=config.ADMISSION_MAX_QUEUE,
+            queue_timeout=config.ADMISSION_QUEUE_TIMEOUT,
+            tenant_weights=config.ADMISSION_TENANT_WEIGHTS,
+            tenant_max_concurrent=config.ADMISSION_TENANT_LIMITS,
+            default_tenant_max_concurrent=config.ADMISSION_TENANT_MAX_CONCURRENT,
+            tenant_max_queue=config.ADMISSION_TENANT_MAX_QUEUE,
+            max_tenants=config.ADMISSION_MAX_TENANTS
+        )
+        
         # Verificar estado de chunks
         if self.semantic_search.chunks:
             print(f"✅ Chunks cargados: {len(self.semantic_search.chunks)}")
@@ -35,83 +108,244 @@ class PACChatbotAPI:
         else:
             print("⚠️ No se cargaron chunks. Verifica que pdf_chunks.json exista.")
         
-    def get_relevant_chunks(self, user_message):
-        """Obtener chunks relevantes para la pregunta del usuario"""
+    def retrieve_chunks(self, user_message, session_id=None):
+        """
+        Buscar los chunks más relevantes para la pregunta del usuario
+        
+        En preguntas de seguimiento se puntúan primero solo los chunks de los
+        turnos recientes y se reutilizan los que la pregunta nueva, por sí sola,
+        alcanza con al menos FOLLOWUP_MIN_SCORE; si no alcanzan para completar,
+        se busca en todo el índice con la consulta expandida con la pregunta
+        anterior.
+        """
         try:
-            # Buscar chunks más relevantes usando búsqueda semántica
-            relevant_chunks = self.semantic_search.search(user_message, top_k=2)  # Reducir a 2 chunks
-            
-            if relevant_chunks:
-                # Extraer solo información esencial de los chunks
-                combined_content = ""
-                for i, chunk in enumerate(relevant_chunks, 1):
-                    # Solo incluir las primeras 100 palabras del chunk más relevante
-                    content_words = chunk['content'].split()
-                    if i == 1 and len(content_words) > 100:
-                        # Para el chunk más relevante, incluir solo las primeras 100 palabras
-                        truncated_content = ' '.join(content_words[:100]) + "..."
-                    else:
-                        # Para chunks adicionales, incluir solo las primeras 50 palabras
-                        truncated_content = ' '.join(content_words[:50]) + "..."
-                    
-                    combined_content += f"\n\n📚 CHUNK {i} (Unidad {chunk['metadata']['unidad']} - {chunk['metadata']['tema']})\n"
-                    combined_content += f"Relevancia: {chunk['similarity_percentage']}%\n"
-                    combined_content += f"Contenido: {truncated_content}"
-                
-                print(f"✅ Encontrados {len(relevant_chunks)} chunks relevantes para: '{user_message}'")
-                return combined_content, len(relevant_chunks)
+            if self.is_follow_up_turn(user_message, session_id):
+                recent_ids = self.session_chunks[session_id]
+                history = self.conversation_history[session_id]
+                previous_question = next(msg['content'] for msg in reversed(history) if msg['role'] == 'user')
+                expanded_query = f"{previous_question} {user_message}"
+                results, fell_back = self.semantic_search.search_follow_up(
+                    user_message, expanded_query, recent_ids, config.FOLLOWUP_MIN_SCORE, top_k=2)
+                metrics.inc('pac_retrieval_total', {'mode': 'followup_fallback' if fell_back else 'followup'})
             else:
-                print(f"⚠️ No se encontraron chunks relevantes para: '{user_message}'")
-                return "", 0
-                
+                metrics.inc('pac_retrieval_total', {'mode': 'full'})
+                results = self.semantic_search.search(user_message, top_k=2)  # Reducir a 2 chunks
+            
+            if session_id and results:
+                self.remember_chunks(session_id, [chunk['id'] for chunk in results])
+            return results
         except Exception as e:
-            print(f"❌ Error en búsqueda semántica: {str(e)}")
-            return "", 0
+            logger.error("Error en búsqueda semántica: %s", str(e))
+            return []
+    
+    def is_follow_up_turn(self, user_message, session_id):
+        """Indicar si la pregunta debe resolverse con los chunks recientes de la sesión"""
+        return bool(config.FOLLOWUP_RETRIEVAL_ENABLED and session_id
+                    and self.session_chunks.get(session_id)
+                    and self.conversation_history.get(session_id)
+                    and is_follow_up(user_message))
     
-    def get_response(self, user_message, session_id=None):
-        """Obtener respuesta del chatbot usando OpenAI"""
+    def retrieve_many(self, items):
+        """
+        Recuperar chunks para varias preguntas en una sola pasada de puntuación
+        
+        Args:
+            items: Lista de pares (pregunta, session_id)
+            
+        Returns:
+            Lista con los chunks de cada pregunta, o None para las que deben
+            recuperarse en su turno (seguimientos y turnos posteriores de una
+            misma sesión dentro del lote)
+        """
+        batched = []
+        seen_sessions = set()
+        for index, (user_message, session_id) in enumerate(items):
+            if session_id in seen_sessions or self.is_follow_up_turn(user_message, session_id):
+                continue
+            if session_id:
+                seen_sessions.add(session_id)
+            batched.append(index)
+        
+        results = [None] * len(items)
+        if not batched:
+            return results
         try:
-            # Cargar prompt del sistema
-            system_prompt = self.load_system_prompt()
+            found = self.semantic_search.search_many([items[i][0] for i in batched], top_k=2)
+        except Exception as e:
+            logger.error("Error en búsqueda semántica por lote: %s", str(e))
+            return results
+        metrics.inc('pac_retrieval_total', {'mode': 'batch'}, len(batched))
+        for index, chunks in zip(batched, found):
+            results[index] = chunks
+            session_id = items[index][1]
+            if session_id and chunks:
+                self.remember_chunks(session_id, [chunk['id'] for chunk in chunks])
+        return results
+    
+    def remember_chunks(self, session_id, chunk_ids):
+        """Guardar los chunks recuperados (los más recientes primero, sin duplicados)"""
+        recent = [chunk_id for chunk_id in self.session_chunks.get(session_id, []) if chunk_id not in chunk_ids]
+        self.session_chunks[session_id] = (list(chunk_ids) + recent)[:config.FOLLOWUP_MEMORY_CHUNKS]
+    
+    def format_chunks(self, relevant_chunks):
+        """Extraer solo información esencial de los chunks para el prompt"""
+        combined_content = ""
+        for i, chunk in enumerate(relevant_chunks, 1):
+            # Solo incluir las primeras 100 palabras del chunk más relevante
+            content_words = chunk['content'].split()
+            if i == 1 and len(content_words) > 100:
+                # Para el chunk más relevante, incluir solo las primeras 100 palabras
+                truncated_content = ' '.join(content_words[:100]) + "..."
+            else:
+                # Para chunks adicionales, incluir solo las primeras 50 palabras
+                truncated_content = ' '.join(content_words[:50]) + "..."
             
-            # Obtener chunks relevantes para la pregunta
-            relevant_content, chunks_found = self.get_relevant_chunks(user_message)
+            combined_content += f"\n\n📚 CHUNK {i} (Unidad {chunk['metadata']['unidad']} - {chunk['metadata']['tema']})\n"
+            combined_content += f"Relevancia: {chunk['similarity_percentage']}%\n"
+            combined_content += f"Contenido: {truncated_content}"
+        return combined_content
+    
+    def get_relevant_chunks(self, user_message):
+        """Obtener chunks relevantes para la pregunta del usuario"""
+        relevant_chunks = self.retrieve_chunks(user_message)
+        
+        if relevant_chunks:
+            logger.debug("Chunks relevantes encontrados", extra={'chunks_found': len(relevant_chunks)})
+            return self.format_chunks(relevant_chunks), len(relevant_chunks)
+        
+        logger.debug("No se encontraron chunks relevantes")
+        return "", 0
+    
+    def build_fallback_response(self, user_message, relevant_chunks, prompt_version=''):
+        """
+        Respuesta degradada cuando OpenAI no está disponible
+        
+        Usa una respuesta previa en caché o, en su defecto, un extracto de los
+        chunks recuperados. Retorna None si no hay nada que ofrecer.
+        """
+        if not config.LLM_FALLBACK_ENABLED:
+            return None
+        
+        cached = self.answer_cache.get(user_message, prompt_version)
+        if cached:
+            return cached
+        
+        if not relevant_chunks:
+            return None
+        
+        chunk = relevant_chunks[0]
+        excerpt = ' '.join(chunk['content'].split()[:80])
+        return (
+            "⚠️ El asistente no está disponible temporalmente. "
+            "Este es el contenido del curso más relacionado con tu pregunta:\n\n"
+            f"📚 Unidad {chunk['metadata']['unidad']} - {chunk['metadata']['tema']}\n"
+            f"{excerpt}..."
+        )
+    
+    def get_response(self, user_message, session_id=None, course_id=None, user_id=None, relevant_chunks=None):
+        """
+        Obtener respuesta del chatbot usando OpenAI
+        
+        Args:
+            user_message: Pregunta del usuario
+            session_id: Sesión de conversación (opcional)
+            course_id: Curso del LMS, selecciona la plantilla de prompt y la cola justa (opcional)
+            user_id: Usuario del LMS, para el reparto de turnos dentro del curso (opcional)
+            relevant_chunks: Chunks ya recuperados (p. ej. por retrieve_many); None = buscarlos
+        
+        Raises:
+            AdmissionRejected: Si el servicio está saturado y no hay respuesta en caché
+            LLMUnavailableError: Si OpenAI no responde y no hay respuesta de respaldo
+            openai.error.OpenAIError: Errores no transitorios del proveedor
+        """
+        # Obtener chunks relevantes para la pregunta
+        if relevant_chunks is None:
+            with request_timing.stage('retrieval'):
+                relevant_chunks = self.retrieve_chunks(user_message, session_id)
+        
+        with request_timing.stage('prompt'):
+            # Plantilla del sistema (en memoria, con su conteo de tokens)
+            template = prompt_registry.resolve(course_id)
+            system_prompt = template.text
             
-            if relevant_content and chunks_found > 0:
-                system_prompt += f"\n\nCONTENIDO RELEVANTE DEL CURSO PAC (basado en {chunks_found} chunks):\n{relevant_content}"
-                print(f"✅ Enviando {chunks_found} chunks relevantes a OpenAI")
+            if relevant_chunks:
+                relevant_content = self.format_chunks(relevant_chunks)
+                system_prompt += f"\n\nCONTENIDO RELEVANTE DEL CURSO PAC (basado en {len(relevant_chunks)} chunks):\n{relevant_content}"
             else:
                 system_prompt += "\n\nNO SE ENCONTRÓ INFORMACIÓN RELEVANTE EN LOS MANUALES DEL CURSO PAC."
-                print("⚠️ No se encontraron chunks relevantes")
-            
-            # Obtener historial de la sesión
+            # Obtener historial de la sesión (ya recortado al presupuesto de tokens)
             session_history = self.conversation_history.get(session_id, [])
+            digest = self.session_digests.get(session_id)
             
             # Construir mensajes para OpenAI
             messages = [{"role": "system", "content": system_prompt}]
+            if digest:
+                messages.append({"role": "system", "content": digest['content']})
             
-            # Agregar historial reciente (últimas 5 conversaciones)
-            for msg in session_history[-10:]:
-                messages.append(msg)
+            for msg in session_history:
+                messages.append({"role": msg['role'], "content": msg['content']})
             
             # Agregar mensaje actual del usuario
             messages.append({"role": "user", "content": user_message})
             
-            # Llamar a OpenAI
-            openai.api_key = os.getenv('OPENAI_API_KEY')
-            response = openai.ChatCompletion.create(
-                model=os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo'),
-                messages=messages,
-                max_tokens=int(os.getenv('OPENAI_MAX_TOKENS', '300')),
-                temperature=float(os.getenv('OPENAI_TEMPERATURE', '0.7'))
-            )
-            
+            logger.debug("Prompt construido", extra={
+                'prompt_version': template.version_id,
+                'prompt_tokens': template.tokens,
+                'history_tokens': sum(msg['tokens'] for msg in session_history) + (digest['tokens'] if digest else 0),
+                'chunks_sent': len(relevant_chunks),
+                'chunk_ids': [chunk['id'] for chunk in relevant_chunks]
+            })
+        
+        # Esperar turno para llamar a OpenAI; si está saturado, responder desde la caché
+        try:
+            with request_timing.stage('queue'):
+                ticket = self.admission.acquire(course_id, user_id)
+        except AdmissionRejected as e:
+            cached = None
+            if not session_history and not digest:
+                cached = self.answer_cache.get(user_message, template.version_id)
+            if cached is None:
+                raise
+            logger.info("Servicio saturado, respuesta servida desde caché",
+                        extra={'reason': e.reason, 'course': e.tenant})
+            return cached
+        metrics.observe('pac_admission_wait_seconds',
+                        {'course': self.admission.metric_label(ticket.tenant and ticket.tenant.name)},
+                        ticket.waited)
+        
+        # Llamar a OpenAI
+        openai.api_key = os.getenv('OPENAI_API_KEY')
+        llm_start = time.monotonic()
+        try:
+            with request_timing.stage('llm'):
+                response = self.llm_client.chat_completion(
+                    model=os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo'),
+                    messages=messages,
+                    max_tokens=int(os.getenv('OPENAI_MAX_TOKENS', '300')),
+                    temperature=float(os.getenv('OPENAI_TEMPERATURE', '0.7')),
+                    headers={'X-Request-ID': get_request_id() or ''}
+                )
+        except LLMUnavailableError as e:
+            fallback = self.build_fallback_response(user_message, relevant_chunks, template.version_id)
+            if fallback is None:
+                raise
+            logger.warning("OpenAI no disponible, usando respuesta de respaldo: %s", str(e))
+            return fallback
+        finally:
+            self.admission.release(ticket, time.monotonic() - llm_start)
+        
+        usage = response.get('usage') or {}
+        if usage:
+            metrics.inc('pac_llm_tokens_total', {'type': 'prompt'}, usage.get('prompt_tokens', 0))
+            metrics.inc('pac_llm_tokens_total', {'type': 'completion'}, usage.get('completion_tokens', 0))
+        
+        with request_timing.stage('postprocess'):
             bot_response = response.choices[0]['message']['content']
             
             # Validar longitud de respuesta y truncar si es necesario
             word_count = len(bot_response.split())
             if word_count > 150:
-                print(f"⚠️ Respuesta muy larga ({word_count} palabras), truncando...")
+                logger.debug("Respuesta muy larga, truncando", extra={'word_count': word_count})
                 # Truncar a 150 palabras manteniendo oraciones completas
                 words = bot_response.split()[:150]
                 bot_response = ' '.join(words)
@@ -120,40 +354,266 @@ class PACChatbotAPI:
                     bot_response += '.'
                 bot_response += '\n\n💡 Para más detalles, haz preguntas específicas de seguimiento.'
             
+            # Las respuestas sin historial sirven de respaldo para la misma pregunta
+            if not session_history and not digest:
+                self.answer_cache.set(user_message, bot_response, template.version_id)
+            
             # Actualizar historial de la sesión
             if session_id:
-                if session_id not in self.conversation_history:
-                    self.conversation_history[session_id] = []
-                
-                self.conversation_history[session_id].append({"role": "user", "content": user_message})
-                self.conversation_history[session_id].append({"role": "assistant", "content": bot_response})
-                
-                # Mantener solo las últimas 20 conversaciones
-                if len(self.conversation_history[session_id]) > 20:
-                    self.conversation_history[session_id] = self.conversation_history[session_id][-20:]
-            
-            return bot_response
-            
-        except Exception as e:
-            return f"Error al procesar la consulta: {str(e)}"
+                self.add_turn(session_id, user_message, bot_response)
+        
+        return bot_response
     
-    def load_system_prompt(self):
-        """Cargar el prompt del sistema desde archivo"""
-        try:
-            with open('prompt_sistema.txt', 'r', encoding='utf-8') as file:
-                return file.read()
-        except FileNotFoundError:
-            return """
-            Eres un asistente educativo especializado en el Plan de Aseguramiento de la Calidad en Construcción (PAC).
-            Responde basándote SOLO en el contenido de los PDFs del curso.
-            Cita definiciones textuales cuando sea posible.
-            Menciona siempre la unidad específica del curso.
-            Mantén las respuestas concisas y específicas.
-            """
+    def add_turn(self, session_id, user_message, bot_response):
+        """
+        Guardar un turno en el historial respetando el presupuesto de tokens
+        
+        Cada mensaje guarda su conteo de tokens al insertarse. Los turnos más
+        antiguos que exceden HISTORY_TOKEN_BUDGET o MAX_SESSION_HISTORY se
+        descartan y sus preguntas pasan al resumen de la sesión.
+        """
+        history = self.conversation_history.setdefault(session_id, [])
+        previous_count = len(history)
+        user_tokens, bot_tokens = count_tokens_many([user_message, bot_response])
+        history.append({"role": "user", "content": user_message, "tokens": user_tokens})
+        history.append({"role": "assistant", "content": bot_response, "tokens": bot_tokens})
+        
+        total_tokens = sum(msg['tokens'] for msg in history)
+        dropped = []
+        # Siempre se conserva el último turno completo (usuario + asistente)
+        while len(history) > 2 and (len(history) > config.MAX_SESSION_HISTORY
+                                    or total_tokens > config.HISTORY_TOKEN_BUDGET):
+            for msg in history[:2]:
+                total_tokens -= msg['tokens']
+                dropped.append(msg)
+            del history[:2]
+        
+        if dropped:
+            self.update_digest(session_id, dropped)
+        self.total_messages += len(history) - previous_count
+    
+    def update_digest(self, session_id, dropped_messages):
+        """Incorporar las preguntas de los turnos descartados al resumen de la sesión"""
+        digest = self.session_digests.get(session_id) or {'questions': [], 'dropped_turns': 0}
+        for msg in dropped_messages:
+            if msg['role'] == 'user':
+                question = ' '.join(msg['content'].split())
+                if len(question) > 120:
+                    question = question[:117] + '...'
+                digest['questions'].append(question)
+                digest['dropped_turns'] += 1
+        digest['questions'] = digest['questions'][-config.HISTORY_DIGEST_QUESTIONS:]
+        
+        lines = '\n'.join(f"- {question}" for question in digest['questions'])
+        digest['content'] = (
+            f"RESUMEN DE LA CONVERSACIÓN ANTERIOR ({digest['dropped_turns']} turnos omitidos). "
+            f"El estudiante ya preguntó:\n{lines}"
+        )
+        digest['tokens'] = count_tokens(digest['content'])
+        self.session_digests[session_id] = digest
+    
+    def clear_session(self, session_id):
+        """Eliminar el historial de una sesión"""
+        self.session_digests.pop(session_id, None)
+        self.session_chunks.pop(session_id, None)
+        history = self.conversation_history.pop(session_id, None)
+        if history is not None:
+            self.total_messages -= len(history)
+    
+    def load_system_prompt(self, course_id=None):
+        """Obtener el prompt del sistema desde el registro de plantillas"""
+        return prompt_registry.resolve(course_id).text
 
 # Instancia global del chatbot
 chatbot = PACChatbotAPI()
 
+def run_chat_job(data):
+    """Ejecutar el pipeline de chat para un trabajo asíncrono"""
+    response = chatbot.get_response(data['message'], data.get('session_id'),
+                                    data.get('course_id'), data.get('user_id'))
+    return {
+        'response': response,
+        'session_id': data.get('session_id'),
+        'user_id': data.get('user_id'),
+        'course_id': data.get('course_id'),
+        'timestamp': datetime.now().isoformat(),
+        'status': 'success'
+    }
+
+# Trabajos de chat asíncronos (estado compartido entre workers en SQLite)
+job_manager = ChatJobManager(
+    run_chat_job,
+    JobStore(config.JOB_DB, config.JOB_TTL, config.JOB_MAX_STORED),
+    max_workers=config.JOB_WORKERS,
+    max_pending=config.JOB_MAX_PENDING,
+    callback_timeout=config.JOB_CALLBACK_TIMEOUT,
+    callback_retries=config.JOB_CALLBACK_RETRIES,
+    callback_secret=config.JOB_CALLBACK_SECRET,
+    callback_allowed_hosts=config.JOB_CALLBACK_ALLOWED_HOSTS
+)
+
+# Métricas: estado de los componentes evaluado al exportar
+metrics.configure(config.METRICS_DIR, config.METRICS_FLUSH_INTERVAL)
+
+# Motivo de rechazo en la métrica -> contador en las estadísticas de admission.py
+ADMISSION_SHED_STATS = {'queue_full': 'shed_queue_full', 'queue_timeout': 'shed_timeout'}
+
+def collect_component_metrics():
+    search = chatbot.semantic_search
+    llm_status = chatbot.llm_client.get_status()
+    cache_stats = chatbot.answer_cache.get_statistics()
+    yield 'pac_active_sessions', None, len(chatbot.conversation_history)
+    yield 'pac_session_messages', None, chatbot.total_messages
+    yield 'pac_index_chunks', None, len(search.chunks)
+    yield 'pac_index_tokens', None, sum(chunk['tokens'] for chunk in search.chunks)
+    yield 'pac_index_features', None, search.chunk_vectors.shape[1] if search.chunk_vectors is not None else 0
+    yield 'pac_llm_circuit_open', None, 1 if llm_status['circuit']['state'] == 'open' else 0
+    for result in ('successes', 'failures', 'retries', 'timeouts', 'short_circuited', 'hedged'):
+        yield 'pac_llm_requests_total', {'result': result}, llm_status['stats'][result]
+    yield 'pac_cache_requests_total', {'cache': 'answers', 'result': 'hit'}, cache_stats['hits']
+    yield 'pac_cache_requests_total', {'cache': 'answers', 'result': 'miss'}, cache_stats['misses']
+    jobs_status = job_manager.get_status()
+    yield 'pac_chat_jobs_pending', None, jobs_status['pending']
+    for status in ('submitted', 'completed', 'failed', 'rejected'):
+        yield 'pac_chat_jobs_total', {'status': status}, jobs_status['stats'][status]
+    for course, tenant in chatbot.admission.get_tenants().items():
+        yield 'pac_admission_active', {'course': course}, tenant['active']
+        yield 'pac_admission_queue_depth', {'course': course}, tenant['queue_depth']
+        yield 'pac_admission_admitted_total', {'course': course}, tenant['stats']['admitted']
+        for reason, stat in ADMISSION_SHED_STATS.items():
+            yield 'pac_admission_shed_total', {'course': course, 'reason': reason}, tenant['stats'][stat]
+
+metrics.add_collector(collect_component_metrics)
+
+# Perfilado opcional: cabecera X-Profile con clave de administrador, o muestreo
+profiler = RequestProfiler(
+    profile_dir=config.PROFILE_DIR,
+    sample_rate=config.PROFILE_SAMPLE_RATE,
+    admin_keys=config.ADMIN_API_KEYS,
+    key_header=config.API_KEY_HEADER
+)
+
+# Rate limiting por clave de API (o IP), usuario y curso, compartido entre workers
+rate_limiter = TokenBucketLimiter(config.RATE_LIMIT_DB, config.RATE_LIMIT_WINDOW)
+
+def rate_limit_keys(data):
+    """Buckets que consume una petición: (clave, capacidad)"""
+    api_key = request.headers.get(config.API_KEY_HEADER)
+    if api_key:
+        # No guardar la clave en claro en la base compartida
+        identity = 'key:' + hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+    else:
+        identity = 'ip:' + (request.remote_addr or '')
+    keys = [(identity, config.RATE_LIMIT_REQUESTS)]
+    course_id = data.get('course_id')
+    user_id = data.get('user_id')
+    if user_id:
+        keys.append((f"user:{course_id or ''}:{user_id}", config.RATE_LIMIT_USER_REQUESTS))
+    if course_id:
+        keys.append((f"course:{course_id}", config.RATE_LIMIT_COURSE_REQUESTS))
+    return keys
+
+def rate_limited(cost=lambda data: 1):
+    """
+    Aplicar rate limiting a un endpoint
+    
+    Args:
+        cost: Función que recibe el JSON de la petición y retorna los tokens a consumir
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not config.RATE_LIMIT_ENABLED:
+                return view(*args, **kwargs)
+            data = request.get_json(silent=True)
+            data = data if isinstance(data, dict) else {}
+            result = rate_limiter.check(rate_limit_keys(data), cost(data))
+            g.rate_limit = result
+            if not result.allowed:
+                metrics.inc('pac_rate_limited_total', {'scope': result.scope})
+                return jsonify({
+                    'error': 'Límite de peticiones excedido',
+                    'scope': result.scope,
+                    'retry_after': int(result.headers()['Retry-After']),
+                    'timestamp': datetime.now().isoformat()
+                }), 429
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+@app.before_request
+def start_request_timing():
+    """Iniciar la medición de tiempos por etapa y asignar el ID de la petición"""
+    set_request_id(request.headers.get('X-Request-ID') or uuid.uuid4().hex[:16])
+    request_timing.begin()
+    
+    mode = profiler.requested_mode(request.headers)
+    if mode:
+        g.profile = profiler.start()
+        g.profile_mode = mode
+
+@app.after_request
+def add_server_timing(response):
+    """Reportar los tiempos por etapa en la cabecera Server-Timing"""
+    response.headers['X-Request-ID'] = get_request_id() or ''
+    rate_limit = g.pop('rate_limit', None)
+    if rate_limit is not None:
+        response.headers.update(rate_limit.headers())
+    timings = request_timing.current()
+    if timings is not None:
+        response.headers['Server-Timing'] = timings.server_timing_header()
+        
+        endpoint = request.endpoint or 'unmatched'
+        metrics.inc('pac_http_requests_total', {
+            'endpoint': endpoint,
+            'method': request.method,
+            'status': str(response.status_code)
+        })
+        metrics.observe('pac_http_request_duration_seconds', {'endpoint': endpoint}, timings.total())
+        for stage_name, seconds in timings.stages.items():
+            metrics.observe('pac_stage_duration_seconds', {'stage': stage_name}, seconds)
+        metrics.maybe_flush()
+        logger.debug("Petición completada", extra={
+            'endpoint': endpoint,
+            'status': response.status_code,
+            'timings_ms': timings.to_dict()
+        })
+    return response
+
+@app.after_request
+def finish_profiling(response):
+    """Guardar el perfil y, si lo pidió un administrador, adjuntar el desglose por etapa"""
+    profile = g.pop('profile', None)
+    if profile is None:
+        return response
+    mode = g.pop('profile_mode')
+    result = profiler.finish(profile, f"{request.endpoint or 'unmatched'}_{get_request_id()}", mode)
+    if result['file']:
+        logger.info("Perfil guardado", extra={'profile_file': result['file'], 'mode': mode})
+    
+    if mode == 'header':
+        timings = request_timing.current()
+        response.headers['X-Profile-File'] = result['file'] or ''
+        if response.is_json:
+            body = response.get_json()
+            if isinstance(body, dict):
+                body['profile'] = {
+                    'stages_ms': timings.to_dict() if timings is not None else {},
+                    'file': result['file'],
+                    'top_functions': result['top_functions']
+                }
+                response.set_data(json.dumps(body, ensure_ascii=False))
+    return response
+
+@app.teardown_request
+def end_request_timing(error=None):
+    profile = g.pop('profile', None)
+    if profile is not None:
+        # La petición falló antes de after_request: liberar el perfilador
+        profiler.finish(profile, f"{request.endpoint or 'unmatched'}_{get_request_id()}", g.pop('profile_mode'))
+    request_timing.end()
+    set_request_id(None)
+
 # ============================================================================
 # ENDPOINTS DE LA API
 # ============================================================================
@@ -176,10 +636,18 @@ def system_status():
         'openai_configured': bool(os.getenv('OPENAI_API_KEY')),
         'chunks_loaded': bool(chatbot.semantic_search.chunks),
         'active_sessions': len(chatbot.conversation_history),
+        'llm': chatbot.llm_client.get_status(),
+        'answer_cache': chatbot.answer_cache.get_statistics(),
+        'admission': chatbot.admission.get_status(),
+        'jobs': job_manager.get_status(),
+        'rate_limit': rate_limiter.get_status() if config.RATE_LIMIT_ENABLED else {'enabled': False},
+        'profiling': profiler.get_status(),
+        'prompts': prompt_registry.get_status(),
         'timestamp': datetime.now().isoformat()
     })
 
 @app.route('/api/chat', methods=['POST'])
+@rate_limited()
 def chat():
     """Endpoint principal para el chat"""
     try:
@@ -197,16 +665,205 @@ def chat():
             return jsonify({'error': 'Mensaje requerido'}), 400
         
         # Obtener respuesta del chatbot
-        response = chatbot.get_response(user_message, session_id)
+        response = chatbot.get_response(user_message, session_id, course_id, user_id)
         
-        return jsonify({
-            'response': response,
-            'session_id': session_id,
-            'user_id': user_id,
+        with request_timing.stage('serialization'):
+            return jsonify({
+                'response': response,
+                'session_id': session_id,
+                'user_id': user_id,
+                'course_id': course_id,
+                'timestamp': datetime.now().isoformat(),
+                'status': 'success'
+            })
+        
+    except AdmissionRejected as e:
+        retry_after = max(1, int(round(e.retry_after)))
+        response = jsonify({
+            'error': 'Servicio saturado, intenta nuevamente en unos segundos',
+            'reason': e.reason,
             'course_id': course_id,
-            'timestamp': datetime.now().isoformat(),
-            'status': 'success'
+            'retry_after': retry_after,
+            'timestamp': datetime.now().isoformat()
+        })
+        response.headers['Retry-After'] = str(retry_after)
+        return response, 503
+    except LLMUnavailableError as e:
+        retry_after = max(1, int(round(e.retry_after or config.CIRCUIT_BREAKER_RESET_TIMEOUT)))
+        response = jsonify({
+            'error': 'Servicio de IA no disponible temporalmente',
+            'detail': str(e),
+            'retry_after': retry_after,
+            'timestamp': datetime.now().isoformat()
+        })
+        response.headers['Retry-After'] = str(retry_after)
+        return response, 503
+    except openai.error.OpenAIError as e:
+        logger.warning("Error no transitorio de OpenAI: %s", str(e))
+        return jsonify({'error': f'Error del proveedor de IA: {str(e)}'}), 502
+    except Exception as e:
+        logger.exception("Error procesando mensaje de chat")
+        return jsonify({'error': str(e)}), 500
+
+# Pool acotado para repartir las llamadas al LLM de /api/chat/batch
+batch_executor = ThreadPoolExecutor(max_workers=config.BATCH_WORKERS, thread_name_prefix='chat-batch')
+
+def batch_cost(data):
+    """Un token de rate limiting por pregunta del lote"""
+    items = data.get('items') or data.get('questions') or []
+    return max(1, len(items)) if isinstance(items, list) else 1
+
+def run_batch_group(group, defaults, request_id, results):
+    """Responder en orden las preguntas de un grupo (una misma sesión, o una pregunta suelta)"""
+    set_request_id(request_id)
+    try:
+        for index, item, chunks in group:
+            timings = request_timing.begin()
+            course_id = item.get('course_id', defaults.get('course_id'))
+            user_id = item.get('user_id', defaults.get('user_id'))
+            try:
+                response = chatbot.get_response(item['message'], item.get('session_id'), course_id,
+                                                user_id, relevant_chunks=chunks)
+                results[index] = {
+                    'index': index,
+                    'status': 'success',
+                    'response': response,
+                    'session_id': item.get('session_id'),
+                    'timings_ms': timings.to_dict()
+                }
+            except Exception as e:
+                if not isinstance(e, (AdmissionRejected, LLMUnavailableError, openai.error.OpenAIError)):
+                    logger.exception("Error procesando pregunta del lote", extra={'index': index})
+                results[index] = {
+                    'index': index,
+                    'status': 'error',
+                    'error': str(e),
+                    'error_type': type(e).__name__,
+                    'session_id': item.get('session_id'),
+                    'timings_ms': timings.to_dict()
+                }
+                retry_after = getattr(e, 'retry_after', None)
+                if retry_after is not None:
+                    results[index]['retry_after'] = max(1, int(round(retry_after)))
+            finally:
+                request_timing.end()
+    finally:
+        set_request_id(None)
+
+@app.route('/api/chat/batch', methods=['POST'])
+@rate_limited(cost=batch_cost)
+def chat_batch():
+    """Responder un lote de preguntas independientes en paralelo, conservando el orden"""
+    try:
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({'error': 'Datos requeridos'}), 400
+        
+        items = data.get('items')
+        if items is None:
+            items = [{'message': question} for question in data.get('questions') or []]
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'Se requiere una lista "items" o "questions"'}), 400
+        if len(items) > config.BATCH_MAX_ITEMS:
+            return jsonify({'error': f'Máximo {config.BATCH_MAX_ITEMS} preguntas por lote'}), 400
+        for index, item in enumerate(items):
+            if not isinstance(item, dict) or not item.get('message'):
+                return jsonify({'error': f'Mensaje requerido en el elemento {index}'}), 400
+        
+        defaults = {'course_id': data.get('course_id'), 'user_id': data.get('user_id')}
+        
+        # Una sola pasada de puntuación para todas las preguntas
+        with request_timing.stage('retrieval'):
+            chunks = chatbot.retrieve_many([(item['message'], item.get('session_id')) for item in items])
+        
+        # Las preguntas de una misma sesión van en orden dentro de un grupo; los grupos en paralelo
+        groups = {}
+        for index, item in enumerate(items):
+            key = item.get('session_id') or f'__item_{index}'
+            groups.setdefault(key, []).append((index, item, chunks[index]))
+        
+        results = [None] * len(items)
+        with request_timing.stage('fanout'):
+            futures = [batch_executor.submit(run_batch_group, group, defaults, get_request_id(), results)
+                       for group in groups.values()]
+            for future in futures:
+                future.result()
+        
+        succeeded = sum(1 for result in results if result['status'] == 'success')
+        with request_timing.stage('serialization'):
+            return jsonify({
+                'results': results,
+                'count': len(results),
+                'succeeded': succeeded,
+                'failed': len(results) - succeeded,
+                'course_id': defaults['course_id'],
+                'user_id': defaults['user_id'],
+                'timestamp': datetime.now().isoformat(),
+                'status': 'success'
+            })
+        
+    except Exception as e:
+        logger.exception("Error procesando lote de chat")
+        return jsonify({'error': str(e)}), 500
+
+def validate_callback_url(url):
+    """Retornar un mensaje de error si la URL de callback no es aceptable"""
+    return check_callback_url(url, config.JOB_CALLBACK_ALLOWED_HOSTS)
+
+@app.route('/api/chat/jobs', methods=['POST'])
+@rate_limited()
+def submit_chat_job():
+    """Encolar una pregunta y retornar el ID del trabajo de inmediato"""
+    try:
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({'error': 'Datos requeridos'}), 400
+        
+        if not data.get('message'):
+            return jsonify({'error': 'Mensaje requerido'}), 400
+        
+        callback_url = data.get('callback_url')
+        if callback_url:
+            error = validate_callback_url(callback_url)
+            if error:
+                return jsonify({'error': error}), 400
+        
+        payload = {key: data.get(key) for key in ('message', 'session_id', 'user_id', 'course_id')}
+        job = job_manager.submit(payload, callback_url)
+        
+        status_url = f"/api/chat/jobs/{job['job_id']}"
+        response = jsonify({
+            'job_id': job['job_id'],
+            'status': job['status'],
+            'status_url': status_url,
+            'created_at': job['created_at']
         })
+        response.headers['Location'] = status_url
+        return response, 202
+        
+    except JobQueueFull as e:
+        response = jsonify({
+            'error': 'Demasiados trabajos pendientes, intenta nuevamente en unos segundos',
+            'detail': str(e),
+            'timestamp': datetime.now().isoformat()
+        })
+        response.headers['Retry-After'] = str(max(1, int(config.OPENAI_TIMEOUT)))
+        return response, 503
+    except Exception as e:
+        logger.exception("Error encolando trabajo de chat")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/chat/jobs/<job_id>', methods=['GET'])
+def get_chat_job(job_id):
+    """Consultar el estado y el resultado de un trabajo"""
+    try:
+        job = job_manager.get(job_id)
+        if job is None:
+            return jsonify({'error': 'Trabajo no encontrado o expirado'}), 404
+        job.pop('created', None)
+        return jsonify(job)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -221,6 +878,7 @@ def get_session_history(session_id):
             'session_id': session_id,
             'history': session_history,
             'message_count': len(session_history),
+            'digest': chatbot.session_digests.get(session_id),
             'timestamp': datetime.now().isoformat()
         })
         
@@ -231,8 +889,7 @@ def get_session_history(session_id):
 def clear_session_history(session_id):
     """Limpiar historial de una sesión específica"""
     try:
-        if session_id in chatbot.conversation_history:
-            del chatbot.conversation_history[session_id]
+        chatbot.clear_session(session_id)
         
         return jsonify({
             'message': f'Sesión {session_id} limpiada exitosamente',
@@ -280,23 +937,26 @@ def search_course_content():
         
         # Buscar en chunks usando búsqueda semántica
         if chatbot.semantic_search.chunks:
-            relevant_chunks = chatbot.semantic_search.search(search_term, top_k=3)
+            with request_timing.stage('retrieval'):
+                relevant_chunks = chatbot.semantic_search.search(search_term, top_k=3)
             
             if relevant_chunks:
                 # Combinar contenido de chunks relevantes
-                combined_content = ""
-                for i, chunk in enumerate(relevant_chunks, 1):
-                    combined_content += f"\n\n--- CHUNK {i} (Unidad {chunk['metadata']['unidad']} - {chunk['metadata']['tema']}) ---\n"
-                    combined_content += f"Relevancia: {chunk['similarity_percentage']}%\n"
-                    combined_content += chunk['content']
+                with request_timing.stage('context'):
+                    combined_content = ""
+                    for i, chunk in enumerate(relevant_chunks, 1):
+                        combined_content += f"\n\n--- CHUNK {i} (Unidad {chunk['metadata']['unidad']} - {chunk['metadata']['tema']}) ---\n"
+                        combined_content += f"Relevancia: {chunk['similarity_percentage']}%\n"
+                        combined_content += chunk['content']
                 
-                return jsonify({
-                    'search_term': search_term,
-                    'found': True,
-                    'context': combined_content,
-                    'chunks_found': len(relevant_chunks),
-                    'timestamp': datetime.now().isoformat()
-                })
+                with request_timing.stage('serialization'):
+                    return jsonify({
+                        'search_term': search_term,
+                        'found': True,
+                        'context': combined_content,
+                        'chunks_found': len(relevant_chunks),
+                        'timestamp': datetime.now().isoformat()
+                    })
             else:
                 return jsonify({
                     'search_term': search_term,
@@ -318,7 +978,7 @@ def get_session_analytics():
     """Obtener estadísticas de sesiones"""
     try:
         total_sessions = len(chatbot.conversation_history)
-        total_messages = sum(len(history) for history in chatbot.conversation_history.values())
+        total_messages = chatbot.total_messages
         
         return jsonify({
             'total_sessions': total_sessions,
@@ -330,6 +990,11 @@ def get_session_analytics():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Métricas en formato de texto de Prometheus"""
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 # ============================================================================
 # MANEJO DE ERRORES
 # ============================================================================
@@ -359,6 +1024,8 @@ if __name__ == '__main__':
     
     print("🚀 Iniciando API del Chatbot PAC para LMS")
     print(f"📚 Modelo OpenAI: {os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo')}")
+    if config.OPENAI_API_BASE:
+        print(f"🧪 OpenAI API base: {config.OPENAI_API_BASE}")
     print(f"🔧 Modo debug: {os.getenv('FLASK_DEBUG', 'True')}")
     print("=" * 60)
     
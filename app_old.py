@@ -3,11 +3,11 @@ from flask_cors import CORS
 import os
 import openai
 from dotenv import load_dotenv
-import PyPDF2
 import os
 
 from datetime import datetime
 from config import get_config
+from page_cache import PageCache
 
 # Cargar configuración
 config = get_config()
@@ -27,18 +27,16 @@ class PACChatbot:
     def load_course_pdfs(self):
         """Cargar automáticamente todos los PDFs del curso"""
         pdf_folder = "pdfs_curso"
+        # El texto de las páginas se guarda en caché: si los PDFs no cambiaron no se vuelven a analizar
+        page_cache = PageCache(config.PAGE_CACHE_DIR)
         if os.path.exists(pdf_folder):
             for filename in os.listdir(pdf_folder):
                 if filename.lower().endswith('.pdf'):
                     pdf_path = os.path.join(pdf_folder, filename)
                     try:
-                        with open(pdf_path, 'rb') as pdf_file:
-                            pdf_reader = PyPDF2.PdfReader(pdf_file)
-                            content = ""
-                            for page in pdf_reader.pages:
-                                content += page.extract_text() + "\n"
-                            self.pdf_content += f"\n\n--- CONTENIDO DE {filename} ---\n{content}"
-                            print(f"✅ PDF cargado: {filename}")
+                        content = "".join(page + "\n" for page in page_cache.pages(pdf_path))
+                        self.pdf_content += f"\n\n--- CONTENIDO DE {filename} ---\n{content}"
+                        print(f"✅ PDF cargado: {filename}")
                     except Exception as e:
                         print(f"❌ Error al cargar {filename}: {e}")
     
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+Benchmark de rendimiento del preprocesamiento de PDFs
+Genera un corpus sintético de PDFs con texto en español (encabezado y número
+de página en cada página, algunas palabras partidas como las que deja PyPDF2)
+y mide extracción, limpieza, división en chunks, serialización y construcción
+del índice TF-IDF para cada tamaño de corpus. Reporta páginas/s, tokens/s,
+pico de memoria (RSS) y el tiempo de cada etapa.
+
+Cada tamaño se mide en un proceso nuevo, así el pico de RSS corresponde solo
+a ese corpus. Primero se ejecuta el flujo completo en streaming
+(process_incremental, el que importa para la memoria) y después cada etapa
+por separado para el desglose de tiempos.
+
+Uso:
+    python bench_preprocessing.py
+    python bench_preprocessing.py --pdfs 3 30 300 --pages 30 --output bench_preprocessing.json
+    python bench_preprocessing.py --mode text --baseline bench_anterior.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Dict, List
+
+PAGE_HEADER = "Plan de aseguramiento de la calidad para constructoras (PAC)"
+
+# Vocabulario del curso para las oraciones sintéticas
+WORDS = (
+    "calidad aseguramiento plan construcción obra constructora proceso procedimiento control inspección "
+    "registro documento norma requisito cliente proveedor contrato especificación ensayo material hormigón "
+    "acero armadura moldaje faena supervisor inspector técnico profesional residente mandante empresa "
+    "organización gestión sistema mejora continua auditoría interna externa no conformidad acción correctiva "
+    "preventiva riesgo oportunidad liderazgo compromiso política objetivo indicador medición seguimiento "
+    "análisis evaluación desempeño revisión dirección recurso personal competencia formación toma "
+    "conciencia comunicación información documentada planificación operación diseño desarrollo producto "
+    "servicio suministro externo identificación trazabilidad propiedad preservación liberación entrega "
+    "posterior cambio salida partida protocolo muestreo lote aceptación rechazo certificado laboratorio "
+    "tolerancia plano especificaciones técnicas bodega recepción almacenamiento verificación validación "
+    "equipo instrumento calibración responsable etapa actividad tarea punto crítico hito programa"
+).split()
+CONNECTORS = "el la los las de del en para con por que se debe deben según cada una un su sus y o".split()
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return "desconocido"
+
+
+def peak_rss_mb() -> float:
+    """Pico de memoria residente del proceso (ru_maxrss está en KB en Linux y en bytes en macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def synthetic_page(rng: random.Random, words: int, split_rate: float = 0.01) -> List[str]:
+    """Líneas de texto de una página: oraciones con vocabulario del curso, cortadas a ~90 caracteres"""
+    sentences = []
+    count = 0
+    while count < words:
+        length = rng.randint(8, 22)
+        tokens = [rng.choice(CONNECTORS) if rng.random() < 0.35 else rng.choice(WORDS) for _ in range(length)]
+        # Algunas palabras partidas por el espaciado del PDF ("conte nidos")
+        tokens = [f"{t[:len(t) // 2]} {t[len(t) // 2:]}" if len(t) > 7 and rng.random() < split_rate else t
+                  for t in tokens]
+        sentences.append(" ".join(tokens).capitalize() + ".")
+        count += length
+    lines = []
+    line = ""
+    for word in " ".join(sentences).split(" "):
+        if line and len(line) + len(word) > 90:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    if line:
+        lines.append(line)
+    return lines
+
+
+def _pdf_string(text: str) -> bytes:
+    data = text.encode("cp1252", errors="replace")
+    return b"(" + data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+def write_pdf(path: str, pages: List[List[str]]):
+    """Escribir un PDF mínimo con una línea de texto por renglón (Helvetica, WinAnsiEncoding)"""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # Árbol de páginas, se completa al final
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    kids = []
+    for lines in pages:
+        stream = b"BT /F1 9 Tf 12 TL 50 800 Td " + b" ".join(_pdf_string(line) + b" Tj T*" for line in lines) + b" ET"
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects))
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % k for k in kids) + b"] /Count %d >>" % len(kids)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def generate_corpus(directory: str, pdfs: int, pages: int, words: int, seed: int, mode: str) -> Dict[str, Any]:
+    """
+    Generar el corpus sintético (PDFs y curso.json, o páginas en JSON para el modo text)
+
+    Returns:
+        Resumen del corpus (archivos, páginas y bytes)
+    """
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    files = {}
+    total_bytes = 0
+    for i in range(pdfs):
+        name = f"Sintetico_Unidad_{i % 5 + 1}_{i:04d}"
+        doc = []
+        for number in range(1, pages + 1):
+            doc.append([PAGE_HEADER, ""] + synthetic_page(rng, words) + ["", str(number)])
+        if mode == "pdf":
+            path = os.path.join(directory, name + ".pdf")
+            write_pdf(path, doc)
+        else:
+            path = os.path.join(directory, name + ".json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(["\n".join(lines) for lines in doc], f, ensure_ascii=False)
+        files[os.path.basename(path)] = {"unidad": i % 5 + 1, "tema": name.lower()}
+        total_bytes += os.path.getsize(path)
+    if mode == "pdf":
+        with open(os.path.join(directory, "curso.json"), "w", encoding="utf-8") as f:
+            json.dump({"files": files}, f, ensure_ascii=False, indent=2)
+    return {"pdfs": pdfs, "pages": pdfs * pages, "bytes": total_bytes}
+
+
+def run_one(args) -> Dict[str, Any]:
+    """Medir un tamaño de corpus (se ejecuta en un proceso propio)"""
+    from pdf_preprocessor import PDFPreprocessor, _extract_page_range, discover_pdfs
+    from semantic_search import SemanticSearch
+
+    work = args.workdir
+    corpus_dir = os.path.join(work, "corpus")
+    corpus = generate_corpus(corpus_dir, args.one, args.pages, args.words, args.seed, args.mode)
+    chunks_file = os.path.join(work, "chunks.json")
+    quiet = contextlib.redirect_stdout(io.StringIO())
+
+    def preprocessor() -> PDFPreprocessor:
+        return PDFPreprocessor(chunk_size=args.chunk_size, overlap=args.overlap, page_cache_dir=None)
+
+    result = {"mode": args.mode, "corpus": corpus, "workers": args.workers}
+
+    # 1. Flujo completo en streaming (pico de memoria real del preprocesamiento)
+    if args.mode == "pdf":
+        with quiet:
+            p = preprocessor()
+            start = time.perf_counter()
+            summary = p.process_incremental(corpus_dir, chunks_file, os.path.join(work, "manifest.json"),
+                                            workers=args.workers, full=True)
+            total = time.perf_counter() - start
+        tokens = summary["total_tokens"]
+        result["end_to_end"] = {
+            "seconds": round(total, 3),
+            "pages_per_s": round(corpus["pages"] / total, 1),
+            "tokens_per_s": round(tokens / total, 1),
+            "chunks": summary["total_chunks"],
+            "tokens": tokens,
+            "peak_rss_mb": peak_rss_mb()
+        }
+    result["tokenizer"] = preprocessor().tokenizer.name
+
+    # 2. Etapas por separado
+    stages = {}
+    p = preprocessor()
+    start = time.perf_counter()
+    documents = []
+    if args.mode == "pdf":
+        for pdf_path, info in discover_pdfs(corpus_dir):
+            documents.append((pdf_path, info, _extract_page_range(pdf_path, 0, args.pages)))
+    else:
+        for name in sorted(os.listdir(corpus_dir)):
+            with open(os.path.join(corpus_dir, name), "r", encoding="utf-8") as f:
+                documents.append((name, {"unidad": 0, "tema": name[:-5].lower()}, json.load(f)))
+    stages["extraction"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    cleaned = []
+    for source, info, pages in documents:
+        pages = list(p.stripper.strip_pages(pages)) if p.strip_headers else pages
+        pages = list(p.normalizer.normalize_pages(pages)) if p.normalize_text else pages
+        cleaned.append((source, info, pages))
+    stages["cleaning"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    chunks = []
+    for source, info, pages in cleaned:
+        metadata = {**info, "source": source, "total_pages": len(pages)}
+        chunks.extend(p.iter_text_chunks(pages, metadata))
+    stages["chunking"] = time.perf_counter() - start
+    tokens = sum(chunk["tokens"] for chunk in chunks)
+
+    start = time.perf_counter()
+    chunks = list(p._drop_duplicates(iter(chunks), p._duplicate_index(), []))
+    stages["dedup"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with quiet:
+        p.save_chunks(chunks, chunks_file)
+    stages["serialization"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with quiet:
+        search = SemanticSearch(chunks_file)
+    stages["index_build"] = time.perf_counter() - start
+
+    result["stages_s"] = {name: round(seconds, 3) for name, seconds in stages.items()}
+    result["chunking"] = {
+        "chunks": len(chunks),
+        "tokens": tokens,
+        "pages_per_s": round(corpus["pages"] / stages["chunking"], 1) if stages["chunking"] else None,
+        "tokens_per_s": round(tokens / stages["chunking"], 1) if stages["chunking"] else None,
+        "vocabulary": len(search.vectorizer.vocabulary_) if search.vectorizer is not None else 0
+    }
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def measure(args, pdfs: int) -> Dict[str, Any]:
+    """Ejecutar run_one en un proceso nuevo y leer su resultado"""
+    with tempfile.TemporaryDirectory(prefix="bench_pre_") as work:
+        command = [sys.executable, os.path.abspath(__file__), "--one", str(pdfs), "--workdir", work,
+                   "--mode", args.mode, "--pages", str(args.pages), "--words", str(args.words),
+                   "--seed", str(args.seed), "--workers", str(args.workers),
+                   "--chunk-size", str(args.chunk_size), "--overlap", str(args.overlap)]
+        completed = subprocess.run(command, capture_output=True, text=True)
+        if completed.returncode != 0:
+            raise RuntimeError(f"Falló la medición con {pdfs} PDFs:\n{completed.stderr}")
+        return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def print_results(results: List[Dict[str, Any]], baseline: Dict[str, Any] = None):
+    previous = {}
+    if baseline:
+        previous = {(r["mode"], r["corpus"]["pdfs"]): r for r in baseline.get("results", [])}
+
+    print("\n📊 RESULTADOS DEL BENCHMARK DE PREPROCESAMIENTO")
+    print("=" * 60)
+    for r in results:
+        corpus = r["corpus"]
+        print(f"\n📚 {corpus['pdfs']} PDFs, {corpus['pages']} páginas ({corpus['bytes'] // 1024} KB, modo {r['mode']})")
+        old = previous.get((r["mode"], corpus["pdfs"]))
+        e2e = r.get("end_to_end")
+        if e2e:
+            line = (f"   - Flujo completo: {e2e['seconds']} s, {e2e['pages_per_s']} páginas/s, "
+                    f"{e2e['tokens_per_s']} tokens/s, pico RSS {e2e['peak_rss_mb']} MB")
+            if old and old.get("end_to_end"):
+                line += f" (antes {old['end_to_end']['seconds']} s)"
+            print(line)
+        chunking = r["chunking"]
+        print(f"   - Chunks: {chunking['chunks']} ({chunking['tokens']} tokens), "
+              f"división: {chunking['pages_per_s']} páginas/s, {chunking['tokens_per_s']} tokens/s")
+        stages = "  ".join(f"{name}={seconds}s" for name, seconds in r["stages_s"].items())
+        print(f"   - Etapas: {stages}")
+        if old:
+            deltas = "  ".join(f"{name} {seconds - old['stages_s'].get(name, 0):+.3f}s"
+                               for name, seconds in r["stages_s"].items())
+            print(f"   - Δ vs. baseline: {deltas}")
+        print(f"   - Pico RSS (con etapas materializadas): {r['peak_rss_mb']} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de rendimiento del preprocesamiento de PDFs")
+    parser.add_argument("--pdfs", nargs="+", type=int, default=[3, 30], help="Tamaños del corpus (número de PDFs)")
+    parser.add_argument("--pages", type=int, default=30, help="Páginas por PDF")
+    parser.add_argument("--words", type=int, default=350, help="Palabras por página")
+    parser.add_argument("--mode", choices=["pdf", "text"], default="pdf",
+                        help="pdf: PDFs reales con PyPDF2; text: páginas de texto (sin extracción)")
+    parser.add_argument("--workers", type=int, default=1, help="Procesos que procesan PDFs en paralelo")
+    parser.add_argument("--chunk-size", type=int, default=800)
+    parser.add_argument("--overlap", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Guardar resultados en JSON")
+    parser.add_argument("--baseline", help="JSON de una ejecución anterior para comparar")
+    # Uso interno: medir un tamaño en este proceso
+    parser.add_argument("--one", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.one is not None:
+        print(json.dumps(run_one(args)))
+        return
+
+    print("📄 Benchmark de preprocesamiento del Chatbot PAC")
+    print(f"   - Tamaños: {', '.join(str(n) for n in args.pdfs)} PDFs de {args.pages} páginas "
+          f"({args.words} palabras por página)")
+    print(f"   - Modo: {args.mode}, procesos: {args.workers}")
+
+    results = []
+    for pdfs in args.pdfs:
+        print(f"⏳ Midiendo {pdfs} PDFs...")
+        results.append(measure(args, pdfs))
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.output:
+        report = {
+            "timestamp": datetime.now().isoformat(),
+            "commit": git_commit(),
+            "settings": {"pages": args.pages, "words": args.words, "chunk_size": args.chunk_size,
+                         "overlap": args.overlap, "seed": args.seed},
+            "results": results
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Resultados guardados en: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
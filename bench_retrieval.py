@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Benchmark de calidad y latencia de la recuperación de chunks
+Evalúa cada backend/configuración de búsqueda sobre el conjunto etiquetado
+retrieval_benchmark.json y reporta hit rate@k, recall@k, MRR, latencia por
+consulta y tiempo/memoria de construcción del índice.
+
+Uso:
+    python bench_retrieval.py
+    python bench_retrieval.py --configs actual es_stopwords --output bench_retrieval.json
+    python bench_retrieval.py --baseline bench_anterior.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import re
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Dict, List
+
+from semantic_search import SemanticSearch, SPANISH_STOP_WORDS
+
+PAGE_HEADER = "plan de aseguramiento de la calidad para constructoras (pac)"
+
+# Configuraciones del backend TF-IDF a comparar
+CONFIGURATIONS = {
+    "actual": dict(SemanticSearch.DEFAULT_VECTORIZER_PARAMS),
+    "es_stopwords": {"max_features": 1000, "stop_words": SPANISH_STOP_WORDS, "ngram_range": (1, 2), "min_df": 2},
+    "es_min_df1": {"max_features": 1000, "stop_words": SPANISH_STOP_WORDS, "ngram_range": (1, 2), "min_df": 1},
+    "es_sin_limite": {"max_features": None, "stop_words": SPANISH_STOP_WORDS, "ngram_range": (1, 2), "min_df": 1},
+    "es_acentos_sublinear": {"max_features": None, "stop_words": SPANISH_STOP_WORDS, "ngram_range": (1, 2),
+                             "min_df": 1, "strip_accents": "unicode", "sublinear_tf": True},
+    "unigramas": {"max_features": None, "stop_words": SPANISH_STOP_WORDS, "ngram_range": (1, 1), "min_df": 1},
+    "char_ngrams": {"analyzer": "char_wb", "ngram_range": (3, 5), "min_df": 1, "sublinear_tf": True}
+}
+
+# Backends de recuperación disponibles: nombre -> constructor(chunks_file, params)
+BACKENDS = {
+    "tfidf": lambda chunks_file, params: SemanticSearch(chunks_file, vectorizer_params=params)
+}
+
+
+def normalize(text: str) -> str:
+    text = re.sub(r'\s+', ' ', text.lower())
+    return text.replace(PAGE_HEADER, '')
+
+
+def relevant_ids(query: Dict[str, Any], chunks: List[Dict[str, Any]]) -> set:
+    """IDs de los chunks relevantes según la etiqueta de la consulta"""
+    unidades = set(query.get("unidades") or [])
+    ids = set()
+    for chunk in chunks:
+        if unidades and chunk["metadata"]["unidad"] not in unidades:
+            continue
+        content = normalize(chunk["content"])
+        if any(phrase in content for phrase in query["any_of"]):
+            ids.add(chunk["id"])
+    return ids
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return "desconocido"
+
+
+def index_size_bytes(search: SemanticSearch) -> int:
+    matrix = search.chunk_vectors
+    if matrix is None:
+        return 0
+    return int(matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes)
+
+
+def evaluate(backend: str, config_name: str, params: Dict[str, Any], queries: List[Dict[str, Any]],
+             chunks_file: str, ks: List[int], repeat: int) -> Dict[str, Any]:
+    """Evaluar una configuración: calidad, latencia y costo del índice"""
+    quiet = contextlib.redirect_stdout(io.StringIO())
+
+    # Tiempo de construcción (sin tracemalloc, que distorsiona los tiempos)
+    with quiet:
+        search = BACKENDS[backend](chunks_file, params)
+        start = time.perf_counter()
+        search.create_embeddings()
+        build_s = time.perf_counter() - start
+
+    # Memoria asignada durante la construcción del índice
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        search.create_embeddings()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    max_k = max(ks + [10])
+    hits = {k: 0 for k in ks}
+    recalls = {k: 0.0 for k in ks}
+    reciprocal_ranks = []
+    latencies = []
+    per_query = []
+
+    for query in queries:
+        relevant = relevant_ids(query, search.chunks)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(repeat):
+                start = time.perf_counter()
+                results = search.search(query["question"], top_k=max_k)
+                latencies.append((time.perf_counter() - start) * 1000)
+        ranked = [r["id"] for r in results]
+
+        first_rank = next((i for i, chunk_id in enumerate(ranked, 1) if chunk_id in relevant), None)
+        reciprocal_ranks.append(1.0 / first_rank if first_rank else 0.0)
+        for k in ks:
+            found = relevant.intersection(ranked[:k])
+            hits[k] += 1 if found else 0
+            recalls[k] += len(found) / len(relevant) if relevant else 0.0
+        per_query.append({
+            "question": query["question"],
+            "relevant": len(relevant),
+            "first_relevant_rank": first_rank,
+            "top": ranked[:3]
+        })
+
+    n = len(queries)
+    return {
+        "backend": backend,
+        "config": config_name,
+        "params": {k: (v if not isinstance(v, (list, tuple)) or len(v) < 5 else f"<{len(v)} palabras>")
+                   for k, v in params.items()},
+        "hit_rate": {f"@{k}": round(hits[k] / n, 4) for k in ks},
+        "recall": {f"@{k}": round(recalls[k] / n, 4) for k in ks},
+        "mrr": round(sum(reciprocal_ranks) / n, 4),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "mean": round(sum(latencies) / len(latencies), 3)
+        },
+        "index": {
+            "build_s": round(build_s, 4),
+            "build_peak_mb": round(peak / (1024 * 1024), 2),
+            "vocabulary": len(search.vectorizer.vocabulary_) if search.vectorizer is not None else 0,
+            "matrix_bytes": index_size_bytes(search),
+            "chunks": len(search.chunks)
+        },
+        "queries": per_query
+    }
+
+
+def print_results(results: List[Dict[str, Any]], ks: List[int], baseline: Dict[str, Any] = None):
+    previous = {}
+    if baseline:
+        previous = {(r["backend"], r["config"]): r for r in baseline.get("results", [])}
+
+    print("\n📊 RESULTADOS DEL BENCHMARK DE RECUPERACIÓN")
+    print("=" * 60)
+    for r in results:
+        print(f"\n🔧 {r['backend']} / {r['config']}")
+        hit = "  ".join(f"hit{k}={v}" for k, v in r["hit_rate"].items())
+        rec = "  ".join(f"recall{k}={v}" for k, v in r["recall"].items())
+        print(f"   - {hit}")
+        print(f"   - {rec}")
+        line = f"   - MRR={r['mrr']}"
+        old = previous.get((r["backend"], r["config"]))
+        if old:
+            line += f" (antes {old['mrr']}, Δ {r['mrr'] - old['mrr']:+.4f})"
+        print(line)
+        print(f"   - Latencia: p50={r['latency_ms']['p50']} ms  p95={r['latency_ms']['p95']} ms")
+        idx = r["index"]
+        print(f"   - Índice: {idx['build_s']} s, pico {idx['build_peak_mb']} MB, "
+              f"vocabulario {idx['vocabulary']}, matriz {idx['matrix_bytes']} bytes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de recuperación de chunks del curso PAC")
+    parser.add_argument("--chunks-file", default="pdf_chunks.json")
+    parser.add_argument("--queries", default="retrieval_benchmark.json")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument("--configs", nargs="+", default=list(CONFIGURATIONS), choices=list(CONFIGURATIONS))
+    parser.add_argument("--k", nargs="+", type=int, default=[1, 2, 3, 5])
+    parser.add_argument("--repeat", type=int, default=5, help="Repeticiones por consulta para medir latencia")
+    parser.add_argument("--output", help="Guardar resultados en JSON")
+    parser.add_argument("--baseline", help="JSON de una ejecución anterior para comparar")
+    args = parser.parse_args()
+
+    with open(args.queries, "r", encoding="utf-8") as f:
+        queries = json.load(f)["queries"]
+
+    print("🔍 Benchmark de recuperación del Chatbot PAC")
+    print(f"   - Consultas etiquetadas: {len(queries)}")
+    print(f"   - Configuraciones: {', '.join(args.configs)}")
+
+    results = []
+    for backend in args.backends:
+        for name in args.configs:
+            results.append(evaluate(backend, name, CONFIGURATIONS[name], queries,
+                                    args.chunks_file, args.k, args.repeat))
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_results(results, args.k, baseline)
+
+    if args.output:
+        report = {
+            "timestamp": datetime.now().isoformat(),
+            "commit": git_commit(),
+            "chunks_file": args.chunks_file,
+            "queries": len(queries),
+            "results": results
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Resultados guardados en: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
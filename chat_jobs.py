@@ -0,0 +1,296 @@
+"""
+Modo asíncrono del chat: trabajos con consulta de estado y callback
+POST /api/chat/jobs encola la pregunta y retorna un ID de inmediato; un pool
+acotado de hilos ejecuta el pipeline de chat y guarda el resultado en una
+base SQLite compartida por los workers de gunicorn (con TTL y tamaño máximo),
+de modo que GET /api/chat/jobs/<id> funciona desde cualquier worker.
+Opcionalmente el resultado se envía por POST a una URL de callback; salvo que
+el host esté en la lista permitida, solo se aceptan hosts que resuelven a
+direcciones públicas (no loopback, redes privadas, link-local ni reservadas).
+"""
+
+import hashlib
+import hmac
+import ipaddress
+import json
+import logging
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Sequence
+from urllib.parse import urlparse
+
+import requests
+
+import request_timing
+from logging_config import get_request_id, set_request_id
+
+logger = logging.getLogger(__name__)
+
+FINISHED = ('completed', 'failed')
+
+
+class JobQueueFull(Exception):
+    """Hay demasiados trabajos pendientes en este proceso"""
+
+
+def check_callback_url(url: str, allowed_hosts: Sequence[str] = ()) -> Optional[str]:
+    """
+    Validar una URL de callback
+
+    Con `allowed_hosts` el host debe estar en la lista. Sin lista, el host se
+    resuelve y se rechaza si alguna de sus direcciones no es pública, para
+    que el callback no sirva para sondear la red interna ni los metadatos de
+    la nube (169.254.169.254).
+
+    Args:
+        url: URL de callback
+        allowed_hosts: Hosts permitidos (vacío: cualquier host público)
+
+    Returns:
+        Mensaje de error, o None si la URL es aceptable
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+        return 'callback_url debe ser una URL http(s) válida'
+    if allowed_hosts:
+        if parsed.hostname not in allowed_hosts:
+            return f'Host de callback no permitido: {parsed.hostname}'
+        return None
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(parsed.hostname, parsed.port or None,
+                                                                proto=socket.IPPROTO_TCP)}
+    except (socket.gaierror, UnicodeError, ValueError):
+        return f'No se pudo resolver el host de callback: {parsed.hostname}'
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split('%', 1)[0])
+        ip = getattr(ip, 'ipv4_mapped', None) or ip
+        if not ip.is_global or ip.is_multicast:
+            return f'Host de callback no permitido: {parsed.hostname}'
+    return None
+
+
+class JobStore:
+    PURGE_EVERY = 50
+
+    def __init__(self, db_path: str, ttl: float = 3600.0, max_jobs: int = 1000):
+        """
+        Inicializar almacén de trabajos
+
+        Args:
+            db_path: Base SQLite compartida entre procesos
+            ttl: Segundos que se conserva un trabajo desde su creación
+            max_jobs: Trabajos máximos almacenados (se eliminan primero los más antiguos)
+        """
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self._local = threading.local()
+        self._writes = 0
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, status TEXT NOT NULL, created REAL NOT NULL, data TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_created ON jobs (created)")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def save(self, job: Dict[str, Any]):
+        """Crear o reemplazar un trabajo"""
+        conn = self._connection()
+        conn.execute(
+            'INSERT OR REPLACE INTO jobs (id, status, created, data) VALUES (?, ?, ?, ?)',
+            (job['job_id'], job['status'], job['created'], json.dumps(job, ensure_ascii=False))
+        )
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            self.purge()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute(
+            'SELECT data FROM jobs WHERE id = ? AND created >= ?', (job_id, time.time() - self.ttl)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def purge(self):
+        """Eliminar trabajos vencidos y los más antiguos si se supera max_jobs"""
+        conn = self._connection()
+        conn.execute('DELETE FROM jobs WHERE created < ?', (time.time() - self.ttl,))
+        conn.execute(
+            'DELETE FROM jobs WHERE id IN (SELECT id FROM jobs ORDER BY created DESC LIMIT -1 OFFSET ?)',
+            (self.max_jobs,)
+        )
+
+    def count(self) -> int:
+        return self._connection().execute('SELECT COUNT(*) FROM jobs').fetchone()[0]
+
+
+class ChatJobManager:
+    def __init__(self, handler: Callable[[Dict[str, Any]], Dict[str, Any]], store: JobStore,
+                 max_workers: int = 4, max_pending: int = 64, callback_timeout: float = 5.0,
+                 callback_retries: int = 2, callback_secret: str = '',
+                 callback_allowed_hosts: Sequence[str] = ()):
+        """
+        Inicializar gestor de trabajos
+
+        Args:
+            handler: Función que procesa el payload y retorna el resultado (el pipeline de chat)
+            store: Almacén compartido de trabajos
+            max_workers: Hilos que ejecutan trabajos en este proceso
+            max_pending: Trabajos en cola o en curso permitidos en este proceso
+            callback_timeout: Timeout de cada intento de callback
+            callback_retries: Reintentos del callback ante errores
+            callback_secret: Clave para firmar el callback (cabecera X-PAC-Signature)
+            callback_allowed_hosts: Hosts de callback permitidos (vacío: cualquier host público)
+        """
+        self.handler = handler
+        self.store = store
+        self.max_pending = max_pending
+        self.callback_timeout = callback_timeout
+        self.callback_retries = callback_retries
+        self.callback_secret = callback_secret
+        self.callback_allowed_hosts = callback_allowed_hosts
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='chat-job')
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'rejected': 0,
+                      'callbacks_delivered': 0, 'callbacks_failed': 0}
+
+    def _count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def submit(self, payload: Dict[str, Any], callback_url: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Encolar un trabajo
+
+        Returns:
+            El trabajo recién creado (estado 'queued')
+
+        Raises:
+            JobQueueFull: Si ya hay max_pending trabajos pendientes en este proceso
+        """
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.stats['rejected'] += 1
+                raise JobQueueFull(f'Hay {self.pending} trabajos pendientes')
+            self.pending += 1
+            self.stats['submitted'] += 1
+
+        now = time.time()
+        job = {
+            'job_id': uuid.uuid4().hex,
+            'status': 'queued',
+            'created': now,
+            'created_at': datetime.fromtimestamp(now).isoformat(),
+            'request_id': get_request_id(),
+            'callback': {'url': callback_url, 'status': 'pending', 'attempts': 0} if callback_url else None
+        }
+        try:
+            self.store.save(job)
+            self._executor.submit(self._run, dict(job), payload)
+        except Exception:
+            with self._lock:
+                self.pending -= 1
+            raise
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(job_id)
+
+    def _run(self, job: Dict[str, Any], payload: Dict[str, Any]):
+        set_request_id(job['request_id'])
+        timings = request_timing.begin()
+        try:
+            job['status'] = 'running'
+            job['started_at'] = datetime.now().isoformat()
+            self.store.save(job)
+            try:
+                job['result'] = self.handler(payload)
+                job['status'] = 'completed'
+            except Exception as e:
+                job['status'] = 'failed'
+                job['error_type'] = type(e).__name__
+                retry_after = getattr(e, 'retry_after', None)
+                if retry_after is not None:
+                    job['retry_after'] = max(1, int(round(retry_after)))
+                # El trabajo es visible para quien tenga el ID (y va en el callback): el detalle
+                # de la excepción (OpenAI, errores internos) solo va al log
+                job['error'] = 'Servicio saturado, reintentar más tarde' if retry_after is not None \
+                    else 'Error procesando la pregunta'
+                logger.warning("Trabajo de chat fallido: %s", str(e),
+                               extra={'job_id': job['job_id'], 'error_type': job['error_type']})
+            job['completed_at'] = datetime.now().isoformat()
+            job['timings_ms'] = timings.to_dict()
+            self._count(job['status'])
+            self.store.save(job)
+
+            if job['callback']:
+                self._deliver_callback(job)
+                self.store.save(job)
+        except Exception:
+            logger.exception("Error interno ejecutando trabajo de chat", extra={'job_id': job['job_id']})
+        finally:
+            request_timing.end()
+            set_request_id(None)
+            with self._lock:
+                self.pending -= 1
+
+    def _deliver_callback(self, job: Dict[str, Any]):
+        """Enviar el trabajo terminado por POST a la URL de callback, con reintentos"""
+        callback = job['callback']
+        body = json.dumps({k: v for k, v in job.items() if k != 'callback'}, ensure_ascii=False).encode('utf-8')
+        headers = {'Content-Type': 'application/json', 'X-Request-ID': job['request_id'] or ''}
+        if self.callback_secret:
+            headers['X-PAC-Signature'] = 'sha256=' + hmac.new(
+                self.callback_secret.encode('utf-8'), body, hashlib.sha256
+            ).hexdigest()
+
+        for attempt in range(self.callback_retries + 1):
+            # Se valida de nuevo en cada intento: el DNS del host pudo cambiar desde que se aceptó
+            error = check_callback_url(callback['url'], self.callback_allowed_hosts)
+            if error:
+                logger.warning("Callback rechazado: %s", error, extra={'job_id': job['job_id']})
+                break
+            callback['attempts'] = attempt + 1
+            try:
+                # Sin seguir redirecciones, que podrían apuntar a un host interno
+                response = requests.post(callback['url'], data=body, headers=headers,
+                                         timeout=self.callback_timeout, allow_redirects=False)
+                callback['http_status'] = response.status_code
+                if response.status_code < 500:
+                    break
+            except requests.RequestException as e:
+                # El detalle solo va al log: el estado del trabajo es público para quien tenga el ID
+                logger.warning("Error enviando callback (intento %d): %s", attempt + 1, str(e),
+                               extra={'job_id': job['job_id']})
+            if attempt < self.callback_retries:
+                time.sleep(min(8.0, 0.5 * (2 ** attempt)))
+
+        delivered = 200 <= callback.get('http_status', 0) < 300
+        callback['status'] = 'delivered' if delivered else 'failed'
+        self._count('callbacks_delivered' if delivered else 'callbacks_failed')
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            pending = self.pending
+        return {
+            'pending': pending,
+            'max_pending': self.max_pending,
+            'stored': self.store.count(),
+            'ttl': self.store.ttl,
+            'stats': stats
+        }
@@ -0,0 +1,262 @@
+"""
+Formato compacto en disco para los chunks del curso PAC
+El archivo tiene un bloque de contenido (el texto de cada chunk en UTF-8,
+uno tras otro) y un índice JSON pequeño con el ID, los tokens, el offset y
+la longitud de cada chunk y sus metadatos (deduplicados por PDF). Se abre
+con mmap y el texto de un chunk solo se decodifica cuando se accede a él,
+así que el tiempo de carga y la memoria residente dependen del número de
+chunks y no del tamaño del texto.
+
+Estructura:
+    b"PACCHNK1" | offset del índice (uint64 little-endian) | contenido | índice JSON
+
+Conversión desde y hacia el JSON de pdf_preprocessor.py:
+    python chunk_store.py to-store pdf_chunks.json pdf_chunks.pacchunks
+    python chunk_store.py to-json pdf_chunks.pacchunks pdf_chunks.json
+"""
+
+import argparse
+import json
+import mmap
+import os
+import struct
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, Iterator, List, Union
+
+MAGIC = b"PACCHNK1"
+FORMAT_VERSION = 1
+_PREFIX = struct.Struct("<8sQ")
+
+
+def iter_json_chunks(path: str, block_size: int = 1 << 16) -> Iterator[Dict[str, Any]]:
+    """Leer un arreglo JSON de chunks elemento por elemento, sin cargarlo completo"""
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer = ""
+        started = False
+        eof = False
+        while True:
+            buffer = buffer.lstrip()
+            if not started:
+                if not buffer and not eof:
+                    block = f.read(block_size)
+                    eof = not block
+                    buffer += block
+                    continue
+                if not buffer.startswith("["):
+                    raise ValueError(f"{path} no contiene un arreglo JSON")
+                buffer = buffer[1:]
+                started = True
+                continue
+            if buffer.startswith(","):
+                buffer = buffer[1:]
+                continue
+            if buffer.startswith("]"):
+                return
+            try:
+                chunk, end = decoder.raw_decode(buffer)
+            except ValueError:
+                if eof:
+                    raise
+                block = f.read(block_size)
+                eof = not block
+                buffer += block
+                continue
+            yield chunk
+            buffer = buffer[end:]
+
+
+def write_chunk_store(chunks: Iterable[Dict[str, Any]], path: str) -> int:
+    """
+    Escribir chunks en formato compacto (en streaming, de forma atómica)
+
+    Args:
+        chunks: Chunks con al menos "id", "content" y "metadata"
+        path: Archivo de salida
+
+    Returns:
+        Número de chunks escritos
+    """
+    rows: List[list] = []
+    metadata_list: List[Dict[str, Any]] = []
+    metadata_ids: Dict[str, int] = {}
+    key_orders: List[List[str]] = []
+    key_order_ids: Dict[tuple, int] = {}
+
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(_PREFIX.pack(MAGIC, 0))
+            offset = 0
+            for chunk in chunks:
+                content = chunk["content"].encode('utf-8')
+                f.write(content)
+
+                metadata = chunk.get("metadata", {})
+                metadata_key = json.dumps(metadata, ensure_ascii=False, sort_keys=True)
+                if metadata_key not in metadata_ids:
+                    metadata_ids[metadata_key] = len(metadata_list)
+                    metadata_list.append(metadata)
+
+                keys = tuple(chunk.keys())
+                if keys not in key_order_ids:
+                    key_order_ids[keys] = len(key_orders)
+                    key_orders.append(list(keys))
+
+                extra = {k: v for k, v in chunk.items() if k not in ("id", "content", "tokens", "metadata")}
+                rows.append([chunk["id"], chunk.get("tokens", 0), offset, len(content),
+                             metadata_ids[metadata_key], key_order_ids[keys], extra or None])
+                offset += len(content)
+
+            index_offset = f.tell()
+            header = {"version": FORMAT_VERSION, "metadata": metadata_list, "keys": key_orders, "chunks": rows}
+            f.write(json.dumps(header, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+            f.seek(0)
+            f.write(_PREFIX.pack(MAGIC, index_offset))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return len(rows)
+
+
+class LazyChunk(Mapping):
+    """Chunk de un ChunkStore; el texto se decodifica del mmap en cada acceso a "content" """
+    __slots__ = ('_store', '_row')
+
+    def __init__(self, store: 'ChunkStore', row: list):
+        self._store = store
+        self._row = row
+
+    def __getitem__(self, key: str) -> Any:
+        row = self._row
+        if key == "content":
+            return self._store._content(row[2], row[3])
+        if key == "id":
+            return row[0]
+        if key == "tokens":
+            return row[1]
+        if key == "metadata":
+            return self._store.metadata[row[4]]
+        if row[6] and key in row[6]:
+            return row[6][key]
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._store.key_orders[self._row[5]])
+
+    def __len__(self) -> int:
+        return len(self._store.key_orders[self._row[5]])
+
+    def copy(self) -> Dict[str, Any]:
+        """Diccionario normal con el texto decodificado (los metadatos también se copian)"""
+        chunk = {key: self[key] for key in self}
+        if "metadata" in chunk:
+            chunk["metadata"] = dict(chunk["metadata"])
+        return chunk
+
+    def __repr__(self) -> str:
+        return f"LazyChunk({self._row[0]!r})"
+
+
+class ChunkStore:
+    def __init__(self, path: str):
+        """
+        Abrir un archivo de chunks compacto
+
+        Args:
+            path: Archivo generado con write_chunk_store()
+
+        Raises:
+            ValueError: Si el archivo no tiene el formato esperado
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, index_offset = _PREFIX.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{path} no es un archivo de chunks compacto")
+        header = json.loads(self._mmap[index_offset:].decode('utf-8'))
+        if header.get("version") != FORMAT_VERSION:
+            self._mmap.close()
+            raise ValueError(f"Versión de formato no soportada: {header.get('version')}")
+        self._base = _PREFIX.size
+        self.metadata: List[Dict[str, Any]] = header["metadata"]
+        self.key_orders: List[List[str]] = header["keys"]
+        self._chunks = [LazyChunk(self, row) for row in header["chunks"]]
+
+    def _content(self, offset: int, length: int) -> str:
+        start = self._base + offset
+        return self._mmap[start:start + length].decode('utf-8')
+
+    def __len__(self) -> int:
+        return len(self._chunks)
+
+    def __getitem__(self, index):
+        return self._chunks[index]
+
+    def __iter__(self) -> Iterator[LazyChunk]:
+        return iter(self._chunks)
+
+    def __bool__(self) -> bool:
+        return bool(self._chunks)
+
+    def close(self):
+        self._mmap.close()
+
+
+def is_chunk_store(path: str) -> bool:
+    """Indicar si el archivo está en formato compacto (según su encabezado)"""
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def load_chunks(path: str) -> Union[ChunkStore, List[Dict[str, Any]]]:
+    """Cargar chunks en formato compacto (ChunkStore) o JSON (lista de diccionarios)"""
+    if is_chunk_store(path):
+        return ChunkStore(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def json_to_store(json_path: str, store_path: str) -> int:
+    """Convertir el JSON de chunks al formato compacto"""
+    return write_chunk_store(iter_json_chunks(json_path), store_path)
+
+
+def store_to_json(store_path: str, json_path: str) -> int:
+    """Convertir un archivo compacto al JSON de chunks (mismo formato que pdf_preprocessor.py)"""
+    store = ChunkStore(store_path)
+    tmp_path = json_path + ".tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write("[")
+            for i, chunk in enumerate(store):
+                text = json.dumps(chunk.copy(), ensure_ascii=False, indent=2).replace("\n", "\n  ")
+                f.write(("," if i else "") + "\n  " + text)
+            f.write("\n]" if len(store) else "]")
+        os.replace(tmp_path, json_path)
+    finally:
+        store.close()
+    return len(store)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Conversión entre pdf_chunks.json y el formato compacto")
+    parser.add_argument("command", choices=["to-store", "to-json"])
+    parser.add_argument("source")
+    parser.add_argument("target")
+    args = parser.parse_args()
+
+    if args.command == "to-store":
+        count = json_to_store(args.source, args.target)
+    else:
+        count = store_to_json(args.source, args.target)
+    print(f"✅ {count} chunks convertidos: {args.source} -> {args.target}")
+    print(f"   - Tamaño: {os.path.getsize(args.source)} -> {os.path.getsize(args.target)} bytes")
+
+
+if __name__ == "__main__":
+    main()
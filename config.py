@@ -5,6 +5,7 @@ Plan de Aseguramiento de la Calidad en Construcción
 
 import os
 from dotenv import load_dotenv
+from prompt_registry import registry as prompt_registry
 
 # Cargar variables de entorno
 load_dotenv()
@@ -26,25 +27,16 @@ class Config:
     # Configuración del chatbot
     MAX_CONVERSATION_HISTORY = int(os.getenv('MAX_CONVERSATION_HISTORY', '20'))
     MAX_PDF_CONTENT_LENGTH = int(os.getenv('MAX_PDF_CONTENT_LENGTH', '40000'))
+    # Caché del texto extraído de los PDFs (compartida con pdf_preprocessor.py)
+    PAGE_CACHE_DIR = os.getenv('PAGE_CACHE_DIR', '.page_cache')
     
     # Contexto del curso PAC
     PAC_CONTEXT = ""
     
     @classmethod
     def load_prompt_from_file(cls):
-        """Cargar el prompt del sistema desde archivo"""
-        try:
-            with open('prompt_sistema.txt', 'r', encoding='utf-8') as file:
-                return file.read()
-        except FileNotFoundError:
-            # Prompt de respaldo si no se encuentra el archivo
-            return """
-            Eres un asistente educativo especializado en el Plan de Aseguramiento de la Calidad en Construcción (PAC).
-            Responde basándote SOLO en el contenido de los PDFs del curso.
-            Cita definiciones textuales cuando sea posible.
-            Menciona siempre la unidad específica del curso.
-            Mantén las respuestas concisas y específicas.
-            """
+        """Cargar el prompt del sistema (en caché; se recarga si cambia el archivo)"""
+        return prompt_registry.get().text
     
     # Preguntas frecuentes sugeridas
     SUGGESTED_QUESTIONS = [
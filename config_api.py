@@ -3,11 +3,21 @@ Configuración para la API del Chatbot PAC para LMS
 """
 
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # Cargar variables de entorno
 load_dotenv()
 
+def parse_key_values(value, cast=float):
+    """Convertir 'curso_a:2,curso_b:1' en {'curso_a': 2.0, 'curso_b': 1.0}"""
+    result = {}
+    for item in (value or '').split(','):
+        if ':' in item:
+            key, raw = item.rsplit(':', 1)
+            result[key.strip()] = cast(raw.strip())
+    return result
+
 class APIConfig:
     """Configuración de la API para LMS"""
     
@@ -21,24 +31,91 @@ class APIConfig:
     OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo')
     OPENAI_MAX_TOKENS = int(os.getenv('OPENAI_MAX_TOKENS', '500'))
     OPENAI_TEMPERATURE = float(os.getenv('OPENAI_TEMPERATURE', '0.7'))
-    
+    # URL base alternativa (p. ej. fake_openai_server.py para pruebas sin conexión)
+    OPENAI_API_BASE = os.getenv('OPENAI_API_BASE', '')
+
+    # Configuración de resiliencia del cliente OpenAI
+    OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', '20'))          # segundos por intento
+    OPENAI_DEADLINE = float(os.getenv('OPENAI_DEADLINE', '45'))        # segundos totales con reintentos
+    OPENAI_MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', '2'))
+    OPENAI_BACKOFF_BASE = float(os.getenv('OPENAI_BACKOFF_BASE', '0.5'))
+    OPENAI_BACKOFF_MAX = float(os.getenv('OPENAI_BACKOFF_MAX', '8'))
+    OPENAI_HEDGE_DELAY = float(os.getenv('OPENAI_HEDGE_DELAY', '0'))   # 0 = sin solicitudes hedged
+    CIRCUIT_BREAKER_THRESHOLD = int(os.getenv('CIRCUIT_BREAKER_THRESHOLD', '5'))
+    CIRCUIT_BREAKER_RESET_TIMEOUT = float(os.getenv('CIRCUIT_BREAKER_RESET_TIMEOUT', '30'))
+    ADMISSION_MAX_CONCURRENT = int(os.getenv('ADMISSION_MAX_CONCURRENT', '8'))  # llamadas simultáneas al LLM por proceso
+    ADMISSION_MAX_QUEUE = int(os.getenv('ADMISSION_MAX_QUEUE', '16'))
+    ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', '5'))   # segundos máximos en cola
+    ADMISSION_TENANT_WEIGHTS = parse_key_values(os.getenv('ADMISSION_TENANT_WEIGHTS', ''))      # curso:peso
+    ADMISSION_TENANT_LIMITS = parse_key_values(os.getenv('ADMISSION_TENANT_LIMITS', ''), int)   # curso:máximo simultáneo
+    ADMISSION_TENANT_MAX_CONCURRENT = int(os.getenv('ADMISSION_TENANT_MAX_CONCURRENT', '0'))   # 0 = sin límite por curso
+    ADMISSION_TENANT_MAX_QUEUE = int(os.getenv('ADMISSION_TENANT_MAX_QUEUE', '0'))             # 0 = sin límite por curso
+    ADMISSION_MAX_TENANTS = int(os.getenv('ADMISSION_MAX_TENANTS', '256'))  # cursos sin configuración recordados
+    LLM_FALLBACK_ENABLED = os.getenv('LLM_FALLBACK_ENABLED', 'True').lower() == 'true'
+
+    # Configuración de caché de respuestas
+    ANSWER_CACHE_SIZE = int(os.getenv('ANSWER_CACHE_SIZE', '256'))
+    ANSWER_CACHE_TTL = int(os.getenv('ANSWER_CACHE_TTL', '3600'))      # 1 hour in seconds
+
     # Configuración del chatbot
+    PROMPT_FILE = os.getenv('PROMPT_FILE', 'prompt_sistema.txt')
+    PROMPTS_DIR = os.getenv('PROMPTS_DIR', 'prompts')                  # plantillas por curso/unidad
+    PROMPT_CHECK_INTERVAL = float(os.getenv('PROMPT_CHECK_INTERVAL', '2'))  # segundos entre comprobaciones de mtime
+    CHUNKS_FILE = os.getenv('CHUNKS_FILE', 'pdf_chunks.json')            # JSON o formato compacto (chunk_store.py)
     MAX_PDF_CONTENT_LENGTH = int(os.getenv('MAX_PDF_CONTENT_LENGTH', '15000'))
     MAX_SESSION_HISTORY = int(os.getenv('MAX_SESSION_HISTORY', '20'))
+    HISTORY_TOKEN_BUDGET = int(os.getenv('HISTORY_TOKEN_BUDGET', '1200'))    # tokens de historial por petición
+    HISTORY_DIGEST_QUESTIONS = int(os.getenv('HISTORY_DIGEST_QUESTIONS', '5'))  # preguntas en el resumen
+    FOLLOWUP_RETRIEVAL_ENABLED = os.getenv('FOLLOWUP_RETRIEVAL_ENABLED', 'True').lower() == 'true'
+    FOLLOWUP_MEMORY_CHUNKS = int(os.getenv('FOLLOWUP_MEMORY_CHUNKS', '6'))   # chunks recordados por sesión
+    FOLLOWUP_MIN_SCORE = float(os.getenv('FOLLOWUP_MIN_SCORE', '0.1'))       # similitud mínima para reutilizarlos
     
     # Configuración de seguridad
     CORS_ORIGINS = os.getenv('CORS_ORIGINS', '*').split(',')
     API_KEY_REQUIRED = os.getenv('API_KEY_REQUIRED', 'False').lower() == 'true'
     API_KEY_HEADER = os.getenv('API_KEY_HEADER', 'X-API-Key')
+    ADMIN_API_KEYS = [key for key in os.getenv('ADMIN_API_KEYS', '').split(',') if key]
     
     # Configuración de rate limiting
     RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'True').lower() == 'true'
     RATE_LIMIT_REQUESTS = int(os.getenv('RATE_LIMIT_REQUESTS', '100'))  # requests per hour
     RATE_LIMIT_WINDOW = int(os.getenv('RATE_LIMIT_WINDOW', '3600'))    # 1 hour in seconds
+    RATE_LIMIT_USER_REQUESTS = int(os.getenv('RATE_LIMIT_USER_REQUESTS', '100'))  # por usuario y curso (0 = sin límite)
+    RATE_LIMIT_COURSE_REQUESTS = int(os.getenv('RATE_LIMIT_COURSE_REQUESTS', '0'))  # por curso (0 = sin límite)
+    RATE_LIMIT_DB = os.getenv('RATE_LIMIT_DB', os.path.join(tempfile.gettempdir(), 'pac_rate_limits.db'))
+    TRUSTED_PROXY_HOPS = int(os.getenv('TRUSTED_PROXY_HOPS', '0'))    # proxies delante de la API (Render: 1)
     
     # Configuración de logging
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
     LOG_FILE = os.getenv('LOG_FILE', 'api_pac.log')
+    LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))  # 0 = rotación externa (logrotate)
+    LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '5'))
+    LOG_DEBUG_SAMPLE_RATE = float(os.getenv('LOG_DEBUG_SAMPLE_RATE', '0.1'))  # fracción de peticiones con DEBUG
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+    LOG_TO_STDOUT = os.getenv('LOG_TO_STDOUT', 'True').lower() == 'true'
+    
+    # Configuración de métricas (/api/metrics)
+    METRICS_DIR = os.getenv('METRICS_DIR', '')                         # compartido entre workers de gunicorn
+    METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+    
+    # Configuración de perfilado (cabecera X-Profile o muestreo)
+    PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+    PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))  # fracción de peticiones perfiladas
+    
+    # Configuración de trabajos asíncronos (/api/chat/jobs)
+    JOB_DB = os.getenv('JOB_DB', os.path.join(tempfile.gettempdir(), 'pac_chat_jobs.db'))
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', '4'))                   # hilos por proceso
+    JOB_MAX_PENDING = int(os.getenv('JOB_MAX_PENDING', '64'))          # trabajos en cola por proceso
+    JOB_MAX_STORED = int(os.getenv('JOB_MAX_STORED', '1000'))
+    JOB_TTL = int(os.getenv('JOB_TTL', '3600'))                        # segundos que se conserva el resultado
+    JOB_CALLBACK_TIMEOUT = float(os.getenv('JOB_CALLBACK_TIMEOUT', '5'))
+    JOB_CALLBACK_RETRIES = int(os.getenv('JOB_CALLBACK_RETRIES', '2'))
+    JOB_CALLBACK_SECRET = os.getenv('JOB_CALLBACK_SECRET', '')         # firma HMAC del callback
+    JOB_CALLBACK_ALLOWED_HOSTS = [host for host in os.getenv('JOB_CALLBACK_ALLOWED_HOSTS', '').split(',') if host]
+    
+    # Configuración de lotes (/api/chat/batch)
+    BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '50'))
+    BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', '8'))               # llamadas del lote en paralelo por proceso
     
     # Configuración de sesiones
     SESSION_TIMEOUT = int(os.getenv('SESSION_TIMEOUT', '3600'))  # 1 hour in seconds
@@ -58,6 +135,15 @@ class APIConfig:
         if cls.OPENAI_TEMPERATURE < 0 or cls.OPENAI_TEMPERATURE > 1:
             errors.append("OPENAI_TEMPERATURE debe estar entre 0 y 1")
         
+        if cls.OPENAI_TIMEOUT <= 0 or cls.OPENAI_DEADLINE < cls.OPENAI_TIMEOUT:
+            errors.append("OPENAI_TIMEOUT debe ser positivo y no mayor que OPENAI_DEADLINE")
+
+        if cls.OPENAI_MAX_RETRIES < 0:
+            errors.append("OPENAI_MAX_RETRIES no puede ser negativo")
+
+        if cls.CIRCUIT_BREAKER_THRESHOLD < 1:
+            errors.append("CIRCUIT_BREAKER_THRESHOLD debe ser mayor a 0")
+
         if cls.PORT < 1024 or cls.PORT > 65535:
             errors.append("PORT debe estar entre 1024 y 65535")
         
@@ -67,6 +153,18 @@ class APIConfig:
         if cls.SESSION_TIMEOUT < 300:  # 5 minutes minimum
             errors.append("SESSION_TIMEOUT debe ser al menos 300 segundos")
         
+        if not 0 <= cls.LOG_DEBUG_SAMPLE_RATE <= 1:
+            errors.append("LOG_DEBUG_SAMPLE_RATE debe estar entre 0 y 1")
+        
+        if cls.JOB_WORKERS < 1:
+            errors.append("JOB_WORKERS debe ser mayor a 0")
+        
+        if cls.HISTORY_TOKEN_BUDGET < 0:
+            errors.append("HISTORY_TOKEN_BUDGET no puede ser negativo")
+        
+        if not 0 <= cls.PROFILE_SAMPLE_RATE <= 1:
+            errors.append("PROFILE_SAMPLE_RATE debe estar entre 0 y 1")
+        
         return errors
 
 # Configuración de desarrollo
@@ -104,6 +202,7 @@ class TestingAPIConfig(APIConfig):
     DEBUG = True
     OPENAI_API_KEY = 'test_key'
     RATE_LIMIT_ENABLED = False
+    LOG_FILE = ''
 
 # Diccionario de configuraciones
 api_config = {
@@ -0,0 +1,188 @@
+"""
+Limpieza de texto repetido para el preprocesamiento del curso PAC
+- HeaderFooterStripper: elimina encabezados y pies de página que se repiten
+  en las páginas de un PDF (título del curso, número de página).
+- NearDuplicateIndex: detecta chunks casi idénticos con MinHash y LSH para
+  no indexar dos veces el mismo contenido.
+"""
+
+import re
+import zlib
+from collections import Counter
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+_WHITESPACE = re.compile(r'\s+')
+_DIGITS = re.compile(r'\d+')
+_WORD = re.compile(r'\w+')
+
+# Primo de Mersenne 2^61 - 1 para las permutaciones (a * x + b) mod p
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def normalize_line(line: str) -> str:
+    """Forma canónica de una línea para compararla entre páginas (los números cuentan como iguales)"""
+    return _DIGITS.sub('#', _WHITESPACE.sub(' ', line).strip().lower())
+
+
+class HeaderFooterStripper:
+    def __init__(self, sample_pages: int = 8, min_fraction: float = 0.5, edge_lines: int = 3,
+                 min_pages: int = 3, min_inner_length: int = 20,
+                 count_tokens: Optional[Callable[[str], int]] = None):
+        """
+        Inicializar eliminador de encabezados y pies de página
+
+        Args:
+            sample_pages: Páginas iniciales que se usan para aprender las líneas repetidas
+            min_fraction: Fracción de esas páginas en que debe aparecer una línea
+            edge_lines: Líneas no vacías al inicio y al final de cada página que se revisan
+            min_pages: Páginas mínimas para aprender (documentos más cortos no se tocan)
+            min_inner_length: Largo mínimo de una línea repetida para quitarla fuera de los bordes
+            count_tokens: Función para contar los tokens eliminados (opcional)
+        """
+        self.sample_pages = sample_pages
+        self.min_fraction = min_fraction
+        self.edge_lines = edge_lines
+        self.min_pages = min_pages
+        self.min_inner_length = min_inner_length
+        self.count_tokens = count_tokens
+        self.stats = {'lines_removed': 0, 'chars_removed': 0, 'tokens_removed': 0}
+
+    def _edge_indices(self, lines: List[str]) -> List[int]:
+        non_empty = [i for i, line in enumerate(lines) if line.strip()]
+        return sorted(set(non_empty[:self.edge_lines] + non_empty[-self.edge_lines:]))
+
+    def learn(self, pages: List[str]) -> set:
+        """Líneas de borde que se repiten en al menos min_fraction de las páginas"""
+        if len(pages) < self.min_pages:
+            return set()
+        counts = Counter()
+        for page in pages:
+            lines = page.split('\n')
+            counts.update({normalize_line(lines[i]) for i in self._edge_indices(lines)})
+        threshold = max(2, self.min_fraction * len(pages))
+        return {line for line, count in counts.items() if line and count >= threshold}
+
+    def strip_page(self, page: str, repeated: set) -> str:
+        """Quitar las líneas repetidas de los bordes de la página (y las largas en cualquier posición)"""
+        if not repeated:
+            return page
+        lines = page.split('\n')
+        remove = {i for i in self._edge_indices(lines) if normalize_line(lines[i]) in repeated}
+        # El extractor a veces deja el pie en medio de la página (tablas, imágenes):
+        # las líneas repetidas largas se quitan también fuera de los bordes
+        remove.update(i for i, line in enumerate(lines)
+                      if len(line.strip()) >= self.min_inner_length and normalize_line(line) in repeated)
+        if not remove:
+            return page
+        for i in remove:
+            self.stats['lines_removed'] += 1
+            self.stats['chars_removed'] += len(lines[i])
+            if self.count_tokens:
+                self.stats['tokens_removed'] += self.count_tokens(lines[i])
+        return '\n'.join(line for i, line in enumerate(lines) if i not in remove)
+
+    def strip_pages(self, pages: Iterable[str]) -> Iterator[str]:
+        """
+        Quitar encabezados y pies de las páginas de un documento, en streaming
+
+        Solo se retienen en memoria las primeras `sample_pages` páginas mientras
+        se aprenden las líneas repetidas.
+        """
+        pages = iter(pages)
+        sample = []
+        for page in pages:
+            sample.append(page)
+            if len(sample) >= self.sample_pages:
+                break
+        repeated = self.learn(sample)
+        for page in sample:
+            yield self.strip_page(page, repeated)
+        for page in pages:
+            yield self.strip_page(page, repeated)
+
+
+class NearDuplicateIndex:
+    def __init__(self, threshold: float = 0.85, num_perm: int = 64, bands: int = 16,
+                 shingle_size: int = 5, seed: int = 1):
+        """
+        Inicializar índice de casi duplicados (MinHash + LSH)
+
+        Args:
+            threshold: Similitud de Jaccard estimada a partir de la cual dos chunks son duplicados
+            num_perm: Permutaciones de la firma MinHash
+            bands: Bandas LSH (num_perm debe ser divisible por bands)
+            shingle_size: Palabras por shingle
+            seed: Semilla de las permutaciones (fija para que el resultado sea reproducible)
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm debe ser divisible por bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        # a < 2^29 y x < 2^32: a * x + b cabe en uint64 sin desbordar
+        self._a = rng.randint(1, 1 << 29, size=num_perm).astype(np.uint64)
+        self._b = rng.randint(0, 1 << 29, size=num_perm).astype(np.uint64)
+        self._buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(bands)]
+        self._signatures: List[np.ndarray] = []
+        self._ids: List[str] = []
+        self.stats = {'checked': 0, 'duplicates': 0, 'tokens_removed': 0}
+
+    def signature(self, text: str) -> np.ndarray:
+        """Firma MinHash del texto (shingles de palabras en minúsculas)"""
+        words = _WORD.findall(text.lower())
+        size = self.shingle_size
+        if len(words) <= size:
+            shingles = {' '.join(words)}
+        else:
+            shingles = {' '.join(words[i:i + size]) for i in range(len(words) - size + 1)}
+        hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles), dtype=np.uint64,
+                             count=len(shingles))
+        permuted = (np.outer(self._a, hashes) + self._b[:, None]) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=1)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def find(self, signature: np.ndarray) -> Optional[str]:
+        """ID del chunk indexado más parecido si supera el umbral, o None"""
+        candidates = set()
+        for band, key in enumerate(self._band_keys(signature)):
+            candidates.update(self._buckets[band].get(key, ()))
+        best, best_score = None, self.threshold
+        for index in sorted(candidates):
+            score = float(np.mean(self._signatures[index] == signature))
+            if score >= best_score:
+                best, best_score = index, score
+        return self._ids[best] if best is not None else None
+
+    def add(self, chunk_id: str, signature: np.ndarray):
+        index = len(self._ids)
+        self._ids.append(chunk_id)
+        self._signatures.append(signature)
+        for band, key in enumerate(self._band_keys(signature)):
+            self._buckets[band].setdefault(key, []).append(index)
+
+    def check(self, chunk_id: str, text: str, tokens: int = 0,
+              signature: Optional[np.ndarray] = None) -> Optional[str]:
+        """
+        Verificar un chunk nuevo: si duplica a uno ya indexado retorna el ID de
+        ese chunk; si no, lo agrega al índice y retorna None
+
+        La firma puede venir ya calculada (p. ej. en otro proceso con los mismos parámetros).
+        """
+        self.stats['checked'] += 1
+        if signature is None:
+            signature = self.signature(text)
+        duplicate_of = self.find(signature)
+        if duplicate_of is not None:
+            self.stats['duplicates'] += 1
+            self.stats['tokens_removed'] += tokens
+            return duplicate_of
+        self.add(chunk_id, signature)
+        return None
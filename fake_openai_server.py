@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Servidor local que imita la API de chat completions de OpenAI
+Permite probar y hacer pruebas de carga de la API del Chatbot PAC sin conexión
+ni costo, con latencia, velocidad de tokens y tasa de errores configurables,
+y grabación/reproducción de respuestas reales.
+
+Uso:
+    python fake_openai_server.py --port 8001 --latency lognormal:0.8,0.5 --token-rate 40
+    OPENAI_API_BASE=http://localhost:8001/v1 OPENAI_API_KEY=sk-fake python api_lms.py
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import threading
+import time
+import uuid
+
+import requests
+from flask import Flask, Response, jsonify, request, stream_with_context
+from dotenv import load_dotenv
+
+# Cargar variables de entorno
+load_dotenv()
+
+app = Flask(__name__)
+
+
+class LatencyDistribution:
+    """Distribución de latencia descrita como 'tipo:param1,param2'"""
+
+    def __init__(self, spec: str = "fixed:0"):
+        """
+        Args:
+            spec: fixed:s | uniform:min,max | normal:media,desv | lognormal:mediana,sigma
+        """
+        self.spec = spec
+        kind, _, params = spec.partition(':')
+        self.kind = kind.strip().lower()
+        self.params = [float(p) for p in params.split(',') if p.strip()] or [0.0]
+        if self.kind not in ('fixed', 'uniform', 'normal', 'lognormal'):
+            raise ValueError(f"Distribución de latencia no soportada: {spec}")
+
+    def sample(self) -> float:
+        """Obtener una latencia en segundos"""
+        p = self.params
+        if self.kind == 'fixed':
+            value = p[0]
+        elif self.kind == 'uniform':
+            value = random.uniform(p[0], p[1] if len(p) > 1 else p[0])
+        elif self.kind == 'normal':
+            value = random.gauss(p[0], p[1] if len(p) > 1 else 0.0)
+        else:
+            # La mediana de una lognormal es exp(mu)
+            value = random.lognormvariate(math.log(max(p[0], 1e-6)), p[1] if len(p) > 1 else 0.5)
+        return max(0.0, value)
+
+
+class FakeOpenAIConfig:
+    """Comportamiento simulado del proveedor"""
+
+    def __init__(self):
+        self.mode = os.getenv('FAKE_OPENAI_MODE', 'synthetic')             # synthetic | record | replay
+        self.latency = LatencyDistribution(os.getenv('FAKE_OPENAI_LATENCY', 'fixed:0.2'))
+        self.token_rate = float(os.getenv('FAKE_OPENAI_TOKEN_RATE', '50'))  # tokens por segundo
+        self.error_rate = float(os.getenv('FAKE_OPENAI_ERROR_RATE', '0'))
+        self.error_codes = [int(c) for c in os.getenv('FAKE_OPENAI_ERROR_CODES', '500,503,429').split(',')]
+        self.hang_rate = float(os.getenv('FAKE_OPENAI_HANG_RATE', '0'))    # simula timeouts
+        self.hang_seconds = float(os.getenv('FAKE_OPENAI_HANG_SECONDS', '120'))
+        self.cassette = os.getenv('FAKE_OPENAI_CASSETTE', 'openai_cassette.jsonl')
+        self.upstream_base = os.getenv('FAKE_OPENAI_UPSTREAM_BASE', 'https://api.openai.com/v1')
+        self.upstream_key = os.getenv('FAKE_OPENAI_UPSTREAM_KEY', os.getenv('OPENAI_API_KEY', ''))
+
+    def to_dict(self):
+        return {
+            'mode': self.mode,
+            'latency': self.latency.spec,
+            'token_rate': self.token_rate,
+            'error_rate': self.error_rate,
+            'error_codes': self.error_codes,
+            'hang_rate': self.hang_rate,
+            'hang_seconds': self.hang_seconds,
+            'cassette': self.cassette
+        }
+
+    def update(self, data):
+        """Actualizar configuración en caliente (POST /_fake/config)"""
+        if 'mode' in data:
+            self.mode = data['mode']
+        if 'latency' in data:
+            self.latency = LatencyDistribution(data['latency'])
+        for key in ('token_rate', 'error_rate', 'hang_rate', 'hang_seconds'):
+            if key in data:
+                setattr(self, key, float(data[key]))
+        if 'error_codes' in data:
+            self.error_codes = [int(c) for c in data['error_codes']]
+        if 'cassette' in data:
+            self.cassette = data['cassette']
+
+
+class Cassette:
+    """Respuestas grabadas en JSONL, indexadas por hash de la petición"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries[entry['key']] = entry['response']
+
+    @staticmethod
+    def request_key(body) -> str:
+        relevant = {'model': body.get('model'), 'messages': body.get('messages')}
+        return hashlib.sha256(json.dumps(relevant, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def get(self, body):
+        return self.entries.get(self.request_key(body))
+
+    def record(self, body, response):
+        key = self.request_key(body)
+        with self._lock:
+            self.entries[key] = response
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'key': key, 'request': body, 'response': response}, ensure_ascii=False) + '\n')
+
+
+fake_config = FakeOpenAIConfig()
+cassette = Cassette(fake_config.cassette)
+stats_lock = threading.Lock()
+stats = {'requests': 0, 'streamed': 0, 'errors_injected': 0, 'hangs_injected': 0,
+         'replayed': 0, 'recorded': 0, 'synthetic': 0}
+
+
+def count(key):
+    with stats_lock:
+        stats[key] += 1
+
+
+def approx_tokens(text: str) -> int:
+    """Aproximación de tokens sin tokenizador (~4 caracteres por token)"""
+    return max(1, len(text) // 4) if text else 0
+
+
+def synthetic_answer(body) -> str:
+    """Generar una respuesta plausible a partir del contexto del prompt"""
+    messages = body.get('messages') or []
+    question = next((m.get('content', '') for m in reversed(messages) if m.get('role') == 'user'), '')
+    system = next((m.get('content', '') for m in messages if m.get('role') == 'system'), '')
+
+    # Reutilizar el contenido recuperado del curso si viene en el prompt
+    context = ''
+    marker = 'Contenido:'
+    if marker in system:
+        context = system.split(marker, 1)[1].strip()
+    words = (context or "El contenido del curso PAC describe este tema en detalle.").split()
+
+    max_words = int(int(body.get('max_tokens') or 300) * 0.75)
+    answer = f"Respuesta simulada a: {question.strip()} Según el curso (Unidad 1): " + ' '.join(words)
+    return ' '.join(answer.split()[:max_words])
+
+
+def completion_payload(body, content: str):
+    prompt_text = ''.join(m.get('content', '') for m in body.get('messages') or [])
+    prompt_tokens = approx_tokens(prompt_text)
+    completion_tokens = approx_tokens(content)
+    return {
+        'id': f"chatcmpl-fake-{uuid.uuid4().hex[:24]}",
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': body.get('model', 'gpt-3.5-turbo'),
+        'choices': [{
+            'index': 0,
+            'message': {'role': 'assistant', 'content': content},
+            'finish_reason': 'stop'
+        }],
+        'usage': {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens
+        }
+    }
+
+
+def error_response(status: int):
+    error_types = {429: 'rate_limit_exceeded', 500: 'server_error', 503: 'server_error'}
+    response = jsonify({'error': {
+        'message': f'Error simulado por el servidor falso ({status})',
+        'type': error_types.get(status, 'server_error'),
+        'param': None,
+        'code': None
+    }})
+    if status == 429:
+        response.headers['Retry-After'] = '1'
+    return response, status
+
+
+def upstream_completion(body):
+    """Reenviar la petición a OpenAI real (modo record)"""
+    upstream = requests.post(
+        f"{fake_config.upstream_base.rstrip('/')}/chat/completions",
+        headers={'Authorization': f"Bearer {fake_config.upstream_key}"},
+        json={**body, 'stream': False},
+        timeout=120
+    )
+    upstream.raise_for_status()
+    return upstream.json()
+
+
+def resolve_completion(body):
+    """
+    Obtener la respuesta completa según el modo (replay, record o sintético)
+
+    Returns:
+        Tupla (payload, origen) con origen 'replayed', 'recorded' o 'synthetic'
+    """
+    if fake_config.mode in ('replay', 'record'):
+        recorded = cassette.get(body)
+        if recorded is not None:
+            count('replayed')
+            return recorded, 'replayed'
+        if fake_config.mode == 'record':
+            recorded = upstream_completion(body)
+            cassette.record(body, recorded)
+            count('recorded')
+            return recorded, 'recorded'
+    count('synthetic')
+    return completion_payload(body, synthetic_answer(body)), 'synthetic'
+
+
+def stream_chunks(payload):
+    """Emitir la respuesta como Server-Sent Events al ritmo de token_rate"""
+    content = payload['choices'][0]['message']['content']
+    base = {'id': payload['id'], 'object': 'chat.completion.chunk',
+            'created': payload['created'], 'model': payload['model']}
+    delay = 1.0 / fake_config.token_rate if fake_config.token_rate > 0 else 0.0
+
+    first = {**base, 'choices': [{'index': 0, 'delta': {'role': 'assistant'}, 'finish_reason': None}]}
+    yield f"data: {json.dumps(first, ensure_ascii=False)}\n\n"
+    for i, word in enumerate(content.split(' ')):
+        piece = word if i == 0 else ' ' + word
+        chunk = {**base, 'choices': [{'index': 0, 'delta': {'content': piece}, 'finish_reason': None}]}
+        yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+        if delay:
+            time.sleep(delay * approx_tokens(piece))
+    last = {**base, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]}
+    yield f"data: {json.dumps(last, ensure_ascii=False)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+@app.route('/v1/chat/completions', methods=['POST'])
+@app.route('/chat/completions', methods=['POST'])
+def chat_completions():
+    """Equivalente local de POST /v1/chat/completions"""
+    body = request.get_json(silent=True) or {}
+    count('requests')
+
+    # Tiempo hasta el primer token
+    time.sleep(fake_config.latency.sample())
+
+    if fake_config.hang_rate and random.random() < fake_config.hang_rate:
+        count('hangs_injected')
+        time.sleep(fake_config.hang_seconds)
+
+    if fake_config.error_rate and random.random() < fake_config.error_rate:
+        count('errors_injected')
+        return error_response(random.choice(fake_config.error_codes))
+
+    try:
+        payload, source = resolve_completion(body)
+    except requests.RequestException as e:
+        return jsonify({'error': {'message': f'Error contactando OpenAI: {str(e)}', 'type': 'server_error'}}), 502
+
+    if body.get('stream'):
+        count('streamed')
+        return Response(stream_with_context(stream_chunks(payload)), mimetype='text/event-stream')
+
+    # Sin streaming la generación completa ocurre antes de responder
+    # (una respuesta recién grabada ya pagó la latencia real del proveedor)
+    if fake_config.token_rate > 0 and source != 'recorded':
+        completion_tokens = (payload.get('usage') or {}).get('completion_tokens', 0)
+        time.sleep(completion_tokens / fake_config.token_rate)
+    return jsonify(payload)
+
+
+@app.route('/v1/models', methods=['GET'])
+def list_models():
+    return jsonify({'object': 'list', 'data': [{'id': 'gpt-3.5-turbo', 'object': 'model', 'owned_by': 'fake'}]})
+
+
+@app.route('/_fake/config', methods=['GET', 'POST'])
+def fake_configuration():
+    """Consultar o modificar el comportamiento simulado"""
+    global cassette
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            fake_config.update(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if 'cassette' in data:
+            cassette = Cassette(fake_config.cassette)
+    return jsonify(fake_config.to_dict())
+
+
+@app.route('/_fake/stats', methods=['GET'])
+def fake_stats():
+    with stats_lock:
+        return jsonify({**stats, 'cassette_entries': len(cassette.entries)})
+
+
+def main():
+    """Función principal para iniciar el servidor falso"""
+    global cassette
+    parser = argparse.ArgumentParser(description="Servidor local que imita la API de OpenAI")
+    parser.add_argument('--host', default=os.getenv('FAKE_OPENAI_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('FAKE_OPENAI_PORT', '8001')))
+    parser.add_argument('--mode', choices=['synthetic', 'record', 'replay'], default=fake_config.mode)
+    parser.add_argument('--latency', default=fake_config.latency.spec,
+                        help="fixed:s | uniform:min,max | normal:media,desv | lognormal:mediana,sigma")
+    parser.add_argument('--token-rate', type=float, default=fake_config.token_rate)
+    parser.add_argument('--error-rate', type=float, default=fake_config.error_rate)
+    parser.add_argument('--hang-rate', type=float, default=fake_config.hang_rate)
+    parser.add_argument('--cassette', default=fake_config.cassette)
+    args = parser.parse_args()
+
+    fake_config.update({
+        'mode': args.mode,
+        'latency': args.latency,
+        'token_rate': args.token_rate,
+        'error_rate': args.error_rate,
+        'hang_rate': args.hang_rate,
+        'cassette': args.cassette
+    })
+    cassette = Cassette(fake_config.cassette)
+
+    print("🧪 Servidor OpenAI simulado")
+    print(f"📡 URL: http://{args.host}:{args.port}/v1")
+    print(f"⚙️  Configuración: {json.dumps(fake_config.to_dict(), ensure_ascii=False)}")
+    print("=" * 60)
+
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+"""
+Cliente resiliente para las llamadas a OpenAI (ChatCompletion)
+Timeouts por llamada, reintentos con backoff exponencial con jitter,
+circuit breaker y solicitudes "hedged" opcionales para la latencia de cola
+"""
+
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Dict, Optional
+
+import openai
+
+logger = logging.getLogger(__name__)
+
+class LLMUnavailableError(Exception):
+    """El proveedor LLM no está disponible (circuito abierto o reintentos agotados)"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+# Errores transitorios de openai==0.28.x que vale la pena reintentar
+RETRYABLE_ERRORS = (
+    openai.error.Timeout,
+    openai.error.APIConnectionError,
+    openai.error.RateLimitError,
+    openai.error.ServiceUnavailableError,
+    openai.error.TryAgain,
+)
+
+
+def is_retryable(error: Exception) -> bool:
+    """Determinar si un error de OpenAI es transitorio"""
+    if isinstance(error, openai.error.RateLimitError):
+        # La cuota agotada no se recupera reintentando
+        return getattr(error, 'code', None) != 'insufficient_quota'
+    if isinstance(error, RETRYABLE_ERRORS):
+        return True
+    if isinstance(error, openai.error.APIError):
+        status = getattr(error, 'http_status', None)
+        return status is None or status >= 500
+    return False
+
+
+def _retry_after_hint(error: Exception) -> Optional[float]:
+    """Leer la cabecera Retry-After de una respuesta 429/503, si existe"""
+    headers = getattr(error, 'headers', None) or {}
+    try:
+        value = headers.get('retry-after') or headers.get('Retry-After')
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Inicializar circuit breaker
+
+        Args:
+            failure_threshold: Fallos consecutivos necesarios para abrir el circuito
+            reset_timeout: Segundos en estado abierto antes de permitir una prueba
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.times_opened = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        """Indicar si se puede llamar al proveedor en este momento"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            # Semiabierto: solo una llamada de prueba a la vez
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def retry_after(self) -> float:
+        """Segundos restantes hasta la próxima llamada de prueba"""
+        with self._lock:
+            if self.state != self.OPEN:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            'state': self.state,
+            'consecutive_failures': self.consecutive_failures,
+            'failure_threshold': self.failure_threshold,
+            'times_opened': self.times_opened,
+            'retry_after': round(self.retry_after(), 2)
+        }
+
+
+class ResilientLLMClient:
+    def __init__(self, timeout: float = 20.0, deadline: float = 45.0, max_retries: int = 2,
+                 backoff_base: float = 0.5, backoff_max: float = 8.0,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 hedge_delay: float = 0.0, hedge_workers: int = 8):
+        """
+        Inicializar cliente resiliente
+
+        Args:
+            timeout: Timeout en segundos de cada intento individual
+            deadline: Tiempo máximo total de la llamada incluyendo reintentos
+            max_retries: Reintentos ante errores transitorios
+            backoff_base: Base del backoff exponencial en segundos
+            backoff_max: Espera máxima entre reintentos
+            failure_threshold: Fallos consecutivos para abrir el circuito
+            reset_timeout: Segundos que el circuito permanece abierto
+            hedge_delay: Segundos antes de lanzar una segunda solicitud (0 = desactivado)
+            hedge_workers: Hilos disponibles para solicitudes hedged
+        """
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_delay = hedge_delay
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._executor = ThreadPoolExecutor(max_workers=hedge_workers) if hedge_delay > 0 else None
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            'calls': 0,
+            'successes': 0,
+            'failures': 0,
+            'retries': 0,
+            'timeouts': 0,
+            'short_circuited': 0,
+            'hedged': 0,
+            'hedge_wins': 0
+        }
+
+    def _count(self, key: str, amount: int = 1):
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    def _backoff(self, attempt: int, hint: Optional[float] = None) -> float:
+        """Backoff exponencial con "full jitter"; respeta Retry-After si viene del servidor"""
+        ceiling = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        delay = random.uniform(0, ceiling)
+        if hint is not None:
+            delay = max(delay, min(hint, self.backoff_max))
+        return delay
+
+    def _create(self, params: Dict[str, Any], timeout: float):
+        return openai.ChatCompletion.create(request_timeout=timeout, **params)
+
+    def _hedged_create(self, params: Dict[str, Any], timeout: float):
+        """Lanzar una segunda solicitud si la primera no responde en hedge_delay"""
+        primary = self._executor.submit(self._create, params, timeout)
+        done, _ = wait([primary], timeout=min(self.hedge_delay, timeout))
+        if done:
+            return primary.result()
+
+        self._count('hedged')
+        secondary = self._executor.submit(self._create, params, max(0.1, timeout - self.hedge_delay))
+        pending = {primary, secondary}
+        last_error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                if future is secondary:
+                    self._count('hedge_wins')
+                # La solicitud perdedora no se puede cancelar; su resultado se descarta
+                return result
+        raise last_error
+
+    def chat_completion(self, **params):
+        """
+        Llamar a openai.ChatCompletion.create con deadline, reintentos y circuit breaker
+
+        Args:
+            **params: Parámetros de ChatCompletion (model, messages, max_tokens, ...)
+
+        Returns:
+            Respuesta de OpenAI
+
+        Raises:
+            LLMUnavailableError: Si el circuito está abierto o se agotaron los reintentos
+            openai.error.OpenAIError: Errores no transitorios (autenticación, petición inválida)
+        """
+        self._count('calls')
+        if not self.breaker.allow_request():
+            self._count('short_circuited')
+            logger.debug("Circuito abierto, llamada rechazada")
+            raise LLMUnavailableError('Circuito abierto: proveedor LLM no disponible',
+                                      retry_after=self.breaker.retry_after())
+
+        use_hedge = self._executor is not None and not params.get('stream')
+        deadline_at = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            remaining = deadline_at - time.monotonic()
+            call_timeout = max(0.1, min(self.timeout, remaining))
+            try:
+                if use_hedge:
+                    response = self._hedged_create(params, call_timeout)
+                else:
+                    response = self._create(params, call_timeout)
+                self.breaker.record_success()
+                self._count('successes')
+                return response
+            except Exception as e:
+                if not is_retryable(e):
+                    # Error del cliente: no indica un proveedor degradado
+                    self.breaker.record_success()
+                    raise
+                if isinstance(e, openai.error.Timeout):
+                    self._count('timeouts')
+                self.breaker.record_failure()
+
+                delay = self._backoff(attempt, _retry_after_hint(e))
+                remaining = deadline_at - time.monotonic()
+                if (attempt >= self.max_retries or delay >= remaining
+                        or self.breaker.state == CircuitBreaker.OPEN):
+                    self._count('failures')
+                    raise LLMUnavailableError(
+                        f'Proveedor LLM no disponible tras {attempt + 1} intento(s): {str(e)}',
+                        retry_after=self.breaker.retry_after() or delay
+                    ) from e
+
+                attempt += 1
+                self._count('retries')
+                logger.warning("Error transitorio de OpenAI, reintentando", extra={
+                    'attempt': attempt,
+                    'delay_s': round(delay, 3),
+                    'error': type(e).__name__
+                })
+                time.sleep(delay)
+
+    def get_status(self) -> Dict[str, Any]:
+        """Estado del cliente para /api/status"""
+        with self._stats_lock:
+            stats = dict(self.stats)
+        return {
+            'circuit': self.breaker.get_status(),
+            'timeout': self.timeout,
+            'deadline': self.deadline,
+            'max_retries': self.max_retries,
+            'hedge_delay': self.hedge_delay,
+            'stats': stats
+        }
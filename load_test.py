@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Generador de carga para la API del Chatbot PAC
+Reproduce registros de peticiones (JSONL) o una mezcla sintética de preguntas
+contra /api/chat y /api/course/search, y reporta throughput, percentiles de
+latencia, errores y el desglose por etapa reportado por el servidor
+(cabecera Server-Timing).
+
+Uso:
+    python load_test.py --concurrency 8 --requests 200
+    python load_test.py --input peticiones.jsonl --rate 5 --duration 60 --output resultados.json
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import requests
+
+from config import Config
+from request_timing import parse_server_timing
+
+SEARCH_TERMS = [
+    "PAC",
+    "ISO 9001",
+    "auditoría",
+    "RES 258:2020",
+    "no conformidad",
+    "plan de calidad",
+    "certificación",
+    "control de calidad"
+]
+
+ENDPOINTS = {
+    'chat': '/chat',
+    'search': '/course/search'
+}
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Percentil por rango más cercano"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return round(ordered[rank], 2)
+
+
+def parse_record(record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Convertir una línea del registro en una petición
+
+    Formatos aceptados por línea:
+        {"endpoint": "chat" | "/api/chat" | "search", "payload": {...}, "offset": 1.5}
+        {"message": "...", "session_id": "..."}       -> /api/chat
+        {"search_term": "..."}                        -> /api/course/search
+        {"request_id": "...", "title": "...", "body": "..."} -> /api/chat con body como mensaje
+    """
+    offset = record.get('offset')
+    if 'payload' in record:
+        endpoint = str(record.get('endpoint', 'chat')).rstrip('/').split('/')[-1]
+        kind = 'search' if endpoint in ('search', 'course_search') else 'chat'
+        return {'kind': kind, 'payload': record['payload'], 'offset': offset}
+    if 'search_term' in record:
+        return {'kind': 'search', 'payload': {'search_term': record['search_term']}, 'offset': offset}
+    if 'message' in record:
+        payload = {k: record[k] for k in ('message', 'session_id', 'user_id', 'course_id') if k in record}
+        return {'kind': 'chat', 'payload': payload, 'offset': offset}
+    message = record.get('body') or record.get('title')
+    if message:
+        return {'kind': 'chat', 'payload': {'message': message, 'user_id': record.get('request_id')}, 'offset': offset}
+    return None
+
+
+def load_records(path: str) -> List[Dict[str, Any]]:
+    """Cargar peticiones desde un archivo JSONL"""
+    records = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            parsed = parse_record(json.loads(line))
+            if parsed:
+                records.append(parsed)
+    return records
+
+
+def synthetic_records(count: int, chat_ratio: float, sessions: int, seed: int) -> List[Dict[str, Any]]:
+    """Generar una mezcla sintética de preguntas del curso y búsquedas"""
+    rng = random.Random(seed)
+    records = []
+    for i in range(count):
+        if rng.random() < chat_ratio:
+            payload = {
+                'message': rng.choice(Config.SUGGESTED_QUESTIONS),
+                'user_id': f"load_user_{i % max(sessions, 1)}",
+                'course_id': 'pac_course_load'
+            }
+            if sessions:
+                payload['session_id'] = f"load_session_{i % sessions}"
+            records.append({'kind': 'chat', 'payload': payload, 'offset': None})
+        else:
+            records.append({'kind': 'search', 'payload': {'search_term': rng.choice(SEARCH_TERMS)}, 'offset': None})
+    return records
+
+
+class LoadTest:
+    def __init__(self, base_url: str, concurrency: int = 4, rate: float = 0.0,
+                 timeout: float = 60.0, headers: Optional[Dict[str, str]] = None):
+        """
+        Inicializar prueba de carga
+
+        Args:
+            base_url: URL base de la API (ej: http://localhost:5001/api)
+            concurrency: Peticiones simultáneas máximas
+            rate: Llegadas por segundo (Poisson); 0 = lazo cerrado a máxima concurrencia
+            timeout: Timeout de cada petición en segundos
+            headers: Cabeceras adicionales (ej: API key)
+        """
+        self.base_url = base_url.rstrip('/')
+        self.concurrency = concurrency
+        self.rate = rate
+        self.timeout = timeout
+        self.headers = headers or {}
+        self.results = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+            self._local.session.headers.update(self.headers)
+        return self._local.session
+
+    def _send(self, record: Dict[str, Any], scheduled_at: float):
+        started = time.perf_counter()
+        result = {'kind': record['kind'], 'status': None, 'error': None, 'stages': {}}
+        try:
+            response = self._session().post(
+                self.base_url + ENDPOINTS[record['kind']],
+                json=record['payload'],
+                timeout=self.timeout
+            )
+            result['status'] = response.status_code
+            result['stages'] = parse_server_timing(response.headers.get('Server-Timing', ''))
+            if response.status_code >= 400:
+                result['error'] = f"HTTP {response.status_code}"
+        except requests.RequestException as e:
+            result['error'] = type(e).__name__
+        finished = time.perf_counter()
+        # La latencia se mide desde el instante planificado para no ocultar la espera en cola
+        result['latency_ms'] = (finished - scheduled_at) * 1000
+        result['service_ms'] = (finished - started) * 1000
+        with self._lock:
+            self.results.append(result)
+
+    def run(self, records: List[Dict[str, Any]], duration: Optional[float] = None,
+            preserve_timing: bool = False) -> float:
+        """
+        Ejecutar la prueba
+
+        Returns:
+            Tiempo total transcurrido en segundos
+        """
+        rng = random.Random(0)
+        slots = threading.BoundedSemaphore(self.concurrency)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            next_at = start
+            for i, record in enumerate(records):
+                if duration and time.perf_counter() - start >= duration:
+                    break
+                if preserve_timing and record.get('offset') is not None:
+                    next_at = start + float(record['offset'])
+                elif self.rate > 0:
+                    next_at += rng.expovariate(self.rate)
+                else:
+                    # Lazo cerrado: cada petición espera a que termine otra
+                    slots.acquire()
+                    next_at = time.perf_counter()
+                    pool.submit(self._send, record, next_at).add_done_callback(lambda _: slots.release())
+                    continue
+                delay = next_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(self._send, record, next_at)
+        return time.perf_counter() - start
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        """Resumir resultados por endpoint y por etapa"""
+        summary = {
+            'timestamp': datetime.now().isoformat(),
+            'base_url': self.base_url,
+            'concurrency': self.concurrency,
+            'rate': self.rate,
+            'elapsed_s': round(elapsed, 2),
+            'total_requests': len(self.results),
+            'throughput_rps': round(len(self.results) / elapsed, 2) if elapsed > 0 else 0,
+            'endpoints': {}
+        }
+        for kind in ENDPOINTS:
+            results = [r for r in self.results if r['kind'] == kind]
+            if not results:
+                continue
+            errors = {}
+            for r in results:
+                if r['error']:
+                    errors[r['error']] = errors.get(r['error'], 0) + 1
+            latencies = [r['latency_ms'] for r in results if not r['error']]
+            stage_names = sorted({name for r in results for name in r['stages']})
+            stages = {}
+            for name in stage_names:
+                values = [r['stages'][name] for r in results if name in r['stages'] and not r['error']]
+                stages[name] = {
+                    'p50': percentile(values, 50),
+                    'p95': percentile(values, 95),
+                    'p99': percentile(values, 99)
+                }
+            summary['endpoints'][kind] = {
+                'requests': len(results),
+                'errors': sum(errors.values()),
+                'error_rate': round(sum(errors.values()) / len(results), 4),
+                'errors_by_type': errors,
+                'latency_ms': {
+                    'p50': percentile(latencies, 50),
+                    'p95': percentile(latencies, 95),
+                    'p99': percentile(latencies, 99),
+                    'max': round(max(latencies), 2) if latencies else None
+                },
+                'stages_ms': stages
+            }
+        return summary
+
+
+def print_report(summary: Dict[str, Any]):
+    print("\n📊 RESULTADOS DE LA PRUEBA DE CARGA")
+    print("=" * 60)
+    print(f"⏱️  Duración: {summary['elapsed_s']} s")
+    print(f"📨 Peticiones: {summary['total_requests']}")
+    print(f"🚀 Throughput: {summary['throughput_rps']} req/s")
+    for kind, data in summary['endpoints'].items():
+        latency = data['latency_ms']
+        print(f"\n🔗 {ENDPOINTS[kind]}")
+        print(f"   - Peticiones: {data['requests']}  Errores: {data['errors']} ({data['error_rate'] * 100:.1f}%)")
+        for error, n in data['errors_by_type'].items():
+            print(f"     · {error}: {n}")
+        print(f"   - Latencia (ms): p50={latency['p50']}  p95={latency['p95']}  p99={latency['p99']}  max={latency['max']}")
+        for name, values in data['stages_ms'].items():
+            print(f"     · {name:<14} p50={values['p50']}  p95={values['p95']}  p99={values['p99']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de la API del Chatbot PAC")
+    parser.add_argument('--base-url', default='http://localhost:5001/api')
+    parser.add_argument('--input', help="Archivo JSONL con peticiones a reproducir")
+    parser.add_argument('--requests', type=int, default=100, help="Peticiones sintéticas si no hay --input")
+    parser.add_argument('--chat-ratio', type=float, default=0.8, help="Fracción de peticiones a /api/chat")
+    parser.add_argument('--sessions', type=int, default=0, help="Sesiones sintéticas (0 = sin historial)")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--rate', type=float, default=0.0, help="Llegadas por segundo (0 = lazo cerrado)")
+    parser.add_argument('--duration', type=float, help="Detener tras N segundos")
+    parser.add_argument('--loop', action='store_true', help="Repetir el registro hasta --duration")
+    parser.add_argument('--preserve-timing', action='store_true', help="Respetar el campo 'offset' del registro")
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--api-key', help="Valor para la cabecera X-API-Key")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="Guardar el resumen en JSON")
+    args = parser.parse_args()
+
+    if args.input:
+        records = load_records(args.input)
+    else:
+        records = synthetic_records(args.requests, args.chat_ratio, args.sessions, args.seed)
+    if not records:
+        print("❌ No hay peticiones para enviar")
+        return 1
+    if args.loop and args.duration:
+        # Suficientes repeticiones para cubrir la duración a la tasa pedida
+        needed = int(args.duration * max(args.rate, args.concurrency * 20)) + 1
+        records = (records * (needed // len(records) + 1))[:needed]
+
+    headers = {'X-API-Key': args.api_key} if args.api_key else {}
+    print("🧪 Prueba de carga del Chatbot PAC")
+    print(f"🌐 API: {args.base_url}")
+    print(f"📨 Peticiones planificadas: {len(records)}  Concurrencia: {args.concurrency}  Tasa: {args.rate or 'lazo cerrado'}")
+
+    test = LoadTest(args.base_url, args.concurrency, args.rate, args.timeout, headers)
+    elapsed = test.run(records, args.duration, args.preserve_timing)
+    summary = test.report(elapsed)
+    print_report(summary)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Resumen guardado en: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,178 @@
+"""
+Logging estructurado para la API del Chatbot PAC
+Registros en JSON escritos por un hilo en segundo plano (QueueHandler +
+QueueListener), con ID de petición propagado por contexto, muestreo de las
+líneas de depuración por consulta y rotación del archivo LOG_FILE.
+
+La rotación por tamaño solo es segura con un proceso: bajo gunicorn cada worker
+tendría su propio RotatingFileHandler y al rotar renombraría el archivo bajo
+los demás. Con varios procesos el archivo se abre con WatchedFileHandler (todos
+escriben en modo append y reabren el archivo si logrotate lo mueve).
+"""
+
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import zlib
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+
+_request_id = ContextVar('request_id', default=None)
+
+# Atributos estándar de LogRecord; el resto proviene de extra={...}
+_STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def set_request_id(request_id: Optional[str]):
+    _request_id.set(request_id)
+
+
+def get_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+class RequestIdFilter(logging.Filter):
+    """Adjuntar el ID de la petición actual a cada registro"""
+
+    def filter(self, record):
+        if not hasattr(record, 'request_id'):
+            record.request_id = _request_id.get()
+        return True
+
+
+class DebugSamplingFilter(logging.Filter):
+    """
+    Conservar solo una fracción de los registros DEBUG
+
+    El muestreo se decide por ID de petición, de modo que una petición
+    muestreada conserva todas sus líneas de depuración.
+    """
+
+    def __init__(self, rate: float = 1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.rate >= 1.0:
+            return True
+        if self.rate <= 0.0:
+            return False
+        request_id = getattr(record, 'request_id', None)
+        if request_id:
+            return (zlib.crc32(request_id.encode('utf-8')) % 10000) < self.rate * 10000
+        return random.random() < self.rate
+
+
+class JSONFormatter(logging.Formatter):
+    """Una línea JSON por registro, con los campos de extra={...}"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None)
+        }
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_ATTRS and key not in entry:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que descarta registros si la cola está llena en vez de bloquear"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _running_under_gunicorn() -> bool:
+    """Los workers de gunicorn son forks del arbiter, que ya importó el paquete"""
+    return 'gunicorn' in sys.modules
+
+
+def setup_logging(level: str = 'INFO', log_file: str = '', max_bytes: int = 10 * 1024 * 1024,
+                  backup_count: int = 5, debug_sample_rate: float = 1.0, queue_size: int = 10000,
+                  stream: bool = True) -> NonBlockingQueueHandler:
+    """
+    Configurar el logger raíz con escritura asíncrona en JSON
+
+    Args:
+        level: Nivel mínimo (DEBUG, INFO, ...)
+        log_file: Archivo de salida ('' = sin archivo)
+        max_bytes: Tamaño máximo de cada archivo antes de rotar (0 = rotación externa,
+            p. ej. logrotate; se fuerza bajo gunicorn)
+        backup_count: Archivos rotados a conservar
+        debug_sample_rate: Fracción de peticiones cuyas líneas DEBUG se conservan
+        queue_size: Registros pendientes máximos antes de descartar
+        stream: Escribir también en stdout
+
+    Returns:
+        El handler de cola instalado (expone el contador de descartes)
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    formatter = JSONFormatter()
+    handlers = []
+    if stream:
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(formatter)
+        handlers.append(stream_handler)
+    external_rotation = False
+    if log_file:
+        if max_bytes > 0 and not _running_under_gunicorn():
+            file_handler = logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+            )
+        else:
+            external_rotation = max_bytes > 0
+            file_handler = logging.handlers.WatchedFileHandler(log_file, encoding='utf-8')
+        file_handler.setFormatter(formatter)
+        handlers.append(file_handler)
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    # Los filtros corren en el hilo de la petición: el contexto (request_id) sigue disponible
+    queue_handler.addFilter(RequestIdFilter())
+    queue_handler.addFilter(DebugSamplingFilter(debug_sample_rate))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, NonBlockingQueueHandler):
+            root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(getattr(logging, str(level).upper(), logging.INFO))
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    if external_rotation:
+        logging.getLogger(__name__).warning(
+            "Varios procesos escriben en %s: se desactiva la rotación por tamaño (usar logrotate "
+            "o LOG_FILE vacío para escribir solo en stdout)", log_file)
+    return queue_handler
+
+
+def shutdown_logging():
+    """Vaciar la cola y detener el hilo escritor"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,255 @@
+"""
+Métricas en proceso para la API del Chatbot PAC
+Contadores, gauges e histogramas de bajo costo expuestos en formato de texto
+de Prometheus. Con varios workers de gunicorn cada proceso vuelca su estado a
+un directorio compartido (METRICS_DIR) y /api/metrics agrega todos los archivos.
+"""
+
+import bisect
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+logger = logging.getLogger(__name__)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Optional[Dict[str, str]]) -> LabelKey:
+    if not labels:
+        return ()
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class MetricsRegistry:
+    def __init__(self, metrics_dir: str = '', flush_interval: float = 5.0):
+        """
+        Inicializar registro de métricas
+
+        Args:
+            metrics_dir: Directorio compartido entre workers ('' = solo este proceso)
+            flush_interval: Segundos mínimos entre volcados a disco
+        """
+        self._lock = threading.Lock()
+        self._definitions = {}
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._collectors: List[Callable[[], Iterable[Tuple[str, Dict[str, str], float]]]] = []
+        self._last_flush = 0.0
+        self.configure(metrics_dir, flush_interval)
+
+    def configure(self, metrics_dir: str = '', flush_interval: float = 5.0):
+        """Ajustar el directorio compartido y el intervalo de volcado"""
+        self.metrics_dir = metrics_dir
+        self.flush_interval = flush_interval
+        if metrics_dir:
+            os.makedirs(metrics_dir, exist_ok=True)
+
+    # ------------------------------------------------------------------
+    # Definición y registro
+    # ------------------------------------------------------------------
+
+    def define(self, name: str, metric_type: str, help_text: str,
+               buckets: Tuple[float, ...] = DEFAULT_BUCKETS, aggregate: str = 'sum'):
+        """
+        Declarar una métrica
+
+        Args:
+            name: Nombre Prometheus de la métrica
+            metric_type: 'counter', 'gauge' o 'histogram'
+            help_text: Descripción para la línea # HELP
+            buckets: Límites superiores de los buckets (solo histogramas)
+            aggregate: Cómo combinar gauges entre workers: 'sum' o 'max'
+        """
+        self._definitions[name] = {
+            'type': metric_type,
+            'help': help_text,
+            'buckets': tuple(buckets),
+            'aggregate': aggregate
+        }
+
+    def add_collector(self, collector: Callable[[], Iterable[Tuple[str, Dict[str, str], float]]]):
+        """Registrar una función que entrega (nombre, labels, valor) al momento de exportar"""
+        self._collectors.append(collector)
+
+    def inc(self, name: str, labels: Dict[str, str] = None, value: float = 1.0):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def set(self, name: str, labels: Dict[str, str] = None, value: float = 0.0):
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = value
+
+    def observe(self, name: str, labels: Dict[str, str] = None, value: float = 0.0):
+        buckets = self._definitions[name]['buckets']
+        key = (name, _label_key(labels))
+        with self._lock:
+            entry = self._histograms.get(key)
+            if entry is None:
+                entry = self._histograms[key] = [[0] * (len(buckets) + 1), 0.0, 0]
+            entry[0][bisect.bisect_left(buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    # ------------------------------------------------------------------
+    # Instantáneas y agregación entre procesos
+    # ------------------------------------------------------------------
+
+    def snapshot(self) -> Dict:
+        """Estado actual del proceso, incluyendo los collectors"""
+        with self._lock:
+            counters = [[name, list(key), value] for (name, key), value in self._counters.items()]
+            gauges = [[name, list(key), value] for (name, key), value in self._gauges.items()]
+            histograms = [[name, list(key), list(entry[0]), entry[1], entry[2]]
+                          for (name, key), entry in self._histograms.items()]
+        for collector in self._collectors:
+            try:
+                for name, labels, value in collector():
+                    target = counters if self._definitions[name]['type'] == 'counter' else gauges
+                    target.append([name, list(_label_key(labels)), value])
+            except Exception:
+                # Las métricas ya entregadas por el collector se conservan; el error no debe pasar inadvertido
+                logger.exception("Error en collector de métricas %s",
+                                 getattr(collector, '__name__', repr(collector)))
+        return {'pid': os.getpid(), 'time': time.time(),
+                'counters': counters, 'gauges': gauges, 'histograms': histograms}
+
+    def flush(self):
+        """Volcar la instantánea de este worker al directorio compartido"""
+        if not self.metrics_dir:
+            return
+        path = os.path.join(self.metrics_dir, f"metrics_{os.getpid()}.json")
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+        self._last_flush = time.monotonic()
+
+    def maybe_flush(self):
+        """Volcar solo si pasó flush_interval desde el último volcado"""
+        if self.metrics_dir and time.monotonic() - self._last_flush >= self.flush_interval:
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+    @staticmethod
+    def _process_alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+            return True
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+
+    def _collect_snapshots(self) -> List[Dict]:
+        if not self.metrics_dir:
+            return [self.snapshot()]
+        self.flush()
+        snapshots = []
+        for path in glob.glob(os.path.join(self.metrics_dir, 'metrics_*.json')):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def render(self) -> str:
+        """Métricas agregadas de todos los workers en formato de texto de Prometheus"""
+        counters, gauges, histograms = {}, {}, {}
+        for snap in self._collect_snapshots():
+            # Los gauges de un worker terminado ya no describen el presente
+            alive = snap['pid'] == os.getpid() or self._process_alive(snap['pid'])
+            for name, key, value in snap['counters']:
+                k = (name, tuple(tuple(p) for p in key))
+                counters[k] = counters.get(k, 0.0) + value
+            if alive:
+                for name, key, value in snap['gauges']:
+                    k = (name, tuple(tuple(p) for p in key))
+                    if self._definitions.get(name, {}).get('aggregate') == 'max':
+                        gauges[k] = max(gauges.get(k, value), value)
+                    else:
+                        gauges[k] = gauges.get(k, 0.0) + value
+            for name, key, buckets, total, count in snap['histograms']:
+                k = (name, tuple(tuple(p) for p in key))
+                entry = histograms.setdefault(k, [[0] * len(buckets), 0.0, 0])
+                entry[0] = [a + b for a, b in zip(entry[0], buckets)]
+                entry[1] += total
+                entry[2] += count
+
+        lines = []
+        for name, definition in self._definitions.items():
+            metric_type = definition['type']
+            source = {'counter': counters, 'gauge': gauges, 'histogram': histograms}[metric_type]
+            samples = sorted((k, v) for k, v in source.items() if k[0] == name)
+            if not samples:
+                continue
+            lines.append(f"# HELP {name} {definition['help']}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for (_, key), value in samples:
+                if metric_type != 'histogram':
+                    lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+                    continue
+                bucket_counts, total, count = value
+                cumulative = 0
+                for bound, bucket_count in zip(definition['buckets'] + (float('inf'),), bucket_counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_format_labels(key, (('le', _format_value(bound)),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(key)} {_format_value(total)}")
+                lines.append(f"{name}_count{_format_labels(key)} {count}")
+        return '\n'.join(lines) + '\n'
+
+
+# Registro global del proceso (api_lms lo configura con APIConfig)
+registry = MetricsRegistry()
+
+registry.define('pac_http_requests_total', 'counter', 'Peticiones HTTP atendidas por endpoint y código de estado')
+registry.define('pac_http_request_duration_seconds', 'histogram', 'Latencia de las peticiones HTTP por endpoint')
+registry.define('pac_stage_duration_seconds', 'histogram', 'Latencia por etapa del pipeline (búsqueda, prompt, LLM, post-proceso)')
+registry.define('pac_llm_tokens_total', 'counter', 'Tokens informados por OpenAI en el campo usage')
+registry.define('pac_llm_requests_total', 'counter', 'Llamadas al cliente LLM por resultado')
+registry.define('pac_retrieval_total', 'counter', 'Búsquedas de chunks por modo (full, followup, followup_fallback)')
+registry.define('pac_cache_requests_total', 'counter', 'Consultas a cachés por resultado (hit/miss)')
+registry.define('pac_active_sessions', 'gauge', 'Sesiones de conversación activas en memoria')
+registry.define('pac_session_messages', 'gauge', 'Mensajes almacenados en las sesiones activas')
+registry.define('pac_index_chunks', 'gauge', 'Chunks cargados en el índice de búsqueda', aggregate='max')
+registry.define('pac_index_tokens', 'gauge', 'Tokens totales de los chunks del índice', aggregate='max')
+registry.define('pac_index_features', 'gauge', 'Dimensiones del vectorizador TF-IDF', aggregate='max')
+registry.define('pac_admission_active', 'gauge', 'Llamadas al LLM en curso por curso')
+registry.define('pac_admission_queue_depth', 'gauge', 'Peticiones esperando turno para el LLM por curso')
+registry.define('pac_admission_admitted_total', 'counter', 'Llamadas al LLM admitidas por curso')
+registry.define('pac_admission_shed_total', 'counter', 'Peticiones rechazadas por saturación, por curso y motivo')
+registry.define('pac_admission_wait_seconds', 'histogram', 'Tiempo de espera en la cola de admisión por curso')
+registry.define('pac_rate_limited_total', 'counter', 'Peticiones rechazadas por rate limiting, por bucket')
+registry.define('pac_chat_jobs_pending', 'gauge', 'Trabajos de chat asíncronos en cola o en curso')
+registry.define('pac_chat_jobs_total', 'counter', 'Trabajos de chat asíncronos por estado')
+registry.define('pac_llm_circuit_open', 'gauge', 'Workers con el circuit breaker de OpenAI abierto')
@@ -0,0 +1,134 @@
+"""
+Caché en disco del texto extraído de las páginas de los PDFs del curso PAC
+La clave es el hash SHA-256 del PDF más la versión del extractor, así que un
+PDF sin cambios no se vuelve a analizar con PyPDF2 (ni en pdf_preprocessor.py
+ni al arrancar app_old.py) y una versión nueva de PyPDF2 invalida la caché.
+
+Cada entrada es un archivo JSON Lines: una línea de encabezado con el número
+de páginas y luego el texto de cada página, en orden (la línea i + 1 es la
+página i). Se escribe en streaming y se publica de forma atómica al terminar.
+
+    .page_cache/ab/ab12...ef-pypdf2-3.0.1.jsonl
+"""
+
+import hashlib
+import json
+import os
+import re
+from typing import Iterable, Iterator, Optional, Tuple
+
+import PyPDF2
+
+DEFAULT_CACHE_DIR = ".page_cache"
+CACHE_FORMAT = 1
+# Cambiar el sufijo si cambia la forma de extraer el texto (no solo la versión de PyPDF2)
+EXTRACTOR_VERSION = f"pypdf2-{PyPDF2.__version__}"
+
+
+def file_hash(path: str) -> str:
+    """Hash SHA-256 del contenido de un archivo"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class PageCache:
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, extractor_version: str = EXTRACTOR_VERSION):
+        """
+        Inicializar caché de páginas
+
+        Args:
+            cache_dir: Directorio de la caché (se crea al escribir la primera entrada)
+            extractor_version: Versión del extractor, parte de la clave de cada entrada
+        """
+        self.cache_dir = cache_dir
+        self.extractor_version = extractor_version
+        self._suffix = re.sub(r'[^A-Za-z0-9.]+', '-', extractor_version)
+        self.stats = {'hits': 0, 'misses': 0, 'pages_read': 0, 'pages_written': 0}
+
+    def path(self, sha: str) -> str:
+        return os.path.join(self.cache_dir, sha[:2], f"{sha}-{self._suffix}.jsonl")
+
+    def load(self, sha: str) -> Optional[Tuple[int, Iterator[str]]]:
+        """
+        Buscar las páginas de un PDF en la caché
+
+        Args:
+            sha: Hash SHA-256 del PDF
+
+        Returns:
+            Tupla (número de páginas, iterador del texto de cada página), o None si no está
+        """
+        try:
+            file = open(self.path(sha), 'r', encoding='utf-8')
+        except OSError:
+            self.stats['misses'] += 1
+            return None
+        try:
+            header = json.loads(file.readline())
+        except ValueError:
+            header = {}
+        if header.get("format") != CACHE_FORMAT or header.get("extractor") != self.extractor_version:
+            file.close()
+            self.stats['misses'] += 1
+            return None
+        self.stats['hits'] += 1
+        return header["pages"], self._read_pages(file, header["pages"])
+
+    def _read_pages(self, file, total_pages: int) -> Iterator[str]:
+        with file:
+            for _ in range(total_pages):
+                line = file.readline()
+                if not line:
+                    raise ValueError(f"Entrada de caché incompleta: {file.name}")
+                self.stats['pages_read'] += 1
+                yield json.loads(line)
+
+    def record(self, sha: str, total_pages: int, pages: Iterable[str]) -> Iterator[str]:
+        """
+        Entregar las páginas y guardarlas en la caché a medida que pasan
+
+        La entrada solo se publica si se consumen todas las páginas; si la
+        extracción falla o se interrumpe, no queda nada a medias en la caché.
+        """
+        path = self.path(sha)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        complete = False
+        written = 0
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                header = {"format": CACHE_FORMAT, "extractor": self.extractor_version, "sha256": sha,
+                          "pages": total_pages}
+                file.write(json.dumps(header) + "\n")
+                for page in pages:
+                    file.write(json.dumps(page, ensure_ascii=False) + "\n")
+                    written += 1
+                    yield page
+            complete = written == total_pages
+            if complete:
+                os.replace(tmp_path, path)
+                self.stats['pages_written'] += written
+        finally:
+            if not complete and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def pages(self, pdf_path: str, sha: Optional[str] = None) -> Iterator[str]:
+        """
+        Texto de cada página de un PDF, desde la caché o extrayéndolo con PyPDF2
+
+        Args:
+            pdf_path: Ruta al archivo PDF
+            sha: Hash del PDF si ya se calculó
+        """
+        sha = sha or file_hash(pdf_path)
+        cached = self.load(sha)
+        if cached is not None:
+            yield from cached[1]
+            return
+        with open(pdf_path, 'rb') as file:
+            pdf_reader = PyPDF2.PdfReader(file)
+            pages = (page.extract_text() for page in pdf_reader.pages)
+            yield from self.record(sha, len(pdf_reader.pages), pages)
@@ -1,79 +1,499 @@
 """
 Preprocesador de PDFs para el Chatbot PAC
 Divide PDFs en chunks pequeños y crea embeddings para búsqueda semántica
+
+La ingesta es un flujo de generadores: páginas -> ventanas de tokens ->
+chunks -> archivo JSON, de modo que la memoria usada depende del tamaño de
+una ventana y no del tamaño del curso.
+
+Con varios procesos cada PDF se procesa completo (extracción, limpieza,
+normalización, chunks y firmas MinHash) en un worker del pool, con unos
+pocos documentos en vuelo; el proceso principal solo descarta duplicados y
+escribe, en el orden original de los PDFs.
 """
 
 import os
+import re
 import json
-import tiktoken
-from typing import List, Dict, Any
+import bisect
+import hashlib
+import time
+import argparse
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple, Iterable, Iterator
 import PyPDF2
 from pathlib import Path
 
+from chunk_store import iter_json_chunks, write_chunk_store
+from dedup import HeaderFooterStripper, NearDuplicateIndex
+from page_cache import DEFAULT_CACHE_DIR, PageCache, file_hash
+from text_normalizer import TextNormalizer
+from tokenizer import count_tokens, get_encoding
+
+# Manifiesto del curso dentro del directorio de PDFs (metadatos por archivo)
+COURSE_MANIFEST = "curso.json"
+
+MANIFEST_VERSION = 5
+
+# Fin de oración seguido de espacio, o salto de párrafo
+SENTENCE_BOUNDARY = re.compile(r'[.!?…][»"\')\]]?\s+|\n\s*\n')
+
+UNIDAD_PATTERN = re.compile(r'unidad[_\s-]*(\d+)', re.IGNORECASE)
+
+# Caracteres acumulados antes de dividir el texto pendiente (unas 4 ventanas de 800 tokens)
+FLUSH_CHARS = 12000
+
+# Preprocesador de cada proceso del pool (se crea una vez en _init_worker)
+_worker: Optional["PDFPreprocessor"] = None
+
+def _extract_page_range(pdf_path: str, start: int, stop: int) -> List[str]:
+    """Extraer el texto de las páginas [start, stop) de un PDF"""
+    with open(pdf_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        return [pdf_reader.pages[i].extract_text() for i in range(start, stop)]
+
+def _init_worker(settings: Dict[str, Any]):
+    """Inicializar un proceso del pool: tokenizador, normalizador y caché se crean una sola vez"""
+    global _worker
+    _worker = PDFPreprocessor(**settings)
+
+def _process_document(pdf_path: str, info: Dict[str, Any], sha: Optional[str]) -> Dict[str, Any]:
+    """
+    Procesar un PDF completo en un proceso del pool
+
+    Returns:
+        Chunks, firmas MinHash (si hay descarte de duplicados), estadísticas del
+        documento y de la limpieza y normalización de su texto
+    """
+    worker = _worker
+    worker.stripper.stats = dict.fromkeys(worker.stripper.stats, 0)
+    worker.normalizer.reset_stats()
+    stats = {}
+    chunks = list(worker.iter_pdf_chunks(pdf_path, info, stats=stats, sha=sha))
+    index = worker._duplicate_index()
+    return {
+        "chunks": chunks,
+        "signatures": [index.signature(chunk["content"]) for chunk in chunks] if index else None,
+        "stats": stats,
+        "headers": dict(worker.stripper.stats),
+        "normalization": (dict(worker.normalizer.stats), worker.normalizer._vocab_before,
+                          worker.normalizer._vocab_after)
+    }
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def discover_pdfs(pdfs_dir: str) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Encontrar los PDFs del curso y sus metadatos
+    
+    Se recorren todos los .pdf del directorio (y subdirectorios) en orden
+    alfabético. Los metadatos salen de `curso.json` si existe:
+        
+        {"defaults": {...}, "files": {"ruta/relativa.pdf": {"unidad": 1, "tema": "..."}}}
+    
+    Para archivos sin entrada se deduce la unidad del nombre ("Unidad_2") y el
+    tema del nombre del archivo. Una entrada con "exclude": true omite el PDF.
+    
+    Returns:
+        Lista de pares (ruta del PDF, metadatos)
+    """
+    course = {}
+    manifest_path = os.path.join(pdfs_dir, COURSE_MANIFEST)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            course = json.load(f)
+    defaults = course.get("defaults", {})
+    files = course.get("files", {})
+    
+    found = []
+    for root, dirs, filenames in os.walk(pdfs_dir):
+        dirs.sort()
+        for filename in sorted(filenames):
+            if not filename.lower().endswith(".pdf"):
+                continue
+            pdf_path = os.path.join(root, filename)
+            relative = Path(os.path.relpath(pdf_path, pdfs_dir)).as_posix()
+            info = files.get(relative)
+            if info is None:
+                stem = Path(filename).stem
+                match = UNIDAD_PATTERN.search(stem)
+                info = {"unidad": int(match.group(1)) if match else 0,
+                        "tema": re.sub(r'[^a-z0-9]+', '_', stem.lower()).strip('_')}
+            if info.get("exclude"):
+                continue
+            found.append((pdf_path, {**defaults, **{k: v for k, v in info.items() if k != "exclude"}}))
+    
+    for relative in files:
+        if not os.path.exists(os.path.join(pdfs_dir, relative)):
+            print(f"⚠️  PDF no encontrado: {os.path.join(pdfs_dir, relative)}")
+    return found
+
+class ChunkWriter:
+    """Escribe chunks uno a uno como arreglo JSON (mismo formato que json.dump con indent=2)"""
+    
+    def __init__(self, output_file: str):
+        self.output_file = output_file
+        self.tmp_file = output_file + ".tmp"
+        self.count = 0
+        self.tokens = 0
+        self._file = open(self.tmp_file, 'w', encoding='utf-8')
+        self._file.write("[")
+    
+    def write(self, chunk: Dict[str, Any]):
+        text = json.dumps(chunk, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+        self._file.write(("," if self.count else "") + "\n  " + text)
+        self.count += 1
+        self.tokens += chunk["tokens"]
+    
+    def mark(self) -> Tuple[int, int, int]:
+        """Posición actual, para descartar lo escrito después con rollback()"""
+        self._file.flush()
+        return self._file.tell(), self.count, self.tokens
+    
+    def rollback(self, mark: Tuple[int, int, int]):
+        position, self.count, self.tokens = mark
+        self._file.seek(position)
+        self._file.truncate()
+    
+    def commit(self):
+        """Cerrar el arreglo y reemplazar el archivo de salida de forma atómica"""
+        self._file.write("\n]" if self.count else "]")
+        self._file.close()
+        os.replace(self.tmp_file, self.output_file)
+    
+    def abort(self):
+        self._file.close()
+        os.remove(self.tmp_file)
+
+class _PreviousChunks:
+    """Chunks de la ejecución anterior, leídos en streaming y agrupados por PDF de origen"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._iter = None
+        self._peek = None
+    
+    def take(self, source: str) -> Iterator[Dict[str, Any]]:
+        # Normalmente los PDFs aparecen en el mismo orden que antes y basta una pasada;
+        # si no, se vuelve a leer el archivo desde el principio una vez
+        for _ in range(2):
+            if self._iter is None:
+                self._iter = iter_json_chunks(self.path)
+                self._peek = None
+            while True:
+                chunk = self._peek if self._peek is not None else next(self._iter, None)
+                self._peek = None
+                if chunk is None:
+                    break
+                if chunk["metadata"]["source"] != source:
+                    continue
+                yield chunk
+                for chunk in self._iter:
+                    if chunk["metadata"]["source"] != source:
+                        self._peek = chunk
+                        return
+                    yield chunk
+                return
+            self._iter = None
+
 class PDFPreprocessor:
-    def __init__(self, chunk_size: int = 800, overlap: int = 100):
+    def __init__(self, chunk_size: int = 800, overlap: int = 100, strip_headers: bool = True,
+                 dedup_threshold: float = 0.85, normalize_text: bool = True,
+                 page_cache_dir: Optional[str] = DEFAULT_CACHE_DIR):
         """
         Inicializar preprocesador
         
         Args:
             chunk_size: Tamaño máximo de cada chunk en tokens
             overlap: Solapamiento entre chunks para mantener contexto
+            strip_headers: Quitar encabezados y pies de página repetidos
+            dedup_threshold: Similitud (Jaccard estimada con MinHash) para descartar
+                chunks casi duplicados (0 = no descartar)
+            normalize_text: Reparar artefactos de extracción (palabras partidas,
+                saltos de línea, glifos) antes de dividir en chunks
+            page_cache_dir: Directorio de la caché del texto de las páginas (None = sin caché)
         """
+        if not 0 <= overlap < chunk_size:
+            raise ValueError("overlap debe ser menor que chunk_size")
         self.chunk_size = chunk_size
         self.overlap = overlap
-        self.tokenizer = tiktoken.get_encoding("cl100k_base")  # Para GPT-3.5/4
-        
+        self.strip_headers = strip_headers
+        self.dedup_threshold = dedup_threshold
+        self.normalize_text = normalize_text
+        # Codificación compartida con la API (vendorizada, sin red); ver tokenizer.py
+        self.tokenizer = get_encoding()
+        self.stripper = HeaderFooterStripper(count_tokens=self.count_tokens)
+        self.normalizer = TextNormalizer(count_tokens=self.count_tokens)
+        self.page_cache_dir = page_cache_dir
+        self.page_cache = PageCache(page_cache_dir) if page_cache_dir else None
+        self.last_timings: Dict[str, Any] = {}
+    
+    def worker_settings(self) -> Dict[str, Any]:
+        """Parámetros para crear el preprocesador de cada proceso del pool"""
+        return {"chunk_size": self.chunk_size, "overlap": self.overlap, "strip_headers": self.strip_headers,
+                "dedup_threshold": self.dedup_threshold, "normalize_text": self.normalize_text,
+                "page_cache_dir": self.page_cache_dir}
+    
     def count_tokens(self, text: str) -> int:
-        """Contar tokens en un texto"""
-        return len(self.tokenizer.encode(text))
+        """Contar tokens en un texto (memoizado: las líneas repetidas se cuentan una vez)"""
+        return count_tokens(text)
     
-    def split_text_into_chunks(self, text: str, metadata: Dict[str, Any]) -> List[Dict[str, Any]]:
+    def split_text_into_chunks(self, text: str, metadata: Dict[str, Any],
+                               tokens: Optional[List[int]] = None) -> List[Dict[str, Any]]:
         """
-        Dividir texto en chunks de tamaño específico
+        Dividir un texto completo en ventanas de tokens con solapamiento
         
         Args:
             text: Texto completo del PDF
             metadata: Metadatos del PDF (unidad, tema, etc.)
-            
+            tokens: Tokens de `text` si ya se codificó (evita codificar dos veces)
+        
         Returns:
-            Lista de chunks con contenido y metadatos
+            Lista de chunks con contenido, metadatos y rango de caracteres ("span")
         """
-        chunks = []
-        sentences = text.split('. ')
-        current_chunk = ""
-        current_tokens = 0
+        if tokens is None:
+            tokens = self.tokenizer.encode_ordinary(text)
+        chunks, _, _ = self._window_chunks(text, tokens, metadata, set(), 0, final=True)
+        return chunks
+    
+    def _window_chunks(self, text: str, tokens: List[int], metadata: Dict[str, Any], seen_ids: set,
+                       base: int, final: bool) -> Tuple[List[Dict[str, Any]], int, int]:
+        """
+        Dividir en ventanas el texto pendiente
+        
+        Cada chunk es un rango del arreglo de tokens, con el final ajustado al
+        último fin de oración de la ventana y el inicio del siguiente
+        retrocediendo `overlap` tokens (ajustado al inicio de oración más cercano
+        dentro del solapamiento). El contenido se toma del texto mediante los
+        offsets de carácter de cada token, así que el costo es lineal.
         
-        for sentence in sentences:
-            sentence = sentence.strip() + ". "
-            sentence_tokens = self.count_tokens(sentence)
+        Args:
+            text: Texto pendiente
+            tokens: Tokens de `text`
+            metadata: Metadatos del PDF
+            seen_ids: IDs ya usados en el documento
+            base: Offset de `text` dentro del documento (para los spans)
+            final: Si es el final del documento; si no, la última ventana queda pendiente
+        
+        Returns:
+            Tupla (chunks, tokens consumidos, offset de carácter donde empieza lo pendiente)
+        """
+        if not tokens:
+            return [], 0, len(text)
+        decoded, offsets = self.tokenizer.decode_with_offsets(tokens)
+        # El texto decodificado coincide con el original salvo caracteres inválidos
+        text = decoded
+        total = len(tokens)
+        
+        # Índices de token donde empieza una oración (precalculados una sola vez)
+        sentence_starts = []
+        for match in SENTENCE_BOUNDARY.finditer(text):
+            # Token que contiene el primer carácter de la oración (suele llevar el espacio previo)
+            index = bisect.bisect_right(offsets, match.end()) - 1
+            if 0 < index < total and (not sentence_starts or sentence_starts[-1] != index):
+                sentence_starts.append(index)
+        
+        chunks = []
+        min_size = max(1, self.chunk_size // 2)
+        start = 0
+        while start < total:
+            end = min(start + self.chunk_size, total)
+            if end >= total and not final:
+                # La ventana llega al final del texto pendiente: esperar más páginas
+                break
+            if end < total:
+                # Cortar en el último fin de oración de la ventana, si no deja un chunk muy corto
+                i = bisect.bisect_right(sentence_starts, end) - 1
+                if i >= 0 and sentence_starts[i] >= start + min_size:
+                    end = sentence_starts[i]
+            
+            char_start = offsets[start]
+            char_end = offsets[end] if end < total else len(text)
+            content = text[char_start:char_end]
+            stripped = content.strip()
+            if stripped:
+                lead = len(content) - len(content.lstrip())
+                span = [base + char_start + lead, base + char_start + lead + len(stripped)]
+                chunks.append(self.make_chunk(stripped, end - start, metadata, seen_ids, span))
             
-            # Si agregar la oración excede el límite, crear nuevo chunk
-            if current_tokens + sentence_tokens > self.chunk_size and current_chunk:
-                chunks.append({
-                    "id": f"{metadata['unidad']}_{metadata['tema']}_{len(chunks)}",
-                    "content": current_chunk.strip(),
-                    "tokens": current_tokens,
-                    "metadata": metadata.copy()
-                })
-                
-                # Mantener solapamiento para contexto
-                overlap_text = current_chunk[-self.overlap:] if self.overlap > 0 else ""
-                current_chunk = overlap_text + sentence
-                current_tokens = self.count_tokens(current_chunk)
-            else:
-                current_chunk += sentence
-                current_tokens += sentence_tokens
-        
-        # Agregar el último chunk si tiene contenido
-        if current_chunk.strip():
-            chunks.append({
-                "id": f"{metadata['unidad']}_{metadata['tema']}_{len(chunks)}",
-                "content": current_chunk.strip(),
-                "tokens": current_tokens,
-                "metadata": metadata.copy()
-            })
+            if end >= total:
+                return chunks, total, len(text)
+            # Solapamiento real en tokens, empezando en una oración si hay una dentro del solapamiento
+            next_start = max(end - self.overlap, start + 1)
+            i = bisect.bisect_left(sentence_starts, next_start)
+            if i < len(sentence_starts) and sentence_starts[i] < end:
+                next_start = sentence_starts[i]
+            start = next_start
         
-        return chunks
+        return chunks, start, offsets[start] if start < total else len(text)
+    
+    def make_chunk(self, content: str, tokens: int, metadata: Dict[str, Any], seen_ids: set,
+                   span: Optional[List[int]] = None) -> Dict[str, Any]:
+        """
+        Crear un chunk con ID derivado de su contenido
+        
+        El ID no depende de la posición del chunk, así que editar una parte del
+        PDF no cambia los IDs de los chunks cuyo texto sigue igual. Si el mismo
+        texto aparece dos veces en el documento se agrega un sufijo.
+        """
+        base_id = f"{metadata['unidad']}_{metadata['tema']}_{content_hash(content.encode('utf-8'))[:12]}"
+        chunk_id = base_id
+        suffix = 2
+        while chunk_id in seen_ids:
+            chunk_id = f"{base_id}_{suffix}"
+            suffix += 1
+        seen_ids.add(chunk_id)
+        return {
+            "id": chunk_id,
+            "content": content,
+            "tokens": tokens,
+            "span": span,
+            "metadata": metadata.copy()
+        }
+    
+    def iter_text_chunks(self, pages: Iterable[str], metadata: Dict[str, Any],
+                         stats: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Dividir en chunks un documento que llega página a página
+        
+        Solo se mantiene en memoria el texto aún no emitido (unas pocas
+        ventanas); cada página se une con un espacio, igual que antes.
+        
+        Args:
+            pages: Texto de cada página, en orden
+            metadata: Metadatos del PDF
+            stats: Diccionario donde se acumulan los tokens y los IDs de los chunks
+        """
+        stats = stats if stats is not None else {}
+        stats.update({"tokens": 0, "chunk_ids": []})
+        seen_ids = set()
+        pending = ""
+        base = 0
+        for page in pages:
+            pending += page + " "
+            if len(pending) < FLUSH_CHARS:
+                continue
+            tokens = self.tokenizer.encode_ordinary(pending)
+            chunks, consumed, rest = self._window_chunks(pending, tokens, metadata, seen_ids, base, final=False)
+            stats["tokens"] += consumed
+            for chunk in chunks:
+                stats["chunk_ids"].append(chunk["id"])
+                yield chunk
+            pending = pending[rest:]
+            base += rest
+        
+        tokens = self.tokenizer.encode_ordinary(pending)
+        chunks, consumed, _ = self._window_chunks(pending, tokens, metadata, seen_ids, base, final=True)
+        stats["tokens"] += consumed
+        for chunk in chunks:
+            stats["chunk_ids"].append(chunk["id"])
+            yield chunk
+    
+    def iter_pdf_chunks(self, pdf_path: str, info: Dict[str, Any], stats: Optional[Dict[str, Any]] = None,
+                        sha: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Extraer y dividir un PDF en streaming
+        
+        Si el texto de las páginas está en la caché (mismo hash del PDF y misma
+        versión del extractor) no se abre el PDF.
+        
+        Args:
+            pdf_path: Ruta al archivo PDF
+            info: Metadatos del PDF (unidad, tema y los definidos en curso.json)
+            stats: Diccionario donde se acumulan estadísticas del documento
+            sha: Hash del PDF si ya se calculó
+        """
+        stats = stats if stats is not None else {}
+        stats["cached"] = False
+        if self.page_cache is not None:
+            sha = sha or file_hash(pdf_path)
+            cached = self.page_cache.load(sha)
+            if cached is not None:
+                stats["cached"] = True
+                total_pages, pages = cached
+                yield from self._chunk_pages(pages, {**info, "source": pdf_path, "total_pages": total_pages}, stats)
+                return
+        
+        with open(pdf_path, 'rb') as file:
+            pdf_reader = PyPDF2.PdfReader(file)
+            total_pages = len(pdf_reader.pages)
+            metadata = {**info, "source": pdf_path, "total_pages": total_pages}
+            pages = (page.extract_text() for page in pdf_reader.pages)
+            if self.page_cache is not None:
+                pages = self.page_cache.record(sha, total_pages, pages)
+            yield from self._chunk_pages(pages, metadata, stats)
+    
+    def _chunk_pages(self, pages: Iterator[str], metadata: Dict[str, Any],
+                     stats: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """Páginas -> encabezados quitados -> texto normalizado -> chunks"""
+        pages = self._record_pages(self._timed(pages, stats), stats)
+        if self.strip_headers:
+            pages = self.stripper.strip_pages(pages)
+        if self.normalize_text:
+            pages = self.normalizer.normalize_pages(pages)
+        yield from self.iter_text_chunks(pages, metadata, stats)
+    
+    @staticmethod
+    def _record_pages(pages: Iterator[str], stats: Dict[str, Any]) -> Iterator[str]:
+        """Contar las páginas y guardar el hash del texto extraído de cada una"""
+        stats["pages"] = 0
+        stats["page_hashes"] = []
+        for page in pages:
+            stats["pages"] += 1
+            stats["page_hashes"].append(content_hash(page.encode('utf-8'))[:16])
+            yield page
+    
+    @staticmethod
+    def _drop_duplicates(chunks: Iterable[Dict[str, Any]], index: Optional[NearDuplicateIndex],
+                         kept_ids: List[str], signatures: Optional[List[Any]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Descartar los chunks casi idénticos a uno ya escrito y anotar los IDs conservados
+        
+        `signatures` son las firmas MinHash de los chunks si ya se calcularon en el pool.
+        """
+        for i, chunk in enumerate(chunks):
+            signature = signatures[i] if signatures is not None else None
+            if index is None or index.check(chunk["id"], chunk["content"], chunk["tokens"], signature) is None:
+                kept_ids.append(chunk["id"])
+                yield chunk
+    
+    def _duplicate_index(self) -> Optional[NearDuplicateIndex]:
+        return NearDuplicateIndex(self.dedup_threshold) if self.dedup_threshold > 0 else None
+    
+    @staticmethod
+    def _timed(pages: Iterator[str], stats: Dict[str, Any]) -> Iterator[str]:
+        """Acumular en stats['extract_time'] el tiempo de espera de cada página"""
+        stats["extract_time"] = 0.0
+        while True:
+            start = time.perf_counter()
+            page = next(pages, None)
+            stats["extract_time"] += time.perf_counter() - start
+            if page is None:
+                return
+            yield page
+    
+    def _document_chunks(self, pdf_path: str, info: Dict[str, Any], stats: Dict[str, Any], sha: Optional[str],
+                         prefetch: Optional["_DocumentPrefetcher"]) -> Tuple[Iterable[Dict[str, Any]], Optional[List[Any]]]:
+        """
+        Chunks de un PDF: del pool si el documento se envió a un worker, si no en streaming
+        
+        Returns:
+            Tupla (chunks, firmas MinHash o None)
+        """
+        if prefetch is not None:
+            start = time.perf_counter()
+            result = prefetch.result(pdf_path)
+            if result is not None:
+                stats.update(result["stats"])
+                # En paralelo se mide lo que el proceso principal espera a los workers
+                stats["extract_time"] = time.perf_counter() - start
+                for key, value in result["headers"].items():
+                    self.stripper.stats[key] += value
+                self.normalizer.merge_stats(*result["normalization"])
+                return result["chunks"], result["signatures"]
+        return self.iter_pdf_chunks(pdf_path, info, stats, sha), None
     
     def process_pdf(self, pdf_path: str, unidad: int, tema: str) -> List[Dict[str, Any]]:
         """
@@ -83,111 +503,372 @@ class PDFPreprocessor:
             pdf_path: Ruta al archivo PDF
             unidad: Número de unidad del curso
             tema: Tema o sección del PDF
-            
+        
         Returns:
             Lista de chunks del PDF
         """
+        stats = {}
         try:
-            with open(pdf_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                text = ""
-                
-                # Extraer texto de todas las páginas
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + " "
-                
-                # Metadatos del PDF
-                metadata = {
-                    "unidad": unidad,
-                    "tema": tema,
-                    "source": pdf_path,
-                    "total_pages": len(pdf_reader.pages),
-                    "total_tokens": self.count_tokens(text)
-                }
-                
-                # Dividir en chunks
-                chunks = self.split_text_into_chunks(text, metadata)
-                
-                print(f"✅ PDF procesado: {pdf_path}")
-                print(f"   - Total tokens: {metadata['total_tokens']}")
-                print(f"   - Chunks creados: {len(chunks)}")
-                print(f"   - Tamaño promedio por chunk: {metadata['total_tokens'] // len(chunks)} tokens")
-                
-                return chunks
-                
+            chunks = list(self.iter_pdf_chunks(pdf_path, {"unidad": unidad, "tema": tema}, stats=stats))
+            self.report_pdf(pdf_path, stats)
+            return chunks
         except Exception as e:
             print(f"❌ Error procesando {pdf_path}: {str(e)}")
             return []
     
-    def process_all_pdfs(self, pdfs_dir: str = "pdfs_curso") -> List[Dict[str, Any]]:
+    def report_pdf(self, pdf_path: str, stats: Dict[str, Any]):
+        """Mostrar el resumen de un PDF procesado"""
+        print(f"✅ PDF procesado: {pdf_path}")
+        print(f"   - Total tokens: {stats['tokens']}")
+        print(f"   - Chunks creados: {len(stats['chunk_ids'])}")
+        if stats['chunk_ids']:
+            print(f"   - Tamaño promedio por chunk: {stats['tokens'] // len(stats['chunk_ids'])} tokens")
+    
+    def process_all_pdfs(self, pdfs_dir: str = "pdfs_curso", workers: int = 1) -> List[Dict[str, Any]]:
         """
-        Procesar todos los PDFs del directorio
+        Procesar todos los PDFs del directorio y retornar sus chunks en una lista
+        
+        Para cursos grandes conviene process_incremental(), que escribe los
+        chunks a medida que se generan.
         
         Args:
             pdfs_dir: Directorio con los PDFs del curso
-            
+            workers: Procesos que procesan PDFs en paralelo (1 = secuencial)
+        
         Returns:
             Lista de todos los chunks de todos los PDFs
         """
         all_chunks = []
-        pdf_files = {
-            "Contenidos_Unidad_1_PAC.pdf": {"unidad": 1, "tema": "conceptos_basicos_iso9001"},
-            "Contenidos_Unidad_2_PAC.pdf": {"unidad": 2, "tema": "auditorias_certificaciones"},
-            "Contenidos_Unidad_3_PAC.pdf": {"unidad": 3, "tema": "plan_aseguramiento_obras_publicas"}
-        }
-        
-        for pdf_file, info in pdf_files.items():
-            pdf_path = os.path.join(pdfs_dir, pdf_file)
-            if os.path.exists(pdf_path):
-                chunks = self.process_pdf(pdf_path, info["unidad"], info["tema"])
+        index = self._duplicate_index()
+        pdfs = discover_pdfs(pdfs_dir)
+        with self._pool(workers) as pool:
+            prefetch = _DocumentPrefetcher(pool, [(pdf_path, info, None) for pdf_path, info in pdfs],
+                                           workers) if pool else None
+            for pdf_path, info in pdfs:
+                stats = {}
+                try:
+                    chunks, signatures = self._document_chunks(pdf_path, info, stats, None, prefetch)
+                    chunks = list(self._drop_duplicates(chunks, index, [], signatures))
+                except Exception as e:
+                    print(f"❌ Error procesando {pdf_path}: {str(e)}")
+                    continue
+                self.report_pdf(pdf_path, stats)
                 all_chunks.extend(chunks)
-            else:
-                print(f"⚠️  PDF no encontrado: {pdf_path}")
-        
         return all_chunks
     
-    def save_chunks(self, chunks: List[Dict[str, Any]], output_file: str = "pdf_chunks.json"):
+    def _pool(self, workers: int):
+        if workers > 1:
+            return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                       initargs=(self.worker_settings(),))
+        return _NoPool()
+    
+    def load_manifest(self, manifest_file: str) -> Dict[str, Any]:
+        """Leer el manifiesto de la ejecución anterior (vacío si no existe o no es compatible)"""
+        try:
+            with open(manifest_file, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if manifest.get("version") != MANIFEST_VERSION or manifest.get("settings") != self.settings():
+            # Otro formato u otros parámetros de chunking: no se puede reutilizar nada
+            return {}
+        return manifest
+    
+    def settings(self) -> Dict[str, Any]:
+        return {"chunk_size": self.chunk_size, "overlap": self.overlap,
+                "strip_headers": self.strip_headers, "dedup_threshold": self.dedup_threshold,
+                "normalize_text": self.normalize_text, "tokenizer": self.tokenizer.name}
+    
+    def process_incremental(self, pdfs_dir: str = "pdfs_curso", output_file: str = "pdf_chunks.json",
+                            manifest_file: str = "pdf_manifest.json", workers: int = 1,
+                            full: bool = False) -> Dict[str, Any]:
+        """
+        Reprocesar solo los PDFs que cambiaron desde la última ejecución
+        
+        El manifiesto guarda el hash de cada PDF, de cada página y los IDs de sus
+        chunks. Los PDFs con el mismo hash conservan los chunks del archivo de
+        salida anterior sin volver a extraerse. Los chunks se escriben a medida
+        que se generan, sin acumular el curso completo en memoria.
+        
+        Args:
+            pdfs_dir: Directorio con los PDFs del curso
+            output_file: Archivo JSON de chunks (se lee y se reescribe)
+            manifest_file: Archivo del manifiesto
+            workers: Procesos que procesan en paralelo los PDFs que deben reprocesarse
+            full: Ignorar el manifiesto y reprocesar todo
+        
+        Returns:
+            Resumen con los PDFs reutilizados, reprocesados y fallidos, los IDs
+            agregados y eliminados, el total de chunks y tokens escritos, lo
+            eliminado por encabezados repetidos y casi duplicados, y las
+            estadísticas de la normalización del texto
+        """
+        start = time.perf_counter()
+        manifest = {} if full else self.load_manifest(manifest_file)
+        previous_docs = manifest.get("documents", {}) if os.path.exists(output_file) else {}
+        previous = _PreviousChunks(output_file) if previous_docs else None
+        
+        summary = {"reused": [], "rebuilt": [], "failed": [], "added_ids": [], "removed_ids": []}
+        timings = {"workers": workers, "pages": 0, "extract": 0.0, "cached_pdfs": 0}
+        entries = {}
+        pdfs = discover_pdfs(pdfs_dir)
+        # Los chunks reutilizados entran al índice tal cual; los nuevos se comparan con todo lo anterior
+        index = self._duplicate_index()
+        self.stripper.stats = dict.fromkeys(self.stripper.stats, 0)
+        self.normalizer.reset_stats()
+        hashes = {pdf_path: file_hash(pdf_path) for pdf_path, _ in pdfs}
+        writer = ChunkWriter(output_file)
+        try:
+            with self._pool(workers) as pool:
+                # Los PDFs modificados se envían al pool por adelantado y se consumen en orden
+                prefetch = _DocumentPrefetcher(pool, [
+                    (pdf_path, info, hashes[pdf_path]) for pdf_path, info in pdfs
+                    if not self._unchanged(previous_docs.get(pdf_path), hashes[pdf_path], info)
+                ], workers) if pool else None
+                for pdf_path, info in pdfs:
+                    sha = hashes[pdf_path]
+                    old = previous_docs.get(pdf_path)
+                    if self._unchanged(old, sha, info):
+                        if self._copy_previous(writer, previous, pdf_path, old, index):
+                            print(f"♻️  Sin cambios: {pdf_path}")
+                            entries[pdf_path] = old
+                            summary["reused"].append(pdf_path)
+                            continue
+                    
+                    mark = writer.mark()
+                    stats = {}
+                    kept_ids = []
+                    try:
+                        chunks, signatures = self._document_chunks(pdf_path, info, stats, sha, prefetch)
+                        for chunk in self._drop_duplicates(chunks, index, kept_ids, signatures):
+                            writer.write(chunk)
+                    except Exception as e:
+                        print(f"❌ Error procesando {pdf_path}: {str(e)}")
+                        writer.rollback(mark)
+                        summary["failed"].append(pdf_path)
+                        # Se conserva la versión anterior si existe
+                        if old and self._copy_previous(writer, previous, pdf_path, old, index):
+                            entries[pdf_path] = old
+                        continue
+                    
+                    self.report_pdf(pdf_path, stats)
+                    timings["pages"] += stats["pages"]
+                    timings["extract"] += stats["extract_time"]
+                    timings["cached_pdfs"] += stats["cached"]
+                    if old:
+                        old_pages = old.get("pages", [])
+                        changed_pages = [i + 1 for i, page in enumerate(stats["page_hashes"])
+                                         if i >= len(old_pages) or old_pages[i] != page]
+                        if changed_pages:
+                            print(f"   - Páginas modificadas en {pdf_path}: {changed_pages}")
+                    entries[pdf_path] = {"sha256": sha, "info": info, "pages": stats["page_hashes"],
+                                         "tokens": stats["tokens"], "chunk_ids": kept_ids}
+                    summary["rebuilt"].append(pdf_path)
+        except BaseException:
+            writer.abort()
+            raise
+        
+        old_ids = {chunk_id for doc in previous_docs.values() for chunk_id in doc.get("chunk_ids", [])}
+        new_ids = {chunk_id for doc in entries.values() for chunk_id in doc["chunk_ids"]}
+        summary["added_ids"] = sorted(new_ids - old_ids)
+        summary["removed_ids"] = sorted(old_ids - new_ids)
+        summary["total_chunks"] = writer.count
+        summary["total_tokens"] = writer.tokens
+        summary["headers"] = dict(self.stripper.stats)
+        summary["duplicates"] = dict(index.stats) if index else {"checked": 0, "duplicates": 0, "tokens_removed": 0}
+        summary["normalization"] = dict(self.normalizer.stats)
+        
+        if summary["rebuilt"] or list(entries) != list(previous_docs):
+            writer.commit()
+            self.save_manifest({"version": MANIFEST_VERSION, "settings": self.settings(), "documents": entries},
+                               manifest_file)
+            print(f"✅ Chunks guardados en: {output_file}")
+            print(f"   - Total chunks: {writer.count}")
+        else:
+            writer.abort()
+        
+        timings["total"] = time.perf_counter() - start
+        timings["pdfs"] = len(pdfs)
+        self.last_timings = timings
+        return summary
+    
+    @staticmethod
+    def _unchanged(entry: Optional[Dict[str, Any]], sha: str, info: Dict[str, Any]) -> bool:
+        return bool(entry) and entry.get("sha256") == sha and entry.get("info") == info
+    
+    def _copy_previous(self, writer: ChunkWriter, previous: Optional[_PreviousChunks], pdf_path: str,
+                       entry: Dict[str, Any], index: Optional[NearDuplicateIndex] = None) -> bool:
+        """Copiar al nuevo archivo los chunks anteriores de un PDF; False si no coinciden con el manifiesto"""
+        if previous is None:
+            return False
+        mark = writer.mark()
+        ids = []
+        signatures = []
+        for chunk in previous.take(pdf_path):
+            writer.write(chunk)
+            ids.append(chunk["id"])
+            if index is not None:
+                signatures.append(index.signature(chunk["content"]))
+        if ids != entry.get("chunk_ids"):
+            writer.rollback(mark)
+            return False
+        for chunk_id, signature in zip(ids, signatures):
+            index.add(chunk_id, signature)
+        return True
+    
+    def save_manifest(self, manifest: Dict[str, Any], manifest_file: str = "pdf_manifest.json"):
+        """Guardar el manifiesto de forma atómica"""
+        tmp_file = manifest_file + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, manifest_file)
+    
+    def print_timings(self):
+        """Mostrar tiempos de la última ejecución de process_incremental"""
+        timings = self.last_timings
+        if not timings:
+            return
+        print(f"\n⏱️  Tiempos de preprocesamiento ({timings['workers']} proceso(s)):")
+        if timings['workers'] > 1:
+            print(f"   - Espera a los workers ({timings['pages']} páginas extraídas y divididas): {timings['extract']:.2f}s")
+        else:
+            print(f"   - Extracción de {timings['pages']} páginas: {timings['extract']:.2f}s")
+        if timings.get("cached_pdfs"):
+            print(f"   - PDFs leídos desde la caché de páginas: {timings['cached_pdfs']}")
+        print(f"   - División en chunks y escritura: {timings['total'] - timings['extract']:.2f}s")
+        print(f"   - Total ({timings['pdfs']} PDFs): {timings['total']:.2f}s")
+    
+    def save_chunks(self, chunks: Iterable[Dict[str, Any]], output_file: str = "pdf_chunks.json"):
         """
         Guardar chunks en archivo JSON
         
         Args:
-            chunks: Lista de chunks a guardar
+            chunks: Chunks a guardar (lista o generador)
             output_file: Archivo de salida
         """
         try:
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(chunks, f, ensure_ascii=False, indent=2)
+            writer = ChunkWriter(output_file)
+            try:
+                for chunk in chunks:
+                    writer.write(chunk)
+            except BaseException:
+                writer.abort()
+                raise
+            writer.commit()
             
             print(f"✅ Chunks guardados en: {output_file}")
-            print(f"   - Total chunks: {len(chunks)}")
-            
+            print(f"   - Total chunks: {writer.count}")
+        
         except Exception as e:
             print(f"❌ Error guardando chunks: {str(e)}")
 
+class _DocumentPrefetcher:
+    """
+    Documentos enviados al pool, con a lo sumo `2 * workers` en vuelo
+
+    Los resultados se piden en el orden de los PDFs; al entregar uno se envía
+    el siguiente, así los workers siguen procesando mientras el proceso
+    principal escribe.
+    """
+    
+    def __init__(self, pool: ProcessPoolExecutor, documents: List[Tuple[str, Dict[str, Any], Optional[str]]],
+                 workers: int):
+        self.pool = pool
+        self.window = max(1, workers * 2)
+        self._documents = deque(documents)
+        self._in_flight: "OrderedDict[str, Any]" = OrderedDict()
+        self._fill()
+    
+    def _fill(self):
+        while self._documents and len(self._in_flight) < self.window:
+            pdf_path, info, sha = self._documents.popleft()
+            self._in_flight[pdf_path] = self.pool.submit(_process_document, pdf_path, info, sha)
+    
+    def result(self, pdf_path: str) -> Optional[Dict[str, Any]]:
+        """Resultado del documento (espera si aún se procesa), o None si no se envió al pool"""
+        future = self._in_flight.pop(pdf_path, None)
+        if future is None:
+            return None
+        try:
+            return future.result()
+        finally:
+            self._fill()
+
+class _NoPool:
+    """Sustituto de ProcessPoolExecutor para el modo secuencial"""
+    
+    def __enter__(self):
+        return None
+    
+    def __exit__(self, *exc):
+        return False
+
 def main():
     """Función principal para ejecutar el preprocesamiento"""
+    parser = argparse.ArgumentParser(description="Preprocesamiento de PDFs del curso PAC")
+    parser.add_argument("--pdfs-dir", default="pdfs_curso")
+    parser.add_argument("--output", default="pdf_chunks.json")
+    parser.add_argument("--manifest", default="pdf_manifest.json")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Procesos que procesan PDFs en paralelo (0 = un proceso por núcleo)")
+    parser.add_argument("--full", action="store_true", help="Reprocesar todos los PDFs aunque no hayan cambiado")
+    parser.add_argument("--store", help="Escribir también los chunks en formato compacto (p. ej. pdf_chunks.pacchunks)")
+    parser.add_argument("--keep-headers", action="store_true", help="No quitar encabezados y pies de página repetidos")
+    parser.add_argument("--dedup-threshold", type=float, default=0.85,
+                        help="Similitud para descartar chunks casi duplicados (0 = desactivado)")
+    parser.add_argument("--page-cache", default=os.getenv("PAGE_CACHE_DIR", DEFAULT_CACHE_DIR),
+                        help="Directorio de la caché del texto extraído de las páginas")
+    parser.add_argument("--no-page-cache", action="store_true", help="Extraer siempre el texto de los PDFs")
+    parser.add_argument("--no-normalize", action="store_true",
+                        help="No reparar palabras partidas, saltos de línea ni glifos del texto extraído")
+    args = parser.parse_args()
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    
     print("🚀 Iniciando preprocesamiento de PDFs del curso PAC...")
     
     # Crear preprocesador
-    preprocessor = PDFPreprocessor(chunk_size=800, overlap=100)
+    preprocessor = PDFPreprocessor(chunk_size=800, overlap=100, strip_headers=not args.keep_headers,
+                                   dedup_threshold=args.dedup_threshold, normalize_text=not args.no_normalize,
+                                   page_cache_dir=None if args.no_page_cache else args.page_cache)
     
-    # Procesar todos los PDFs
-    all_chunks = preprocessor.process_all_pdfs()
+    # Procesar los PDFs nuevos o modificados (y guardar chunks y manifiesto)
+    summary = preprocessor.process_incremental(args.pdfs_dir, args.output, args.manifest,
+                                               workers=workers, full=args.full)
+    preprocessor.print_timings()
     
-    if all_chunks:
-        # Guardar chunks en archivo JSON
-        preprocessor.save_chunks(all_chunks)
+    if summary["total_chunks"]:
+        print(f"\n🔁 PDFs reutilizados: {len(summary['reused'])}, reprocesados: {len(summary['rebuilt'])}")
+        print(f"   - Chunks nuevos: {len(summary['added_ids'])}, eliminados: {len(summary['removed_ids'])}")
+        if summary["failed"]:
+            print(f"   - PDFs con error: {', '.join(summary['failed'])}")
+        
+        headers, duplicates = summary["headers"], summary["duplicates"]
+        print(f"\n🧹 Texto repetido eliminado:")
+        print(f"   - Encabezados/pies de página: {headers['lines_removed']} líneas ({headers['tokens_removed']} tokens)")
+        print(f"   - Chunks casi duplicados: {duplicates['duplicates']} de {duplicates['checked']} "
+              f"({duplicates['tokens_removed']} tokens)")
+        
+        normalization = summary["normalization"]
+        if normalization["pages"]:
+            print(f"\n🔤 Normalización del texto ({normalization['pages']} páginas):")
+            print(f"   - Tokens: {normalization['tokens_before']} -> {normalization['tokens_after']}")
+            print(f"   - Vocabulario: {normalization['vocab_before']} -> {normalization['vocab_after']} palabras distintas")
+            print(f"   - Palabras partidas unidas: {normalization['words_joined']}, "
+                  f"guiones de corte: {normalization['hyphens_repaired']}, glifos: {normalization['glyphs_mapped']}")
         
         # Estadísticas finales
-        total_tokens = sum(chunk["tokens"] for chunk in all_chunks)
-        avg_chunk_size = total_tokens // len(all_chunks)
+        avg_chunk_size = summary["total_tokens"] // summary["total_chunks"]
         
         print(f"\n📊 Estadísticas finales:")
-        print(f"   - Total chunks: {len(all_chunks)}")
-        print(f"   - Total tokens: {total_tokens}")
+        print(f"   - Total chunks: {summary['total_chunks']}")
+        print(f"   - Total tokens: {summary['total_tokens']}")
         print(f"   - Tamaño promedio por chunk: {avg_chunk_size} tokens")
-        print(f"   - Archivo de salida: pdf_chunks.json")
+        print(f"   - Archivo de salida: {args.output}")
         
+        if args.store:
+            write_chunk_store(iter_json_chunks(args.output), args.store)
+            print(f"   - Formato compacto: {args.store}")
+    
     else:
         print("❌ No se pudieron procesar los PDFs")
 
@@ -0,0 +1,124 @@
+"""
+Perfilado opcional por petición para la API del Chatbot PAC
+Ejecuta la petición bajo cProfile cuando se solicita con la cabecera
+X-Profile (solo claves de administrador) o por muestreo, guarda el perfil
+completo en PROFILE_DIR para analizarlo con pstats/snakeviz y resume las
+funciones más costosas.
+"""
+
+import cProfile
+import os
+import pstats
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+PROFILE_HEADER = 'X-Profile'
+
+
+class RequestProfiler:
+    def __init__(self, profile_dir: str = 'profiles', sample_rate: float = 0.0,
+                 admin_keys: Optional[List[str]] = None, key_header: str = 'X-API-Key',
+                 top_n: int = 15):
+        """
+        Inicializar perfilador de peticiones
+
+        Args:
+            profile_dir: Directorio donde se guardan los archivos .prof
+            sample_rate: Fracción de peticiones perfiladas automáticamente (0 = nunca)
+            admin_keys: Claves de API autorizadas a pedir perfiles con X-Profile
+            key_header: Cabecera que contiene la clave de API
+            top_n: Funciones a incluir en el resumen
+        """
+        self.profile_dir = profile_dir
+        self.sample_rate = sample_rate
+        self.admin_keys = set(admin_keys or [])
+        self.key_header = key_header
+        self.top_n = top_n
+        # cProfile no admite dos perfiladores activos a la vez en el mismo proceso
+        self._active = threading.Lock()
+        self.stats = {'profiled': 0, 'sampled': 0, 'busy': 0, 'denied': 0}
+
+    def requested_mode(self, headers) -> Optional[str]:
+        """
+        Decidir si la petición debe perfilarse
+
+        Returns:
+            'header' si un administrador lo pidió, 'sample' si salió en el muestreo, o None
+        """
+        if headers.get(PROFILE_HEADER):
+            if self.admin_keys and headers.get(self.key_header) in self.admin_keys:
+                return 'header'
+            self.stats['denied'] += 1
+            return None
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return 'sample'
+        return None
+
+    def start(self) -> Optional[cProfile.Profile]:
+        """Activar el perfilador; None si ya hay otra petición perfilándose"""
+        if not self._active.acquire(blocking=False):
+            self.stats['busy'] += 1
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Otro perfilador (p. ej. un depurador) ya está activo
+            self._active.release()
+            self.stats['busy'] += 1
+            return None
+        return profile
+
+    def finish(self, profile: cProfile.Profile, name: str, mode: str) -> Dict[str, Any]:
+        """
+        Detener el perfilador, guardar el perfil y resumir las funciones más costosas
+
+        Args:
+            profile: Perfilador devuelto por start()
+            name: Identificador de la petición (endpoint + request id)
+            mode: 'header' o 'sample'
+
+        Returns:
+            Diccionario con la ruta del archivo y las funciones principales
+        """
+        try:
+            profile.disable()
+        finally:
+            self._active.release()
+        self.stats['profiled'] += 1
+        if mode == 'sample':
+            self.stats['sampled'] += 1
+
+        path = None
+        if self.profile_dir:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            safe_name = re.sub(r'[^A-Za-z0-9_.-]', '_', name)
+            path = os.path.join(self.profile_dir, f"{time.strftime('%Y%m%d_%H%M%S')}_{safe_name}.prof")
+            profile.dump_stats(path)
+
+        return {'file': path, 'top_functions': self.top_functions(profile)}
+
+    def top_functions(self, profile: cProfile.Profile) -> List[Dict[str, Any]]:
+        """Funciones ordenadas por tiempo acumulado"""
+        stats = pstats.Stats(profile)
+        rows = []
+        for (filename, line, function), (_, calls, own, cumulative, _) in stats.stats.items():
+            rows.append({
+                'function': f"{os.path.basename(filename)}:{line}({function})",
+                'calls': calls,
+                'own_ms': round(own * 1000, 3),
+                'cumulative_ms': round(cumulative * 1000, 3)
+            })
+        rows.sort(key=lambda row: row['cumulative_ms'], reverse=True)
+        return rows[:self.top_n]
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            'profile_dir': self.profile_dir,
+            'sample_rate': self.sample_rate,
+            'admin_keys': len(self.admin_keys),
+            'stats': dict(self.stats)
+        }
@@ -0,0 +1,215 @@
+"""
+Registro de plantillas de prompt del Chatbot PAC
+Carga cada prompt una sola vez, guarda su texto y su conteo de tokens, y lo
+recarga solo cuando cambia la fecha de modificación del archivo. Admite
+plantillas con nombre y versión por curso o unidad en el directorio prompts/.
+
+Convención de archivos:
+    prompt_sistema.txt          -> plantilla 'default'
+    prompts/<nombre>.txt        -> plantilla <nombre>, versión 0
+    prompts/<nombre>.v<N>.txt   -> plantilla <nombre>, versión N (gana la mayor)
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from tokenizer import count_tokens
+
+DEFAULT_NAME = 'default'
+
+FALLBACK_PROMPT = """
+            Eres un asistente educativo especializado en el Plan de Aseguramiento de la Calidad en Construcción (PAC).
+            Responde basándote SOLO en el contenido de los PDFs del curso.
+            Cita definiciones textuales cuando sea posible.
+            Menciona siempre la unidad específica del curso.
+            Mantén las respuestas concisas y específicas.
+            """
+
+_VERSIONED_FILE = re.compile(r'^(?P<name>.+?)(?:\.v(?P<version>\d+))?\.txt$')
+
+
+class PromptTemplate:
+    def __init__(self, name: str, version: int, text: str, path: Optional[str], mtime: Optional[float]):
+        """
+        Plantilla de prompt cargada en memoria
+
+        Args:
+            name: Nombre de la plantilla (p. ej. 'default', 'pac_unidad2')
+            version: Versión declarada en el nombre del archivo
+            text: Contenido del prompt
+            path: Archivo de origen (None para el prompt de respaldo)
+            mtime: Fecha de modificación del archivo al cargarlo
+        """
+        self.name = name
+        self.version = version
+        self.text = text
+        self.path = path
+        self.mtime = mtime
+        self.tokens = count_tokens(text)
+        digest = hashlib.sha256(text.encode('utf-8')).hexdigest()[:8]
+        # Identificador estable para claves de caché: cambia si cambia el contenido
+        self.version_id = f"{name}:v{version}:{digest}"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'version': self.version,
+            'version_id': self.version_id,
+            'tokens': self.tokens,
+            'path': self.path
+        }
+
+
+class PromptRegistry:
+    def __init__(self, default_file: str = 'prompt_sistema.txt', prompts_dir: str = 'prompts',
+                 check_interval: float = 2.0):
+        """
+        Inicializar registro de prompts
+
+        Args:
+            default_file: Archivo de la plantilla 'default'
+            prompts_dir: Directorio con plantillas por curso o unidad
+            check_interval: Segundos mínimos entre comprobaciones de mtime
+        """
+        self._lock = threading.Lock()
+        self.configure(default_file, prompts_dir, check_interval)
+
+    def configure(self, default_file: str = 'prompt_sistema.txt', prompts_dir: str = 'prompts',
+                  check_interval: float = 2.0):
+        """Ajustar rutas e intervalo de comprobación; vacía la caché"""
+        with self._lock:
+            self.default_file = default_file
+            self.prompts_dir = prompts_dir
+            self.check_interval = check_interval
+            self._templates: Dict[Tuple[str, Optional[int]], PromptTemplate] = {}
+            self._checked_at: Dict[Tuple[str, Optional[int]], float] = {}
+            self._listing: Dict[str, Dict[int, str]] = {}
+            self._listing_mtime = None
+            self._scanned_at = None
+            self.loads = 0
+
+    @staticmethod
+    def _mtime(path: str) -> Optional[float]:
+        try:
+            return os.stat(path).st_mtime
+        except OSError:
+            return None
+
+    def _scan(self) -> Dict[str, Dict[int, str]]:
+        """Listar prompts/<nombre>[.vN].txt; solo se relee si cambió el directorio"""
+        now = time.monotonic()
+        if self._scanned_at is not None and now - self._scanned_at < self.check_interval:
+            return self._listing
+        self._scanned_at = now
+        dir_mtime = self._mtime(self.prompts_dir) if self.prompts_dir else None
+        if dir_mtime == self._listing_mtime:
+            return self._listing
+        listing: Dict[str, Dict[int, str]] = {}
+        if dir_mtime is not None:
+            for filename in os.listdir(self.prompts_dir):
+                match = _VERSIONED_FILE.match(filename)
+                if match:
+                    version = int(match.group('version') or 0)
+                    listing.setdefault(match.group('name'), {})[version] = os.path.join(self.prompts_dir, filename)
+        self._listing = listing
+        self._listing_mtime = dir_mtime
+        return listing
+
+    def _locate(self, name: str, version: Optional[int]) -> Tuple[Optional[str], int]:
+        versions = self._scan().get(name, {})
+        if versions:
+            chosen = version if version is not None else max(versions)
+            if chosen in versions:
+                return versions[chosen], chosen
+        if name == DEFAULT_NAME and version in (None, 0):
+            return self.default_file, 0
+        return None, version or 0
+
+    def _load(self, name: str, version: int, path: Optional[str]) -> PromptTemplate:
+        mtime = self._mtime(path) if path else None
+        text = None
+        if mtime is not None:
+            try:
+                with open(path, 'r', encoding='utf-8') as file:
+                    text = file.read()
+            except OSError:
+                mtime = None
+        if text is None:
+            path = None
+            text = FALLBACK_PROMPT
+        self.loads += 1
+        return PromptTemplate(name, version, text, path, mtime)
+
+    def has(self, name: str) -> bool:
+        """Indicar si existe una plantilla con ese nombre"""
+        with self._lock:
+            return name == DEFAULT_NAME or name in self._scan()
+
+    def get(self, name: str = DEFAULT_NAME, version: Optional[int] = None) -> PromptTemplate:
+        """
+        Obtener una plantilla, recargándola si su archivo cambió
+
+        Args:
+            name: Nombre de la plantilla
+            version: Versión concreta (None = la más reciente)
+
+        Returns:
+            PromptTemplate (el prompt de respaldo si no existe ningún archivo)
+        """
+        with self._lock:
+            return self._get_locked(name, version, time.monotonic())
+
+    def _get_locked(self, name: str, version: Optional[int], now: float) -> PromptTemplate:
+        key = (name, version)
+        template = self._templates.get(key)
+        if template is not None and now - self._checked_at.get(key, 0.0) < self.check_interval:
+            return template
+
+        path, resolved_version = self._locate(name, version)
+        if path is None and name != DEFAULT_NAME:
+            # Plantilla inexistente: usar la plantilla por defecto
+            return self._get_locked(DEFAULT_NAME, None, now)
+        if template is None or template.path != path or template.version != resolved_version \
+                or (path and self._mtime(path) != template.mtime):
+            template = self._load(name, resolved_version, path)
+            self._templates[key] = template
+        self._checked_at[key] = now
+        return template
+
+    def resolve(self, course_id: Optional[str] = None, unidad: Optional[Any] = None) -> PromptTemplate:
+        """
+        Elegir la plantilla más específica disponible
+
+        Orden: <curso>_unidad<N>, unidad<N>, <curso>, default
+        """
+        candidates: List[str] = []
+        if course_id and unidad is not None:
+            candidates.append(f"{course_id}_unidad{unidad}")
+        if unidad is not None:
+            candidates.append(f"unidad{unidad}")
+        if course_id:
+            candidates.append(str(course_id))
+        for name in candidates:
+            if self.has(name):
+                return self.get(name)
+        return self.get(DEFAULT_NAME)
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            templates = [t.to_dict() for t in self._templates.values()]
+            available = sorted(self._listing)
+        return {
+            'default_file': self.default_file,
+            'prompts_dir': self.prompts_dir,
+            'loaded': templates,
+            'available': available,
+            'loads': self.loads
+        }
+
+
+# Registro global del proceso (api_lms lo configura con APIConfig)
+registry = PromptRegistry()
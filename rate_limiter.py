@@ -0,0 +1,164 @@
+"""
+Rate limiting por token bucket para la API del Chatbot PAC
+Un bucket por clave de API (o IP), por usuario y por curso. El estado vive en
+una base SQLite local compartida por todos los workers de gunicorn del mismo
+host; cada verificación es una transacción corta con búsquedas por clave
+primaria. Sin ruta de base de datos se usa un diccionario en memoria (un
+bucket independiente por proceso).
+"""
+
+import math
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class RateLimitResult:
+    """Resultado de una verificación, con los valores para las cabeceras X-RateLimit-*"""
+    __slots__ = ('allowed', 'limit', 'remaining', 'reset', 'retry_after', 'scope')
+
+    def __init__(self, allowed: bool, limit: int, remaining: int, reset: float,
+                 retry_after: float = 0.0, scope: Optional[str] = None):
+        self.allowed = allowed
+        self.limit = limit
+        self.remaining = remaining
+        self.reset = reset
+        self.retry_after = retry_after
+        self.scope = scope
+
+    def headers(self) -> Dict[str, str]:
+        headers = {
+            'X-RateLimit-Limit': str(self.limit),
+            'X-RateLimit-Remaining': str(self.remaining),
+            'X-RateLimit-Reset': str(int(math.ceil(self.reset)))
+        }
+        if not self.allowed:
+            headers['Retry-After'] = str(max(1, int(math.ceil(self.retry_after))))
+        return headers
+
+
+class TokenBucketLimiter:
+    CLEANUP_EVERY = 1000
+
+    def __init__(self, db_path: str = '', window: float = 3600.0):
+        """
+        Inicializar rate limiter
+
+        Args:
+            db_path: Base SQLite compartida entre procesos ('' = memoria del proceso)
+            window: Segundos en los que se recarga un bucket completo
+        """
+        self.db_path = db_path
+        self.window = window
+        self._local = threading.local()
+        self._memory: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+        self._checks = 0
+        self.stats = {'allowed': 0, 'limited': 0, 'errors': 0}
+        if db_path:
+            with self._connection() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS buckets ("
+                    "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+                )
+
+    def _connection(self) -> sqlite3.Connection:
+        """Una conexión por hilo (sqlite3 no comparte conexiones entre hilos)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _refill(self, tokens: float, updated: float, capacity: int, now: float) -> float:
+        rate = capacity / self.window
+        return min(float(capacity), tokens + (now - updated) * rate)
+
+    def check(self, limits: List[Tuple[str, int]], cost: int = 1) -> RateLimitResult:
+        """
+        Consumir `cost` tokens de cada bucket, solo si todos tienen saldo
+
+        Args:
+            limits: Pares (clave del bucket, capacidad); capacidad <= 0 = sin límite
+            cost: Tokens a consumir (p. ej. número de preguntas de un lote)
+
+        Returns:
+            RateLimitResult del bucket más restrictivo
+        """
+        limits = [(key, capacity) for key, capacity in limits if capacity > 0]
+        if not limits:
+            return RateLimitResult(True, 0, 0, 0.0)
+
+        now = time.time()
+        try:
+            if self.db_path:
+                levels = self._check_sqlite(limits, cost, now)
+            else:
+                levels = self._check_memory(limits, cost, now)
+        except sqlite3.Error:
+            # Un fallo del almacén no debe tumbar la API: se deja pasar
+            self.stats['errors'] += 1
+            return RateLimitResult(True, limits[0][1], limits[0][1], 0.0)
+
+        allowed = all(tokens >= cost for _, _, tokens in levels)
+        # Bucket más restrictivo: el que queda con menos tokens relativos
+        key, capacity, tokens = min(levels, key=lambda level: level[2] / level[1])
+        remaining = tokens - cost if allowed else tokens
+        rate = capacity / self.window
+        reset = (capacity - remaining) / rate
+        retry_after = 0.0 if allowed else (cost - tokens) / rate
+        self.stats['allowed' if allowed else 'limited'] += 1
+        return RateLimitResult(allowed, capacity, max(0, int(remaining)), reset, retry_after,
+                               key.split(':', 1)[0])
+
+    def _check_memory(self, limits, cost, now):
+        with self._lock:
+            levels = []
+            for key, capacity in limits:
+                tokens, updated = self._memory.get(key, (float(capacity), now))
+                levels.append((key, capacity, self._refill(tokens, updated, capacity, now)))
+            allowed = all(tokens >= cost for _, _, tokens in levels)
+            for key, capacity, tokens in levels:
+                self._memory[key] = (tokens - cost if allowed else tokens, now)
+            self._checks += 1
+            if self._checks % self.CLEANUP_EVERY == 0:
+                # Un bucket sin uso durante una ventana completa está lleno: no hace falta guardarlo
+                stale = [k for k, (_, updated) in self._memory.items() if now - updated > self.window]
+                for k in stale:
+                    del self._memory[k]
+            return levels
+
+    def _check_sqlite(self, limits, cost, now):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            levels = []
+            for key, capacity in limits:
+                row = conn.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+                tokens, updated = row if row else (float(capacity), now)
+                levels.append((key, capacity, self._refill(tokens, updated, capacity, now)))
+            allowed = all(tokens >= cost for _, _, tokens in levels)
+            conn.executemany(
+                'INSERT INTO buckets (key, tokens, updated) VALUES (?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated',
+                [(key, tokens - cost if allowed else tokens, now) for key, _, tokens in levels]
+            )
+            self._checks += 1
+            if self._checks % self.CLEANUP_EVERY == 0:
+                conn.execute('DELETE FROM buckets WHERE updated < ?', (now - self.window,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return levels
+
+    def get_status(self) -> Dict:
+        return {
+            'backend': 'sqlite' if self.db_path else 'memory',
+            'db_path': self.db_path,
+            'window': self.window,
+            'stats': dict(self.stats)
+        }
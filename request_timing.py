@@ -0,0 +1,80 @@
+"""
+Medición de tiempos por etapa de cada petición de la API
+Los tiempos se acumulan en un contexto por petición y se reportan al
+cliente en la cabecera estándar Server-Timing
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+_current = ContextVar('stage_timings', default=None)
+
+
+class StageTimings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    def add(self, name: str, seconds: float):
+        """Acumular tiempo en una etapa (una etapa puede repetirse)"""
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def total(self) -> float:
+        return time.perf_counter() - self.started
+
+    def to_dict(self) -> Dict[str, float]:
+        """Tiempos por etapa en milisegundos"""
+        timings = {name: round(seconds * 1000, 2) for name, seconds in self.stages.items()}
+        timings['total'] = round(self.total() * 1000, 2)
+        return timings
+
+    def server_timing_header(self) -> str:
+        """Valor de la cabecera Server-Timing (duraciones en ms)"""
+        return ', '.join(f"{name};dur={ms}" for name, ms in self.to_dict().items())
+
+
+def begin() -> StageTimings:
+    """Iniciar la medición para la petición actual"""
+    timings = StageTimings()
+    _current.set(timings)
+    return timings
+
+
+def current() -> Optional[StageTimings]:
+    return _current.get()
+
+
+def end():
+    _current.set(None)
+
+
+@contextmanager
+def stage(name: str):
+    """Medir un bloque como etapa de la petición actual (sin costo si no hay medición activa)"""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
+
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    """Convertir una cabecera Server-Timing en {etapa: ms}"""
+    result = {}
+    for part in (header or '').split(','):
+        fields = [f.strip() for f in part.split(';')]
+        if not fields or not fields[0]:
+            continue
+        for field in fields[1:]:
+            if field.startswith('dur='):
+                try:
+                    result[fields[0]] = float(field[4:])
+                except ValueError:
+                    pass
+    return result
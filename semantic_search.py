@@ -3,24 +3,99 @@ Sistema de búsqueda semántica para chunks del curso PAC
 Encuentra los chunks más relevantes para cada pregunta del estudiante
 """
 
-import json
+import logging
 import os
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
 import re
 
+from chunk_store import load_chunks
+
+logger = logging.getLogger(__name__)
+
+# Palabras vacías en español (sklearn solo incluye la lista en inglés)
+SPANISH_STOP_WORDS = [
+    "a", "al", "algo", "algunas", "algunos", "ante", "antes", "como", "con", "contra",
+    "cual", "cuales", "cuando", "de", "del", "desde", "donde", "durante", "e", "el",
+    "ella", "ellas", "ellos", "en", "entre", "era", "es", "esa", "esas", "ese", "eso",
+    "esos", "esta", "estas", "este", "esto", "estos", "fue", "fueron", "ha", "han",
+    "hasta", "hay", "la", "las", "le", "les", "lo", "los", "mas", "más", "me", "mi",
+    "muy", "ni", "no", "nos", "o", "otra", "otras", "otro", "otros", "para", "pero",
+    "por", "porque", "que", "qué", "se", "sea", "sean", "según", "ser", "si", "sí",
+    "sin", "sobre", "son", "su", "sus", "también", "tanto", "te", "tiene", "tienen",
+    "todo", "todos", "tu", "un", "una", "uno", "unos", "unas", "y", "ya", "yo",
+    "cómo", "cuál", "cuáles", "debe", "deben", "puede", "pueden", "así", "cada",
+    "asi", "segun", "tambien"
+]
+
+# Indicadores de que una pregunta depende del turno anterior
+FOLLOW_UP_CONNECTOR = re.compile(
+    r'^\W*(y|e|pero|entonces|además|ademas|también|tambien|o sea|y si|qué más|que mas)\b',
+    re.IGNORECASE
+)
+FOLLOW_UP_REFERENCE = re.compile(
+    r'\b(sus?|eso|esto|esa|ese|esos|esas|estos|estas|ello|lo anterior|dicho|dicha|mencionad[oa]s?)\b',
+    re.IGNORECASE
+)
+# Palabras que no nombran un tema por sí mismas ("dame un ejemplo", "¿más detalles?")
+GENERIC_FOLLOW_UP_WORDS = {
+    "ejemplo", "ejemplos", "detalle", "detalles", "explica", "explícame", "explicame", "dame",
+    "pasa", "sirve", "significa", "importante", "importancia", "otro", "otra", "otros", "otras"
+}
+_QUERY_WORD = re.compile(r'\w+')
+
+
+def topic_words(query: str) -> List[str]:
+    """Palabras de la pregunta que nombran un tema (sin palabras vacías ni genéricas)"""
+    stop_words = set(SPANISH_STOP_WORDS) | GENERIC_FOLLOW_UP_WORDS
+    return [word for word in _QUERY_WORD.findall(query.lower()) if word not in stop_words]
+
+
+def is_follow_up(query: str, max_words: int = 3, max_topic_words: int = 2) -> bool:
+    """
+    Detectar preguntas de seguimiento ("¿y cuáles son sus requisitos?")
+    
+    Una pregunta es de seguimiento si empieza con un conector ("y", "pero",
+    "entonces"), si hace referencia al turno anterior ("sus", "eso") y nombra
+    a lo más `max_topic_words` temas propios, o si es corta y no nombra ningún
+    tema ("¿por qué?", "dame un ejemplo"). "¿Qué es ISO 9001?" no lo es.
+    
+    Args:
+        query: Pregunta del estudiante
+        max_words: Largo máximo de una pregunta corta sin tema
+        max_topic_words: Temas propios que admite una pregunta con referencia al turno anterior
+    """
+    if FOLLOW_UP_CONNECTOR.search(query):
+        return True
+    topics = topic_words(query)
+    if FOLLOW_UP_REFERENCE.search(query):
+        return len(topics) <= max_topic_words
+    return len(query.split()) <= max_words and not topics
+
+
 class SemanticSearch:
-    def __init__(self, chunks_file: str = "pdf_chunks.json"):
+    # Parámetros actuales del vectorizador TF-IDF
+    DEFAULT_VECTORIZER_PARAMS = {
+        "max_features": 1000,
+        "stop_words": "english",
+        "ngram_range": (1, 2),
+        "min_df": 2
+    }
+    
+    def __init__(self, chunks_file: str = "pdf_chunks.json", vectorizer_params: Dict[str, Any] = None):
         """
         Inicializar sistema de búsqueda semántica
         
         Args:
-            chunks_file: Archivo JSON con los chunks preprocesados
+            chunks_file: Archivo con los chunks preprocesados (JSON o formato compacto de chunk_store)
+            vectorizer_params: Parámetros de TfidfVectorizer (por defecto DEFAULT_VECTORIZER_PARAMS)
         """
         self.chunks_file = chunks_file
+        self.vectorizer_params = dict(vectorizer_params or self.DEFAULT_VECTORIZER_PARAMS)
         self.chunks = []
+        self.chunk_index = {}  # id del chunk -> fila de la matriz
         self.vectorizer = None
         self.chunk_vectors = None
         
@@ -30,10 +105,9 @@ class SemanticSearch:
             self.create_embeddings()
     
     def load_chunks(self):
-        """Cargar chunks desde archivo JSON"""
+        """Cargar chunks desde archivo JSON o compacto (el compacto carga el texto bajo demanda)"""
         try:
-            with open(self.chunks_file, 'r', encoding='utf-8') as f:
-                self.chunks = json.load(f)
+            self.chunks = load_chunks(self.chunks_file)
             print(f"✅ Cargados {len(self.chunks)} chunks desde {self.chunks_file}")
         except Exception as e:
             print(f"❌ Error cargando chunks: {str(e)}")
@@ -46,19 +120,15 @@ class SemanticSearch:
             return
         
         try:
-            # Extraer contenido de los chunks
-            chunk_texts = [chunk["content"] for chunk in self.chunks]
+            # Contenido de los chunks (generador: con el formato compacto no se retiene el texto)
+            chunk_texts = (chunk["content"] for chunk in self.chunks)
             
             # Crear vectorizador TF-IDF
-            self.vectorizer = TfidfVectorizer(
-                max_features=1000,
-                stop_words='english',
-                ngram_range=(1, 2),
-                min_df=2
-            )
+            self.vectorizer = TfidfVectorizer(**self.vectorizer_params)
             
             # Crear matriz de embeddings
             self.chunk_vectors = self.vectorizer.fit_transform(chunk_texts)
+            self.chunk_index = {chunk["id"]: i for i, chunk in enumerate(self.chunks)}
             
             print(f"✅ Embeddings creados para {len(self.chunks)} chunks")
             print(f"   - Dimensiones: {self.chunk_vectors.shape}")
@@ -78,7 +148,7 @@ class SemanticSearch:
             Lista de chunks más relevantes ordenados por relevancia
         """
         if not self.chunks or self.vectorizer is None or self.chunk_vectors is None:
-            print("⚠️  Sistema de búsqueda no inicializado")
+            logger.warning("Sistema de búsqueda no inicializado")
             return []
         
         try:
@@ -90,28 +160,111 @@ class SemanticSearch:
             
             # Obtener índices de los chunks más similares
             top_indices = similarities.argsort()[-top_k:][::-1]
+            results = self._build_results(top_indices, similarities[top_indices])
             
-            # Crear resultados con información de relevancia
-            results = []
-            for idx in top_indices:
-                chunk = self.chunks[idx].copy()
-                chunk["relevance_score"] = float(similarities[idx])
-                chunk["similarity_percentage"] = round(similarities[idx] * 100, 2)
-                results.append(chunk)
-            
-            # Ordenar por relevancia
-            results.sort(key=lambda x: x["relevance_score"], reverse=True)
-            
-            print(f"🔍 Búsqueda para: '{query}'")
-            print(f"   - Chunks encontrados: {len(results)}")
-            print(f"   - Mejor relevancia: {results[0]['similarity_percentage']}%")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Búsqueda completada", extra={
+                    'query': query,
+                    'chunks_found': len(results),
+                    'best_similarity': results[0]['similarity_percentage'] if results else None
+                })
             
             return results
             
         except Exception as e:
-            print(f"❌ Error en búsqueda: {str(e)}")
+            logger.error("Error en búsqueda: %s", str(e), extra={'query': query})
             return []
     
+    def search_many(self, queries: List[str], top_k: int = 3) -> List[List[Dict[str, Any]]]:
+        """
+        Buscar los chunks de varias consultas en una sola pasada de puntuación
+        
+        Args:
+            queries: Preguntas de los estudiantes
+            top_k: Número de chunks a retornar por consulta
+            
+        Returns:
+            Una lista de resultados por consulta, en el mismo orden
+        """
+        if not queries:
+            return []
+        if not self.chunks or self.vectorizer is None or self.chunk_vectors is None:
+            logger.warning("Sistema de búsqueda no inicializado")
+            return [[] for _ in queries]
+        
+        # Una sola transformación y un solo producto matriz-matriz para todas las consultas
+        query_vectors = self.vectorizer.transform(queries)
+        similarities = cosine_similarity(query_vectors, self.chunk_vectors)
+        k = min(top_k, similarities.shape[1])
+        top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        return [self._build_results(row_top, similarities[row, row_top]) for row, row_top in enumerate(top)]
+    
+    def _build_results(self, indices, scores) -> List[Dict[str, Any]]:
+        """Crear resultados con información de relevancia, ordenados por puntaje"""
+        results = []
+        for idx, score in zip(indices, scores):
+            chunk = self.chunks[idx].copy()
+            chunk["relevance_score"] = float(score)
+            chunk["similarity_percentage"] = round(float(score) * 100, 2)
+            results.append(chunk)
+        results.sort(key=lambda x: x["relevance_score"], reverse=True)
+        return results
+    
+    def search_follow_up(self, query: str, expanded_query: str, chunk_ids: List[str], min_score: float,
+                         top_k: int = 3) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Recuperar chunks para una pregunta de seguimiento
+        
+        Primero se puntúan solo los chunks de los turnos recientes. Se conservan
+        los que la pregunta nueva, por sí sola, alcanza con `min_score` (la
+        consulta expandida contiene la pregunta anterior y siempre se parecería
+        a esos chunks); si la pregunta no nombra un tema propio ("¿y eso?"), se
+        conservan todos. Solo si quedan menos de `top_k` se busca en todo el
+        índice con la consulta expandida para completar, sin duplicados ni los
+        chunks recordados descartados.
+        
+        Args:
+            query: Pregunta del estudiante
+            expanded_query: Pregunta anterior + pregunta actual
+            chunk_ids: IDs de los chunks recordados de la sesión
+            min_score: Similitud mínima de la pregunta con un chunk para considerarlo relevante
+            top_k: Número de chunks a retornar
+            
+        Returns:
+            Tupla (chunks, si hubo que buscar en todo el índice)
+        """
+        if self.vectorizer is None or self.chunk_vectors is None:
+            return [], False
+        
+        rows = [self.chunk_index[chunk_id] for chunk_id in chunk_ids if chunk_id in self.chunk_index]
+        query_vectors = self.vectorizer.transform([query, expanded_query])
+        kept = []
+        if rows:
+            # Solo los candidatos: una matriz de unas pocas filas en vez del índice completo
+            own_scores, expanded_scores = cosine_similarity(query_vectors, self.chunk_vectors[rows])
+            gated = bool(topic_words(query))
+            kept = sorted(
+                ((row, score) for row, own, score in zip(rows, own_scores, expanded_scores)
+                 if not gated or own >= min_score),
+                key=lambda item: item[1], reverse=True
+            )[:top_k]
+        
+        fell_back = len(kept) < top_k
+        if fell_back:
+            # Completar con la búsqueda expandida (pide algunos de más por los duplicados y descartados)
+            scores = cosine_similarity(query_vectors[1], self.chunk_vectors).flatten()
+            excluded = set(rows)
+            top_indices = scores.argsort()[-(top_k + len(rows)):][::-1]
+            kept += [(row, scores[row]) for row in top_indices if row not in excluded][:top_k - len(kept)]
+        
+        results = []
+        for row, score in kept:
+            chunk = self.chunks[row].copy()
+            chunk["relevance_score"] = float(score)
+            chunk["similarity_percentage"] = round(float(score) * 100, 2)
+            results.append(chunk)
+        return results, fell_back
+    
     def search_by_topic(self, topic: str, unidad: int = None) -> List[Dict[str, Any]]:
         """
         Buscar chunks por tema específico
@@ -147,10 +300,11 @@ class SemanticSearch:
         # Ordenar por relevancia
         relevant_chunks.sort(key=lambda x: x["relevance_score"], reverse=True)
         
-        print(f"🔍 Búsqueda por tema: '{topic}'")
-        print(f"   - Chunks encontrados: {len(relevant_chunks)}")
-        if unidad:
-            print(f"   - Filtrado por Unidad {unidad}")
+        logger.debug("Búsqueda por tema completada", extra={
+            'topic': topic,
+            'unidad': unidad,
+            'chunks_found': len(relevant_chunks)
+        })
         
         return relevant_chunks
     
@@ -84,6 +84,52 @@ def test_chat_message():
         print_test_result("Chat Message", False, error=str(e))
         return False
 
+def test_chat_job():
+    """Probar modo asíncrono del chat (encolar y consultar estado)"""
+    try:
+        data = {
+            "message": "¿Qué es el PAC?",
+            "user_id": TEST_USER_ID,
+            "course_id": TEST_COURSE_ID
+        }
+        response = requests.post(f"{API_BASE_URL}/chat/jobs", json=data)
+        if response.status_code != 202:
+            print_test_result("Chat Job", False, response)
+            return False
+        
+        job_id = response.json()['job_id']
+        for _ in range(60):
+            response = requests.get(f"{API_BASE_URL}/chat/jobs/{job_id}")
+            if response.json().get('status') in ('completed', 'failed'):
+                break
+            time.sleep(0.5)
+        success = response.status_code == 200 and response.json().get('status') == 'completed'
+        print_test_result("Chat Job", success, response)
+        return success
+    except Exception as e:
+        print_test_result("Chat Job", False, error=str(e))
+        return False
+
+def test_chat_batch():
+    """Probar chat por lotes (resultados en orden, errores por pregunta)"""
+    try:
+        data = {
+            "items": [
+                {"message": "¿Qué es el PAC?", "session_id": TEST_SESSION_ID},
+                {"message": "¿Qué es una no conformidad?"}
+            ],
+            "user_id": TEST_USER_ID,
+            "course_id": TEST_COURSE_ID
+        }
+        response = requests.post(f"{API_BASE_URL}/chat/batch", json=data)
+        results = response.json().get('results', []) if response.status_code == 200 else []
+        success = len(results) == 2 and [r['index'] for r in results] == [0, 1]
+        print_test_result("Chat Batch", success, response)
+        return success
+    except Exception as e:
+        print_test_result("Chat Batch", False, error=str(e))
+        return False
+
 def test_session_history():
     """Probar endpoint de historial de sesión"""
     try:
@@ -167,6 +213,8 @@ def run_all_tests():
         ("System Status", test_system_status),
         ("Course Info", test_course_info),
         ("Chat Message", test_chat_message),
+        ("Chat Job", test_chat_job),
+        ("Chat Batch", test_chat_batch),
         ("Session History", test_session_history),
         ("Course Search", test_course_search),
         ("Session Analytics", test_session_analytics),
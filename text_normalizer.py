@@ -0,0 +1,192 @@
+"""
+Normalización del texto extraído de los PDFs del curso PAC
+PyPDF2 deja artefactos que empeoran la búsqueda y gastan tokens:
+- palabras partidas por el espaciado del PDF ("conte nidos", "CONCE PTOS")
+- saltos de línea del diseño de página en medio de las oraciones
+- palabras cortadas con guion al final de la línea
+- glifos de comillas y viñetas de las fuentes del PDF (―‖, viñetas de Wingdings)
+
+TextNormalizer corrige todo esto página a página con expresiones compiladas
+una sola vez. Las palabras partidas se unen solo si la palabra completa
+aparece en el vocabulario del propio documento.
+"""
+
+import re
+from collections import Counter
+from typing import Callable, Iterable, Iterator, List, Optional
+
+# Glifos de las fuentes del PDF -> caracteres normales
+GLYPHS = {
+    '\u2015': '"', '\u2016': '"',  # ― ‖ (comillas de las fuentes del curso)
+    '\u201c': '"', '\u201d': '"', '\u00ab': '"', '\u00bb': '"',
+    '\u2018': "'", '\u2019': "'",
+    # Viñetas de Wingdings/Symbol (área de uso privado) y otras viñetas
+    '\uf0fc': '•', '\uf0a7': '•', '\uf0b7': '•', '\uf0d8': '•', '\u25aa': '•', '\u25cf': '•',
+    '\ufb01': 'fi', '\ufb02': 'fl', '\ufb00': 'ff',
+    '\u00a0': ' ', '\u2002': ' ', '\u2003': ' ', '\u2009': ' ', '\t': ' ',
+    '\u00ad': '', '\u200b': '', '\ufeff': '',
+}
+_GLYPH_TABLE = str.maketrans(GLYPHS)
+_GLYPH_CHARS = re.compile('[' + re.escape(''.join(GLYPHS)) + ']')
+
+_SPACES = re.compile(r' {2,}')
+_SPACE_BEFORE_PUNCT = re.compile(r' +([,;:.)](?!\.))')
+# Líneas que empiezan un elemento nuevo (viñeta, numeración "1.1.", "a)") y no se unen a la anterior
+_LIST_ITEM = re.compile(r'(?:[•*-]|\d+(?:\.\d+)*[.)]|[a-zA-Z]\))\s*')
+# Títulos numerados ("1.1. -Definiciones fundamentales")
+_HEADING = re.compile(r'\d+(?:\.\d+)*\.?\s')
+# Fin de línea tras el cual el salto se conserva
+_LINE_END = re.compile(r'[.:;!?…"]$')
+_HYPHENATED = re.compile(r'[^\W\d_]-$')
+# Palabras (solo letras); re.split con grupo deja separadores en las posiciones pares
+_WORD = re.compile(r'([^\W\d_]+)')
+
+
+class TextNormalizer:
+    def __init__(self, sample_pages: int = 8, min_word_length: int = 4,
+                 count_tokens: Optional[Callable[[str], int]] = None):
+        """
+        Inicializar normalizador de texto
+
+        Args:
+            sample_pages: Páginas iniciales que se leen para armar el vocabulario
+                antes de unir palabras partidas
+            min_word_length: Largo mínimo de la palabra que resulta al unir dos fragmentos
+            count_tokens: Función para contar tokens antes y después (opcional)
+        """
+        self.sample_pages = sample_pages
+        self.min_word_length = min_word_length
+        self.count_tokens = count_tokens
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {'pages': 0, 'chars_before': 0, 'chars_after': 0, 'tokens_before': 0,
+                      'tokens_after': 0, 'vocab_before': 0, 'vocab_after': 0, 'glyphs_mapped': 0,
+                      'hyphens_repaired': 0, 'lines_joined': 0, 'words_joined': 0}
+        self._vocab_before = set()
+        self._vocab_after = set()
+
+    def merge_stats(self, stats: dict, vocab_before: set, vocab_after: set):
+        """Sumar las estadísticas de otro normalizador (p. ej. de un proceso del pool)"""
+        for key, value in stats.items():
+            if not key.startswith('vocab_'):
+                self.stats[key] += value
+        self._vocab_before |= vocab_before
+        self._vocab_after |= vocab_after
+        self.stats['vocab_before'] = len(self._vocab_before)
+        self.stats['vocab_after'] = len(self._vocab_after)
+
+    def clean_layout(self, page: str) -> str:
+        """
+        Mapear glifos y rehacer los párrafos de una página
+
+        Los saltos de línea dentro de una oración se cambian por un espacio, las
+        palabras cortadas con guion se unen y las líneas en blanco quedan como
+        un único salto de párrafo. Se conservan los saltos antes de viñetas y
+        numeraciones y después de un fin de oración.
+        """
+        self.stats['glyphs_mapped'] += len(_GLYPH_CHARS.findall(page))
+        page = page.translate(_GLYPH_TABLE)
+
+        paragraphs: List[str] = []
+        current = ""
+        heading = False
+        for line in page.split('\n'):
+            line = _SPACES.sub(' ', line).strip()
+            if not line:
+                if current:
+                    paragraphs.append(current)
+                    current = ""
+                continue
+            if not current:
+                current = line
+            elif _HYPHENATED.search(current) and line[0].islower():
+                current = current[:-1] + line
+                self.stats['hyphens_repaired'] += 1
+                continue
+            elif _LINE_END.search(current) or _LIST_ITEM.match(line) or (heading and line[0].isupper()):
+                current += '\n' + line
+            else:
+                current += ' ' + line
+                self.stats['lines_joined'] += 1
+                continue
+            # Un título numerado no se une con la línea siguiente si esta empieza en mayúscula
+            heading = bool(_HEADING.match(line))
+        if current:
+            paragraphs.append(current)
+        return _SPACE_BEFORE_PUNCT.sub(r'\1', '\n\n'.join(paragraphs))
+
+    def _joinable(self, left: str, right: str, vocab: Counter) -> bool:
+        if len(left) + len(right) < self.min_word_length:
+            return False
+        # "conte nidos", "Ge stión" y "CONCE PTOS" sí; "Calidad Total" no
+        if not (right.islower() or (left.isupper() and right.isupper())):
+            return False
+        joined = (left + right).lower()
+        # Se acepta también el plural de una palabra del vocabulario ("CONCE PTOS" si aparece "concepto")
+        joined = vocab.get(joined, 0) or (joined.endswith('s') and vocab.get(joined[:-1], 0))
+        # La palabra completa debe ser al menos tan frecuente como el fragmento más raro,
+        # así "el la" no se convierte en "ella"
+        return joined > 0 and joined >= min(vocab.get(left.lower(), 0), vocab.get(right.lower(), 0))
+
+    def join_split_words(self, text: str, vocab: Counter) -> str:
+        """Unir fragmentos separados por un espacio cuando la palabra completa está en el vocabulario"""
+        parts = _WORD.split(text)
+        out = [parts[0]]
+        word = None
+        for i in range(1, len(parts), 2):
+            separator = parts[i - 1]
+            if word is not None and separator == ' ' and self._joinable(word, parts[i], vocab):
+                word += parts[i]
+                self.stats['words_joined'] += 1
+                continue
+            if word is not None:
+                out.append(word)
+                out.append(separator)
+            word = parts[i]
+        if word is not None:
+            out.append(word)
+            out.append(parts[-1])
+        return ''.join(out)
+
+    def _normalize(self, page: str, cleaned: str, vocab: Counter) -> str:
+        text = self.join_split_words(cleaned, vocab)
+        self.stats['pages'] += 1
+        self.stats['chars_before'] += len(page)
+        self.stats['chars_after'] += len(text)
+        if self.count_tokens:
+            self.stats['tokens_before'] += self.count_tokens(page)
+            self.stats['tokens_after'] += self.count_tokens(text)
+        self._vocab_before.update(word.lower() for word in _WORD.findall(page))
+        self._vocab_after.update(word.lower() for word in _WORD.findall(text))
+        self.stats['vocab_before'] = len(self._vocab_before)
+        self.stats['vocab_after'] = len(self._vocab_after)
+        return text
+
+    def normalize_pages(self, pages: Iterable[str]) -> Iterator[str]:
+        """
+        Normalizar las páginas de un documento, en streaming
+
+        El vocabulario es el del documento: se arma con las primeras
+        `sample_pages` páginas y se sigue ampliando con cada página nueva, de
+        modo que el resultado de un PDF no depende de los demás.
+        """
+        vocab = Counter()
+        pages = iter(pages)
+        sample = []
+        for page in pages:
+            cleaned = self.clean_layout(page)
+            vocab.update(word.lower() for word in _WORD.findall(cleaned))
+            sample.append((page, cleaned))
+            if len(sample) >= self.sample_pages:
+                break
+        for page, cleaned in sample:
+            yield self._normalize(page, cleaned, vocab)
+        for page in pages:
+            cleaned = self.clean_layout(page)
+            vocab.update(word.lower() for word in _WORD.findall(cleaned))
+            yield self._normalize(page, cleaned, vocab)
+
+    def normalize(self, text: str) -> str:
+        """Normalizar un texto suelto usando solo su propio vocabulario"""
+        return next(self.normalize_pages([text]))
@@ -0,0 +1,295 @@
+"""
+Tokenizador compartido del Chatbot PAC (preprocesamiento y API)
+Carga la codificación de tiktoken sin depender de la red y cuenta tokens con
+memoización, para que los textos que se repiten (prompt, chunks, historial)
+no se vuelvan a codificar.
+
+Orden de carga de la codificación:
+    1. Archivo vendorizado: $TOKENIZER_DIR/<nombre>.tiktoken (tokenizer_data/ por defecto)
+    2. Caché de tiktoken ($TIKTOKEN_CACHE_DIR)
+    3. Descarga con tiktoken, solo si TOKENIZER_ALLOW_DOWNLOAD=true
+    4. Tokenizador aproximado (trozos de hasta 4 caracteres), solo si
+       TOKENIZER_ALLOW_APPROXIMATE=true; si no, TokenizerUnavailable
+
+La codificación se vendoriza en el build (render.yaml, Dockerfile):
+    python tokenizer.py vendor && python tokenizer.py check
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ENCODING = "cl100k_base"  # Para GPT-3.5/4
+DEFAULT_TOKENIZER_DIR = "tokenizer_data"
+
+# Datos de las codificaciones vendorizables (los mismos que usa tiktoken_ext.openai_public)
+ENCODINGS = {
+    "cl100k_base": {
+        "url": "https://openaipublic.blob.core.windows.net/encodings/cl100k_base.tiktoken",
+        "sha256": "223921b76ee99bde995b7ff738513eef100fb51d18c93597a113bcffe865b2a7",
+        "pat_str": r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}++|\p{N}{1,3}+| ?[^\s\p{L}\p{N}]++[\r\n]*+|\s++$|\s*[\r\n]|\s+(?!\S)|\s""",
+        "special_tokens": {"<|endoftext|>": 100257, "<|fim_prefix|>": 100258, "<|fim_middle|>": 100259,
+                           "<|fim_suffix|>": 100260, "<|endofprompt|>": 100276},
+    },
+}
+
+# Textos más cortos que esto se codifican uno a uno (el batch de tiktoken crea un pool de hilos)
+BATCH_MIN_TEXTS = 8
+
+
+class TokenizerUnavailable(RuntimeError):
+    """La codificación no está disponible sin red y el conteo aproximado no está permitido"""
+
+
+class ApproximateEncoding:
+    """Tokenizador de respaldo sin archivos: cada token es un trozo de hasta 4 caracteres"""
+    name = "approx-4chars"
+    _PIECE = re.compile(r'\s*\S{1,4}|\s+')
+
+    def __init__(self):
+        self._ids = {}
+        self._pieces: List[str] = []
+        self._lock = threading.Lock()
+
+    def encode_ordinary(self, text: str) -> List[int]:
+        tokens = []
+        for piece in self._PIECE.findall(text):
+            token = self._ids.get(piece)
+            if token is None:
+                with self._lock:
+                    token = self._ids.setdefault(piece, len(self._pieces))
+                    if token == len(self._pieces):
+                        self._pieces.append(piece)
+            tokens.append(token)
+        return tokens
+
+    def encode(self, text: str, **kwargs) -> List[int]:
+        return self.encode_ordinary(text)
+
+    def encode_ordinary_batch(self, texts: Sequence[str], **kwargs) -> List[List[int]]:
+        return [self.encode_ordinary(text) for text in texts]
+
+    def decode(self, tokens: Sequence[int]) -> str:
+        return ''.join(self._pieces[token] for token in tokens)
+
+    def decode_with_offsets(self, tokens: Sequence[int]) -> Tuple[str, List[int]]:
+        offsets = []
+        position = 0
+        for token in tokens:
+            offsets.append(position)
+            position += len(self._pieces[token])
+        return self.decode(tokens), offsets
+
+
+def _env_flag(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    return default if value is None else value.lower() not in ("0", "false", "no")
+
+
+def _tiktoken_cached(url: str) -> bool:
+    """Indicar si tiktoken ya tiene la codificación en su caché (y no necesita la red)"""
+    cache_dir = os.getenv("TIKTOKEN_CACHE_DIR") or os.getenv("DATA_GYM_CACHE_DIR") \
+        or os.path.join(tempfile.gettempdir(), "data-gym-cache")
+    return os.path.exists(os.path.join(cache_dir, hashlib.sha1(url.encode()).hexdigest()))
+
+
+def load_encoding(name: str = DEFAULT_ENCODING, tokenizer_dir: Optional[str] = None,
+                  allow_download: Optional[bool] = None, allow_approximate: Optional[bool] = None):
+    """
+    Cargar una codificación de tiktoken sin depender de la red
+
+    Args:
+        name: Nombre de la codificación
+        tokenizer_dir: Directorio con los archivos vendorizados (por defecto $TOKENIZER_DIR)
+        allow_download: Permitir que tiktoken descargue la codificación (por defecto
+            $TOKENIZER_ALLOW_DOWNLOAD, falso si no está definido)
+        allow_approximate: Usar el conteo aproximado si no hay codificación (por defecto
+            $TOKENIZER_ALLOW_APPROXIMATE, falso si no está definido)
+
+    Returns:
+        Codificación de tiktoken, o ApproximateEncoding si se permite y no hay forma de cargarla
+
+    Raises:
+        TokenizerUnavailable: Si no hay codificación y el conteo aproximado no está permitido
+    """
+    tokenizer_dir = tokenizer_dir or os.getenv("TOKENIZER_DIR", DEFAULT_TOKENIZER_DIR)
+    if allow_download is None:
+        allow_download = _env_flag("TOKENIZER_ALLOW_DOWNLOAD", False)
+    if allow_approximate is None:
+        allow_approximate = _env_flag("TOKENIZER_ALLOW_APPROXIMATE", False)
+    spec = ENCODINGS.get(name)
+    vendored = os.path.join(tokenizer_dir, f"{name}.tiktoken")
+    try:
+        import tiktoken
+        from tiktoken.load import load_tiktoken_bpe
+
+        if spec and os.path.exists(vendored):
+            return tiktoken.Encoding(name=name, pat_str=spec["pat_str"],
+                                     mergeable_ranks=load_tiktoken_bpe(vendored, spec["sha256"]),
+                                     special_tokens=spec["special_tokens"])
+        if allow_download or (spec and _tiktoken_cached(spec["url"])):
+            return tiktoken.get_encoding(name)
+        reason = f"no existe {vendored} (ejecutar: python tokenizer.py vendor)"
+    except Exception as e:
+        reason = str(e)
+    if not allow_approximate:
+        raise TokenizerUnavailable(f"Codificación {name} no disponible: {reason}. "
+                                   "TOKENIZER_ALLOW_APPROXIMATE=true permite un conteo aproximado")
+    logger.warning("Codificación %s no disponible (%s); se usará un conteo de tokens aproximado", name, reason)
+    return ApproximateEncoding()
+
+
+class TokenCounter:
+    def __init__(self, encoding_name: str = DEFAULT_ENCODING, max_entries: int = 4096,
+                 max_chars: int = 4_000_000):
+        """
+        Contador de tokens con memoización LRU
+
+        Args:
+            encoding_name: Codificación de tiktoken
+            max_entries: Máximo de textos memorizados
+            max_chars: Máximo de caracteres memorizados en total (los textos más
+                largos que esto no se guardan)
+        """
+        self.encoding_name = encoding_name
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self._encoding = None
+        self._cache: "OrderedDict[str, int]" = OrderedDict()
+        self._chars = 0
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    @property
+    def encoding(self):
+        """Codificación (se carga la primera vez que se usa)"""
+        if self._encoding is None:
+            with self._lock:
+                if self._encoding is None:
+                    self._encoding = load_encoding(self.encoding_name)
+        return self._encoding
+
+    def count_tokens_many(self, texts: Sequence[str]) -> List[int]:
+        """
+        Contar los tokens de varios textos
+
+        Los textos ya contados salen de la caché; el resto se codifica de una
+        vez con el batch de tiktoken.
+
+        Args:
+            texts: Textos a contar (pueden repetirse)
+
+        Returns:
+            Número de tokens de cada texto, en el mismo orden
+        """
+        counts: List[int] = [0] * len(texts)
+        missing = {}
+        with self._lock:
+            for i, text in enumerate(texts):
+                count = self._cache.get(text)
+                if count is None:
+                    missing.setdefault(text, []).append(i)
+                else:
+                    self._cache.move_to_end(text)
+                    counts[i] = count
+            self.stats['hits'] += len(texts) - sum(len(positions) for positions in missing.values())
+            self.stats['misses'] += len(missing)
+        if not missing:
+            return counts
+
+        pending = list(missing)
+        encoding = self.encoding
+        if len(pending) >= BATCH_MIN_TEXTS:
+            encoded = encoding.encode_ordinary_batch(pending)
+        else:
+            encoded = [encoding.encode_ordinary(text) for text in pending]
+
+        with self._lock:
+            for text, tokens in zip(pending, encoded):
+                for i in missing[text]:
+                    counts[i] = len(tokens)
+                self._remember(text, len(tokens))
+        return counts
+
+    def count_tokens(self, text: str) -> int:
+        """Contar los tokens de un texto"""
+        return self.count_tokens_many([text])[0]
+
+    def _remember(self, text: str, count: int):
+        if len(text) > self.max_chars or text in self._cache:
+            return
+        self._cache[text] = count
+        self._chars += len(text)
+        while len(self._cache) > self.max_entries or self._chars > self.max_chars:
+            evicted, _ = self._cache.popitem(last=False)
+            self._chars -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._chars = 0
+
+
+counter = TokenCounter()
+
+
+def get_encoding():
+    """Codificación compartida (cl100k_base, o la aproximada si no se pudo cargar)"""
+    return counter.encoding
+
+
+def count_tokens(text: str) -> int:
+    """Contar tokens de un texto con la codificación compartida (memoizado)"""
+    return counter.count_tokens(text)
+
+
+def count_tokens_many(texts: Sequence[str]) -> List[int]:
+    """Contar tokens de varios textos con la codificación compartida (memoizado, en batch)"""
+    return counter.count_tokens_many(texts)
+
+
+def vendor(name: str = DEFAULT_ENCODING, tokenizer_dir: str = DEFAULT_TOKENIZER_DIR) -> str:
+    """Descargar la codificación al directorio vendorizado (requiere red)"""
+    from tiktoken.load import read_file
+
+    spec = ENCODINGS[name]
+    data = read_file(spec["url"])
+    if hashlib.sha256(data).hexdigest() != spec["sha256"]:
+        raise ValueError(f"El hash de {spec['url']} no coincide")
+    os.makedirs(tokenizer_dir, exist_ok=True)
+    path = os.path.join(tokenizer_dir, f"{name}.tiktoken")
+    with open(path + ".tmp", 'wb') as f:
+        f.write(data)
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(description="Codificaciones de tiktoken para uso sin red")
+    parser.add_argument("command", choices=["vendor", "check"])
+    parser.add_argument("--encoding", default=DEFAULT_ENCODING, choices=sorted(ENCODINGS))
+    parser.add_argument("--dir", default=os.getenv("TOKENIZER_DIR", DEFAULT_TOKENIZER_DIR))
+    args = parser.parse_args()
+
+    if args.command == "vendor":
+        print(f"✅ Codificación guardada en: {vendor(args.encoding, args.dir)}")
+    else:
+        try:
+            encoding = load_encoding(args.encoding, args.dir, allow_download=False, allow_approximate=False)
+        except TokenizerUnavailable as e:
+            logger.error("%s", e)
+            raise SystemExit(1)
+        print(f"✅ Codificación disponible sin red: {encoding.name}")
+
+
+if __name__ == "__main__":
+    main()